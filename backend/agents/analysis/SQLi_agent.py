@@ -1,13 +1,23 @@
+from functools import cache
+from typing import List
 from utils.models import ParallelState
+from utils.metrics import record_failure
 from langchain.prompts import ChatPromptTemplate
 from langchain.output_parsers import ResponseSchema, StructuredOutputParser
-from agents.base import llm
+from agents.base import get_llm
+from utils.packet_prompt import render_packet
+from utils.scheduler import parse_confidence, parse_detected, report_agent_verdict
 
 output_schema = [
     ResponseSchema(
         name="sql_detected", 
         description="Either 'YES' if SQLi is detected or 'NO' if not"
     ),
+    ResponseSchema(
+        name="confidence",
+        description="How certain you are of the verdict, from 0 (guessing) to 1 (certain)",
+        type="number"
+    ),
     ResponseSchema(
         name="details",
         description="Detailed analysis of the packet's potential SQLi vulnerabilities"
@@ -46,6 +56,7 @@ Response Format:
 If SQL injection detected:
 {{
     "sql_detected": "YES",
+    "confidence": 0.95,
     "details": "Detailed explanation of the SQL injection attempt found, including:
                - The specific SQL pattern identified
                - The type of injection attempt
@@ -56,18 +67,21 @@ If SQL injection detected:
 If no SQL injection detected:
 {{
     "sql_detected": "NO",
+    "confidence": 0.9,
     "details": "Confirmation that no SQL injection patterns were found in the packet payload"
 }}
 
 Example 1 (Attack Detected):
 {{
     "sql_detected": "YES",
+    "confidence": 0.95,
     "details": "Detected SQL injection attempt in login request. Found pattern: 'admin' OR 1=1;--'. This is a authentication bypass attempt using OR operator and comment sequences to manipulate the WHERE clause of a login query. This could allow unauthorized access by making the WHERE clause always evaluate to true."
 }}
 
 Example 2 (Clean Packet):
 {{
     "sql_detected": "NO",
+    "confidence": 0.9,
     "details": "No SQL injection patterns detected in packet payload. Examined for common SQL injection techniques including UNION attacks, boolean-based injection, and comment operator abuse - none were found."
 }}
 
@@ -81,22 +95,53 @@ Remember:
 
 {format_instructions}"""
 
-prompt = ChatPromptTemplate.from_template(template=TEMPLATE)
 SQLi_parser = StructuredOutputParser.from_response_schemas(output_schema)
+# the format instructions never change, so they are baked into the prompt once
+prompt = ChatPromptTemplate.from_template(template=TEMPLATE).partial(format_instructions=SQLi_parser.get_format_instructions())
+
+SQLI_ERROR_MSG = "Error invoking the chain. Ignore the output of the SQLi Agent feedback for the final evaluation."
 
-def SQLi_agent(state: ParallelState):
-  packet = state.packet
+@cache
+def _chain():
+  # built on first use rather than at import since the LLM client is created lazily
+  return prompt | get_llm() | SQLi_parser
 
-  chain = prompt | llm | SQLi_parser
+def _SQLi_inputs(state: ParallelState):
+  packet, _, _ = render_packet(state.packet, "sqli")
+  return {"packet": packet}
+
+def _SQLi_update(res):
+  print("SQLi agent response: ", res)
+  print("sql_detected??: ", res["sql_detected"])
+  detected = parse_detected(res["sql_detected"])
+  confidence = parse_confidence(res.get("confidence"))
+  report_agent_verdict("SQLi_agent", detected, confidence, str(res["details"]))
+  return {"SQLi_agent_msg": str(res["details"]), "SQLi_detected": detected, "SQLi_confidence": confidence}
+
+async def SQLi_agent(state: ParallelState):
+  chain = _chain()
   try:
-    res = chain.invoke({
-      "packet": packet,
-      "format_instructions": SQLi_parser.get_format_instructions()
-    })
-    print("SQLi agent response: ", res)
-    print("sql_detected??: ", res["sql_detected"])
-    return {"SQLi_agent_msg": str(res["details"])}
+    res = await chain.ainvoke(_SQLi_inputs(state))
+    return _SQLi_update(res)
 
   except Exception as e:
     print("ERROR invoking the chain in SQLi_agent:", e)
-    return {"SQLi_agent_msg": "Error invoking the chain. Ignore the output of the SQLi Agent feedback for the final evaluation."}
\ No newline at end of file
+    record_failure("SQLi_agent", e)
+    return {"SQLi_agent_msg": SQLI_ERROR_MSG}
+
+async def SQLi_agent_batch(states: List[ParallelState], max_concurrency: int = None):
+  chain = _chain()
+  results = await chain.abatch(
+    [_SQLi_inputs(state) for state in states],
+    config={"max_concurrency": max_concurrency},
+    return_exceptions=True,
+  )
+  updates = []
+  for res in results:
+    if isinstance(res, Exception):
+      print("ERROR invoking the chain in SQLi_agent_batch:", res)
+      record_failure("SQLi_agent", res)
+      updates.append({"SQLi_agent_msg": SQLI_ERROR_MSG})
+    else:
+      updates.append(_SQLi_update(res))
+  return updates
@@ -1,7 +1,10 @@
+from functools import cache
+from typing import List
 from utils.models import ParallelState
+from utils.metrics import record_failure
 from langchain.prompts import ChatPromptTemplate
 from langchain.output_parsers import ResponseSchema, StructuredOutputParser
-from agents.base import reasoning_llm
+from agents.base import get_reasoning_llm
 
 output_schema = [
     ResponseSchema(
@@ -21,6 +24,8 @@ XSS AGENT ANALYSIS FINDINGS:
 {xss_agent_msg}
 SQL INJECTION AGENT ANALYSIS FINDINGS:
 {SQLi_agent_msg}
+PAYLOAD CLASSIFIER FINDINGS:
+{payload_agent_msg}
 
 Your task is to analyze these findings and provide a structured response following the exact format below:
 
@@ -47,10 +52,10 @@ Remember:
 - Include specific evidence from agent findings when explaining threats
 - Make clear, decisive determinations based on the available information"""
 
-prompt = ChatPromptTemplate.from_template(template=TEMPLATE)
 parser = StructuredOutputParser.from_response_schemas(output_schema)
+prompt = ChatPromptTemplate.from_template(template=TEMPLATE).partial(format_instructions=parser.get_format_instructions())
 
-def decision_node(state: ParallelState):
+def _check_feedback(state: ParallelState):
   if not all([state.xss_agent_msg, state.SQLi_agent_msg, state.payload_agent_msg]):
     print("WARNING: not all agents provided feedback!")
     
@@ -60,25 +65,55 @@ def decision_node(state: ParallelState):
     if not state.xss_agent_msg or not state.SQLi_agent_msg:
       print("wait actualy umm ....")
     # raise ValueError("All agents must provide feedback")
+
+@cache
+def _chain():
+  return prompt | get_reasoning_llm() | parser
+
+def _decision_inputs(state: ParallelState):
+  return {
+    "xss_agent_msg": state.xss_agent_msg,
+    "SQLi_agent_msg": state.SQLi_agent_msg,
+    "payload_agent_msg": state.payload_agent_msg,
+  }
+
+def _decision_update(res):
+  print("decision node response: ", res)
+  return {
+    "threat_detected": res["threat_detected"],
+    "feedback": res["details"]
+  }
+
+async def decision_node(state: ParallelState):
+  _check_feedback(state)
   
-  chain = prompt | reasoning_llm | parser
+  chain = _chain()
   try:
-    res = chain.invoke({
-      "xss_agent_msg": state.xss_agent_msg,
-      "SQLi_agent_msg": state.SQLi_agent_msg,
-      # "payload_agent_msg": state.payload_agent_msg,
-      "format_instructions": parser.get_format_instructions()
-    })
-    print("decision node response: ", res)
-    state.feedback = res["details"]
-    state.threat_detected = res["threat_detected"]
-
-    return {
-      "threat_detected": state.threat_detected,
-      "feedback": state.feedback
-    }
+    res = await chain.ainvoke(_decision_inputs(state))
+    return _decision_update(res)
 
   except Exception as e:
     print("ERROR invoking the chain in decision_node:", e)
+    record_failure("decision_node", e)
   
-  return {"next": "END"}
\ No newline at end of file
+  return {"next": "END"}
+
+async def decision_node_batch(states: List[ParallelState], max_concurrency: int = None):
+  for state in states:
+    _check_feedback(state)
+
+  chain = _chain()
+  results = await chain.abatch(
+    [_decision_inputs(state) for state in states],
+    config={"max_concurrency": max_concurrency},
+    return_exceptions=True,
+  )
+  updates = []
+  for res in results:
+    if isinstance(res, Exception):
+      print("ERROR invoking the chain in decision_node_batch:", res)
+      record_failure("decision_node", res)
+      updates.append({})
+    else:
+      updates.append(_decision_update(res))
+  return updates
@@ -0,0 +1,17 @@
+from langgraph.graph import END
+from utils.models import ParallelState
+from utils.scheduler import confident_negative, early_exit_enabled, early_exits
+
+def early_exit_node(state: ParallelState):
+  # joins the agents; in early_exit mode a confident NO from every agent that ran is the verdict
+  if not early_exit_enabled() or not confident_negative(state):
+    return {}
+  early_exits.inc(reason="confident_negative")
+  return {
+    "early_exit": True,
+    "threat_detected": False,
+    "feedback": "Every agent that analyzed the packet confidently found no attack; the reasoning model was skipped.",
+  }
+
+def route_early_exit(state: ParallelState):
+  return END if state.early_exit else "decision_node"
@@ -0,0 +1,36 @@
+from typing import List
+from utils.models import ParallelState
+from utils.packets import extract_payload
+from utils.payload_model import get_payload_classifier
+from utils.scheduler import report_agent_verdict
+
+PAYLOAD_DISABLED_MSG = "Payload classifier not trained, no payload analysis available."
+
+def _payload_update(classifier, payload: bytes, score: float):
+  detected = score >= classifier.threshold
+  # distance from the threshold, scaled so the threshold itself is 0 and 0 or 1 is certain
+  span = (1 - classifier.threshold) if detected else classifier.threshold
+  confidence = min(1.0, abs(score - classifier.threshold) / span) if span else 1.0
+  if detected:
+    signals = ", ".join(classifier.explain(payload)) or "n-gram profile"
+    details = f"Payload classifier flags the payload as malicious (score {score:.2f}, threshold {classifier.threshold:.2f}); strongest signals: {signals}."
+  else:
+    details = f"Payload classifier finds the payload benign (score {score:.2f}, threshold {classifier.threshold:.2f})."
+  report_agent_verdict("payload_agent", detected, confidence, details)
+  return {"payload_agent_msg": details, "payload_detected": detected, "payload_confidence": confidence}
+
+def payload_agent(state: ParallelState):
+  return payload_agent_batch([state])[0]
+
+def payload_agent_batch(states: List[ParallelState], max_concurrency: int = None):
+  # local and vectorized: one featurize + matrix product for the whole batch
+  classifier = get_payload_classifier()
+  if classifier is None:
+    return [{"payload_agent_msg": PAYLOAD_DISABLED_MSG} for _ in states]
+  payloads = [extract_payload(state.packet) for state in states]
+  updates = [{"payload_agent_msg": "Empty payload, nothing for the payload classifier to score."} for _ in states]
+  scored = [i for i, payload in enumerate(payloads) if payload]
+  scores = classifier.predict_proba([payloads[i] for i in scored])
+  for i, score in zip(scored, scores):
+    updates[i] = _payload_update(classifier, payloads[i], float(score))
+  return updates
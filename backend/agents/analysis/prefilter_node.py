@@ -0,0 +1,37 @@
+from langgraph.graph import END
+from utils.models import ParallelState
+from utils.prefilter import screen_packet, tier_stats
+from utils.scheduler import payload_escalates
+
+AGENT_FOR_CATEGORY = {
+  "xss": "xss_agent",
+  "sqli": "SQLi_agent",
+}
+
+def prefilter_node(state: ParallelState):
+  hits = screen_packet(state.packet)
+  update = {"prefilter_hits": hits}
+
+  # agents without a matching signature are skipped, so fill in their findings here
+  if not hits["xss"]:
+    update["xss_agent_msg"] = "Pre-filter: no XSS signatures matched in the decoded packet payload."
+  if not hits["sqli"]:
+    update["SQLi_agent_msg"] = "Pre-filter: no SQL injection signatures matched in the decoded packet payload."
+
+  if any(hits.values()) or payload_escalates(state):
+    print("pre-filter escalating packet to the LLM agents: ", hits, "payload classifier:", state.payload_confidence if state.payload_detected else None)
+    tier_stats.record("llm")
+    update["tier"] = "llm"
+  else:
+    tier_stats.record("prefilter")
+    update["tier"] = "prefilter"
+    update["threat_detected"] = False
+    update["feedback"] = "Packet cleared by the rule-based pre-filter: no XSS or SQL injection signatures matched."
+  return update
+
+def route_prefilter(state: ParallelState):
+  if state.tier == "prefilter":
+    return END
+  agents = [AGENT_FOR_CATEGORY[category] for category, names in state.prefilter_hits.items() if names]
+  # only the payload classifier saw something: straight to the reasoning model
+  return agents or ["decision_node"]
@@ -7,6 +7,6 @@ def root_node(state: ParallelState):
         "next": [
             "xss_agent",
             "SQLi_agent",
-            # "payload_agent",
+            "payload_agent",
         ]
     }
\ No newline at end of file
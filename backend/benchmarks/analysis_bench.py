@@ -0,0 +1,257 @@
+"""Offline throughput/latency benchmark for the packet analysis pipeline.
+
+Replays a pcap (needs scapy) or a seeded synthetic packet mix through
+ingest (JSON decode) -> verdict cache -> pre-filter -> agents -> decision,
+with the Groq models replaced by the local stub LLM unless --real-llm is given.
+
+Run from the backend directory:
+
+    python -m benchmarks.analysis_bench --packets 2000 --llm-latency-ms 150 --concurrency 64
+    python -m benchmarks.analysis_bench --pcap capture.pcap --output run.json --baseline last.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pcap", help="replay packets from this pcap instead of generating them")
+    parser.add_argument("--packets", type=int, default=1000, help="number of synthetic packets")
+    parser.add_argument("--malicious-rate", type=float, default=0.05, help="share of synthetic packets carrying XSS/SQLi payloads")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--llm-latency-ms", type=float, default=100.0, help="simulated latency of every stub LLM call")
+    parser.add_argument("--llm-positive-rate", type=float, default=0.5, help="share of stub LLM answers that report a detection")
+    parser.add_argument("--real-llm", action="store_true", help="call Groq instead of the stub (costs money, not deterministic)")
+    parser.add_argument("--concurrency", type=int, default=32, help="packets in flight at once")
+    parser.add_argument("--batch-size", type=int, default=0, help="use run_parallel_batch with batches of this size instead of the graph")
+    parser.add_argument("--cache", action="store_true", help="put the verdict cache in front of the workflow")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="compare against a previous --output file and exit 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed relative regression against the baseline")
+    return parser.parse_args()
+
+
+BENIGN_REQUESTS = [
+    b"GET / HTTP/1.1\r\nHost: example.com\r\nAccept: text/html\r\n\r\n",
+    b"GET /static/app.js HTTP/1.1\r\nHost: example.com\r\nAccept: */*\r\n\r\n",
+    b"POST /api/login HTTP/1.1\r\nHost: example.com\r\nContent-Type: application/json\r\n\r\n{\"user\": \"alice\", \"password\": \"hunter2\"}",
+    b"GET /search?q=network+monitoring&page=2 HTTP/1.1\r\nHost: example.com\r\n\r\n",
+]
+MALICIOUS_REQUESTS = [
+    b"GET /search?q=%3Cscript%3Edocument.cookie%3C%2Fscript%3E HTTP/1.1\r\nHost: example.com\r\n\r\n",
+    b"POST /login HTTP/1.1\r\nHost: example.com\r\n\r\nuser=admin' OR '1'='1'--&password=x",
+    b"GET /items?id=1 UNION SELECT username, password FROM users HTTP/1.1\r\nHost: example.com\r\n\r\n",
+    b"GET /profile?name=<img src=x onerror=alert(1)> HTTP/1.1\r\nHost: example.com\r\n\r\n",
+    b"SELECT * FROM users;",
+]
+
+
+def make_record(src: str, dst: str, dport: int, flags: str, payload: bytes, timestamp: float) -> Dict[str, Any]:
+    # same shape as `logger.py --format json`
+    return {
+        "timestamp": timestamp,
+        "source_ip": src,
+        "destination_ip": dst,
+        "ttl": 64,
+        "transport_layer": {
+            "protocol": "TCP",
+            "source_port": 40000 + int(timestamp * 1000) % 20000,
+            "destination_port": dport,
+            "flags": flags,
+            "seq": 1000,
+            "ack": 1,
+        },
+        "payload": {"length": len(payload), "data": payload.decode("latin-1")},
+    }
+
+
+def synthetic_packets(count: int, malicious_rate: float, seed: int) -> Iterable[Dict[str, Any]]:
+    """Mix of handshake segments, binary noise, benign HTTP and injection attempts, like btest.py/stest.py send."""
+    rng = random.Random(seed)
+    for i in range(count):
+        src = f"10.0.{rng.randint(0, 3)}.{rng.randint(1, 254)}"
+        timestamp = 1700000000 + i / 1000
+        roll = rng.random()
+        if roll < malicious_rate:
+            payload, dport, flags = rng.choice(MALICIOUS_REQUESTS), rng.choice([80, 3306, 8080]), "PA"
+        elif roll < 0.4:
+            payload, dport, flags = b"", rng.choice([80, 443, 3306]), rng.choice(["S", "A", "SA", "FA"])
+        elif roll < 0.7:
+            payload, dport, flags = bytes(rng.getrandbits(8) for _ in range(rng.randint(16, 512))), 443, "PA"
+        else:
+            payload, dport, flags = rng.choice(BENIGN_REQUESTS), rng.choice([80, 8080]), "PA"
+        yield make_record(src, "10.0.0.1", dport, flags, payload, timestamp)
+
+
+def pcap_packets(path: str) -> Iterable[Dict[str, Any]]:
+    from scapy.all import PcapReader
+    from scapy.layers.inet import IP, TCP, UDP
+
+    with PcapReader(path) as reader:
+        for packet in reader:
+            if IP not in packet:
+                continue
+            layer = packet[TCP] if TCP in packet else packet[UDP] if UDP in packet else None
+            if layer is None:
+                continue
+            record = make_record(
+                packet[IP].src,
+                packet[IP].dst,
+                layer.dport,
+                str(layer.flags) if TCP in packet else "",
+                bytes(layer.payload),
+                float(packet.time),
+            )
+            record["transport_layer"]["protocol"] = "TCP" if TCP in packet else "UDP"
+            record["transport_layer"]["source_port"] = layer.sport
+            yield record
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    return {
+        "count": len(samples),
+        "p50_ms": percentile(samples, 50) * 1000,
+        "p95_ms": percentile(samples, 95) * 1000,
+        "p99_ms": percentile(samples, 99) * 1000,
+    }
+
+
+def record_spans(trace: List[Dict[str, Any]], node_samples: Dict[str, List[float]]):
+    # node spans are keyed by node name, llm spans by model so per-model latency shows up next to the nodes
+    for span in trace:
+        key = span["name"] if span["kind"] == "node" else f"llm:{span['name']}"
+        node_samples[key].append(span["duration_ms"] / 1000)
+
+
+async def run_graph(wire_packets: List[str], args, node_samples, end_to_end, verdicts):
+    from utils.workflow import create_parallel_workflow, parallel_start_state
+    from utils.prefilter import tier_stats
+    from utils.verdict_cache import VerdictCache, verdict_key, is_cacheable
+    from utils.metrics import start_trace
+
+    graph = create_parallel_workflow()
+    cache = VerdictCache() if args.cache else None
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def analyze(wire: str):
+        async with semaphore:
+            started = time.perf_counter()
+            packet = json.loads(wire)["packet"]
+            key = verdict_key(packet) if cache else None
+            if cache and cache.get(key) is not None:
+                tier_stats.record("cache")
+                verdicts["cache"] += 1
+                end_to_end.append(time.perf_counter() - started)
+                return
+
+            with start_trace() as trace:
+                final = await graph.ainvoke(parallel_start_state(packet))
+            end_to_end.append(time.perf_counter() - started)
+            record_spans(trace, node_samples)
+            verdicts["threat" if final.get("threat_detected") else "clean"] += 1
+            if cache and final.get("tier") == "llm" and is_cacheable(final):
+                cache.put(key, final)
+
+    await asyncio.gather(*(analyze(wire) for wire in wire_packets))
+
+
+async def run_batches(wire_packets: List[str], args, node_samples, end_to_end, verdicts):
+    from utils.workflow import run_parallel_batch, parallel_start_state
+    from utils.metrics import start_trace
+
+    for offset in range(0, len(wire_packets), args.batch_size):
+        chunk = wire_packets[offset:offset + args.batch_size]
+        started = time.perf_counter()
+        states = {str(offset + i): parallel_start_state(json.loads(wire)["packet"]) for i, wire in enumerate(chunk)}
+        with start_trace() as trace:
+            results = await run_parallel_batch(states)
+        elapsed = time.perf_counter() - started
+        record_spans(trace, node_samples)
+        # every packet in a batch waits for the whole batch
+        end_to_end.extend([elapsed] * len(chunk))
+        for verdict in results.values():
+            verdicts["threat" if verdict.get("threat_detected") else "clean"] += 1
+
+
+def compare(result: Dict[str, Any], baseline_path: str, tolerance: float) -> List[str]:
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    problems = []
+    if result["packets_per_second"] < baseline["packets_per_second"] * (1 - tolerance):
+        problems.append(f"throughput {result['packets_per_second']:.1f} pkt/s vs baseline {baseline['packets_per_second']:.1f}")
+    for metric in ("p95_ms", "p99_ms"):
+        now, before = result["end_to_end"][metric], baseline["end_to_end"][metric]
+        if before and now > before * (1 + tolerance):
+            problems.append(f"end-to-end {metric} {now:.2f} vs baseline {before:.2f}")
+    for model, calls in result["llm_calls"].items():
+        before = baseline.get("llm_calls", {}).get(model)
+        if before is not None and calls > before * (1 + tolerance):
+            problems.append(f"{model} calls {calls} vs baseline {before}")
+    return problems
+
+
+def main():
+    args = parse_args()
+    if not args.real_llm:
+        # must be set before anything imports agents.base
+        os.environ["NETSENTRY_STUB_LLM"] = "1"
+        os.environ["NETSENTRY_STUB_LLM_LATENCY_MS"] = str(args.llm_latency_ms)
+        os.environ["NETSENTRY_STUB_LLM_POSITIVE_RATE"] = str(args.llm_positive_rate)
+
+    packets = pcap_packets(args.pcap) if args.pcap else synthetic_packets(args.packets, args.malicious_rate, args.seed)
+    # ingest cost: every packet is decoded from its wire JSON like an /analysis request body
+    wire_packets = [json.dumps({"packet": packet}) for packet in packets]
+    print(f"replaying {len(wire_packets)} packets", file=sys.stderr)
+
+    node_samples: Dict[str, List[float]] = defaultdict(list)
+    end_to_end: List[float] = []
+    verdicts: Dict[str, int] = defaultdict(int)
+
+    runner = run_batches if args.batch_size else run_graph
+    started = time.perf_counter()
+    asyncio.run(runner(wire_packets, args, node_samples, end_to_end, verdicts))
+    elapsed = time.perf_counter() - started
+
+    from utils.prefilter import tier_stats
+    from utils.stub_llm import stub_calls
+
+    result = {
+        "packets": len(wire_packets),
+        "seconds": elapsed,
+        "packets_per_second": len(wire_packets) / elapsed if elapsed else 0.0,
+        "end_to_end": summarize(end_to_end),
+        "nodes": {node: summarize(samples) for node, samples in node_samples.items()},
+        "llm_calls": dict(stub_calls),
+        "tiers": tier_stats.snapshot(),
+        "verdicts": dict(verdicts),
+    }
+    print(json.dumps(result, indent=2))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    if args.baseline:
+        problems = compare(result, args.baseline, args.tolerance)
+        for problem in problems:
+            print("REGRESSION:", problem, file=sys.stderr)
+        if problems:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""Throughput and recall of the embedding backends against the SentenceTransformer encoder.
+
+Encodes stored analyses (from --chroma-path, or a seeded synthetic set shaped like /store
+documents) with the torch reference and every candidate backend, then reports documents/s,
+single query latency (the /search path), recall@k of the candidate's nearest neighbours against
+the reference's, recall@k of candidate query vectors against reference document vectors (can
+the existing collection be searched without re-embedding) and the mean cosine between the two
+encodings of the same text. Every backend, the reference included, is measured in a fresh
+process, so its peak RSS and its growth over the bare interpreter are its own.
+
+Run from the backend directory:
+
+    python -m benchmarks.embedding_bench --backends onnx,onnx:onnx/model_qint8_avx512.onnx
+    python -m benchmarks.embedding_bench --chroma-path ./chroma --output run.json
+"""
+import argparse
+import json
+import multiprocessing
+import random
+import resource
+import sys
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+
+from benchmarks.analysis_bench import summarize
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backends", default="onnx", help="comma separated candidates: onnx, onnx:<file in the export>, torch")
+    parser.add_argument("--chroma-path", help="use the documents stored in this chroma directory")
+    parser.add_argument("--documents", type=int, default=2000, help="number of synthetic documents")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    return parser.parse_args()
+
+
+FINDINGS = [
+    "No XSS patterns found in the payload",
+    "Reflected XSS: <script>document.cookie</script> in the q parameter",
+    "Event handler injection via <img src=x onerror=alert(1)>",
+    "No SQL injection detected",
+    "Tautology based SQL injection ' OR '1'='1' in the login form",
+    "UNION SELECT username, password FROM users in the id parameter",
+    "Encrypted TLS payload, nothing to inspect",
+    "Binary payload without printable content",
+    "Plain HTTP GET for static assets",
+]
+QUERY_TOPICS = [
+    "cross site scripting from {ip}",
+    "sql injection against the login page",
+    "what did {ip} send",
+    "union based injection attempts",
+    "cookie theft with script tags",
+    "benign traffic on port 443",
+    "stolen credentials in POST bodies",
+]
+
+
+def synthetic_documents(count: int, rng: random.Random) -> List[str]:
+    documents = []
+    for _ in range(count):
+        ip = f"10.0.{rng.randint(0, 3)}.{rng.randint(1, 254)}"
+        # same layout as the documents /store writes
+        documents.append(
+            f"""
+        XSS Analysis: {rng.choice(FINDINGS[:3])} from {ip}
+        SQLi Analysis: {rng.choice(FINDINGS[3:6])}
+        Payload Analysis: {rng.choice(FINDINGS[6:])}
+        """
+        )
+    return documents
+
+
+def stored_documents(path: str) -> List[str]:
+    import chromadb
+
+    collection = chromadb.PersistentClient(path=path).get_or_create_collection(name="collection")
+    documents, offset = [], 0
+    while True:
+        page = collection.get(include=["documents"], limit=1000, offset=offset)
+        documents.extend(page["documents"])
+        if len(page["ids"]) < 1000:
+            return documents
+        offset += 1000
+
+
+def load_backend(spec: str, batch_size: int):
+    from utils.embedding import EMBEDDING_MAX_LENGTH, EMBEDDING_MODEL, EMBEDDING_ONNX_FILE, EMBEDDING_ONNX_PATH, OnnxEmbedder
+
+    backend, _, file = spec.partition(":")
+    if backend == "torch":
+        from sentence_transformers import SentenceTransformer
+
+        return SentenceTransformer(EMBEDDING_MODEL)
+    if backend == "onnx":
+        return OnnxEmbedder(EMBEDDING_ONNX_PATH, file or EMBEDDING_ONNX_FILE, EMBEDDING_MAX_LENGTH, batch_size)
+    raise ValueError(f"unknown backend {spec!r}")
+
+
+def top_k(queries: np.ndarray, documents: np.ndarray, k: int) -> np.ndarray:
+    # vectors are normalized, so the dot product is the cosine
+    return np.argsort(-(queries @ documents.T), axis=1)[:, :k]
+
+
+def recall(expected: np.ndarray, found: np.ndarray) -> float:
+    return float(np.mean([len(set(e) & set(f)) / len(e) for e, f in zip(expected, found)]))
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure(spec: str, documents: List[str], queries: List[str], batch_size: int) -> Dict[str, Any]:
+    baseline_rss = peak_rss_mb()
+    started = time.perf_counter()
+    embedder = load_backend(spec, batch_size)
+    load_seconds = time.perf_counter() - started
+
+    embedder.encode(documents[:batch_size], batch_size=batch_size)  # warm up
+    started = time.perf_counter()
+    document_vectors = np.asarray(embedder.encode(documents, batch_size=batch_size, normalize_embeddings=True))
+    elapsed = time.perf_counter() - started
+
+    latencies = []
+    query_vectors = []
+    for query in queries:
+        started = time.perf_counter()
+        query_vectors.append(embedder.encode(query, normalize_embeddings=True))
+        latencies.append(time.perf_counter() - started)
+
+    return {
+        "load_seconds": load_seconds,
+        "documents_per_second": len(documents) / elapsed if elapsed else 0.0,
+        "single_query": summarize(latencies),
+        "peak_rss_mb": peak_rss_mb(),
+        "rss_growth_mb": peak_rss_mb() - baseline_rss,
+        "document_vectors": document_vectors,
+        "query_vectors": np.stack(query_vectors),
+    }
+
+
+def measure_isolated(spec: str, documents: List[str], queries: List[str], batch_size: int) -> Dict[str, Any]:
+    # ru_maxrss is a high-water mark for the whole process, so a backend measured after the torch
+    # reference in the same process would report at least torch's peak
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        return pool.apply(measure, (spec, documents, queries, batch_size))
+
+
+def main():
+    args = parse_args()
+    rng = random.Random(args.seed)
+    documents = stored_documents(args.chroma_path) if args.chroma_path else synthetic_documents(args.documents, rng)
+    queries = [rng.choice(QUERY_TOPICS).format(ip=f"10.0.{rng.randint(0, 3)}.{rng.randint(1, 254)}") for _ in range(args.queries)]
+    k = min(args.k, len(documents))
+    print(f"encoding {len(documents)} documents and {len(queries)} queries", file=sys.stderr)
+
+    reference = measure_isolated("torch", documents, queries, args.batch_size)
+    expected = top_k(reference["query_vectors"], reference["document_vectors"], k)
+
+    results = {}
+    for spec in [spec.strip() for spec in args.backends.split(",") if spec.strip()]:
+        print(f"measuring {spec}", file=sys.stderr)
+        run = measure_isolated(spec, documents, queries, args.batch_size)
+        results[spec] = {
+            **{key: value for key, value in run.items() if not key.endswith("_vectors")},
+            f"recall@{k}": recall(expected, top_k(run["query_vectors"], run["document_vectors"], k)),
+            # candidate queries against the vectors already in the collection
+            f"cross_recall@{k}": recall(expected, top_k(run["query_vectors"], reference["document_vectors"], k)),
+            "mean_cosine_to_reference": float(np.mean(np.sum(run["document_vectors"] * reference["document_vectors"], axis=1))),
+            "speedup": run["documents_per_second"] / reference["documents_per_second"] if reference["documents_per_second"] else 0.0,
+        }
+
+    result = {
+        "documents": len(documents),
+        "queries": len(queries),
+        "reference": {key: value for key, value in reference.items() if not key.endswith("_vectors")},
+        "candidates": results,
+    }
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,36 @@
+from utils.lazy import PROCESS_STARTED, lazy, resolve, is_loaded, warm_up, component_status
 from typing import Dict, List
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from utils.workflow import create_workflow, create_parallel_workflow
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from utils.workflow import create_workflow, create_parallel_workflow, run_parallel_batch, parallel_start_state
 from utils.CriteriaStorage import CriteriaStorage
 from utils.models import GraphState, ParallelState
+from utils.prefilter import tier_stats
+from utils.packet_prompt import prompt_stats
+from utils.scheduler import on_preliminary
+from utils.verdict_cache import VERDICT_FIELDS, create_verdict_cache, verdict_key, is_cacheable
+from utils.metrics import render_metrics, start_trace
+from utils.flow_tracker import FlowTracker
+from utils.alert_engine import AlertEngine
 import chromadb
-import uuid
-from sentence_transformers import SentenceTransformer
-from utils.config import create_llm
-from typing import Dict, List, Any
+from utils.embedding import get_embedder, embedding_fingerprint, get_or_create_collection, same_vector_space
+from utils.query_cache import create_query_cache
+from utils.diagram_cache import create_diagram_cache, prompt_version
+from utils.bpf import filter_cache, prepare_filter
+from utils.store_buffer import StoreBuffer
+from utils.retention import RetentionManager, create_retention_policy
+from utils.search_index import LexicalIndex, SearchFilters, reciprocal_rank_fusion
+from utils.packets import get_flow_fields
+from agents.base import get_llm, get_reasoning_llm
+from typing import Dict, List, Any, Optional
 import os
-from groq import Groq
+import json
+import time
+import asyncio
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from groq import AsyncGroq
 
 app = FastAPI()
 origins = ["http://localhost:5173"]
@@ -21,32 +41,228 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
-workflow = create_workflow()
+# the graphs, chroma, the embedding model and the Groq clients are built on first use (or by the
+# startup warm-up below) instead of at import, so the worker answers before they are loaded
+workflow = lazy("workflow", create_workflow)
 criteria_storage = CriteriaStorage()
-parallel_workflow = create_parallel_workflow()
-
-chroma_client = chromadb.PersistentClient(path="./chroma")
-collection = chroma_client.get_or_create_collection(name="collection")
-embedder = SentenceTransformer("all-MiniLM-L6-v2")
-
-groq_client = Groq(
+parallel_workflow = lazy("parallel_workflow", create_parallel_workflow)
+# the fingerprint imports the agents and loads the payload classifier, so this waits for first use too
+verdict_cache = lazy("verdict_cache", create_verdict_cache)
+query_cache = create_query_cache()
+# per-connection limits for /analysis/stream
+STREAM_QUEUE_SIZE = int(os.environ.get("STREAM_QUEUE_SIZE", 256))
+STREAM_WORKERS = int(os.environ.get("STREAM_WORKERS", 32))
+FLOW_IDLE_TIMEOUT = float(os.environ.get("FLOW_IDLE_TIMEOUT", 30))
+FLOW_MAX_BYTES = int(os.environ.get("FLOW_MAX_BYTES", 64 * 1024))
+FLOW_MAX_TOTAL_BYTES = int(os.environ.get("FLOW_MAX_TOTAL_BYTES", 32 * 1024 * 1024))
+# alert_conditions of the criteria last selected by /query, evaluated locally on every packet
+alert_engine = None
+recent_alerts = deque(maxlen=int(os.environ.get("RECENT_ALERTS", 1000)))
+# a plain alert condition fires at most once per source IP per this many seconds
+ALERT_SUPPRESS_SECONDS = float(os.environ.get("ALERT_SUPPRESS_SECONDS", 60))
+
+def open_collection():
+    collection = get_or_create_collection(chromadb.PersistentClient(path="./chroma"), "collection")
+    # collections from before the embedding backend was configurable hold torch vectors
+    stored = (collection.metadata or {}).get("embedding", embedding_fingerprint("torch"))
+    if collection.count() and not same_vector_space(stored, embedding_fingerprint()):
+        print(f"WARNING: the collection holds {stored} vectors but the embedder is {embedding_fingerprint()}, run python -m tools.reembed")
+    return collection
+
+
+collection = lazy("chroma", open_collection)
+embedder = lazy("embedder", get_embedder)
+# embedding and chroma calls are blocking, so they run here instead of on the event loop
+blocking_executor = ThreadPoolExecutor(max_workers=int(os.environ.get("BLOCKING_WORKERS", 2)))
+
+retention_manager = RetentionManager(collection, embedder, create_retention_policy())
+retention_lock = asyncio.Lock()
+RETENTION_INTERVAL = float(os.environ.get("RETENTION_INTERVAL", 3600))
+
+groq_client = lazy("groq", lambda: AsyncGroq(
     api_key=os.environ.get("GROQ_API_KEY")
+))
+lazy("llm", get_llm)
+lazy("reasoning_llm", get_reasoning_llm)
+# comma separated components to load in the background at startup, "all" or "none"
+WARMUP = os.environ.get("WARMUP", "all")
+# loaded before /ready reports ready
+REQUIRED_COMPONENTS = ["chroma", "embedder", "workflow", "parallel_workflow", "groq", "llm", "reasoning_llm", "lexical_index", "verdict_cache"]
+
+
+def set_alert_criteria(title, criteria_list) -> bool:
+    """Compile the alert_conditions of the criteria with this title, returns False if there is none."""
+    global alert_engine
+    criteria = next((c for c in criteria_list if c.title == title), None)
+    if criteria is None:
+        return False
+    alert_engine = AlertEngine(criteria, suppress_window=ALERT_SUPPRESS_SECONDS)
+    print(f"compiled {len(alert_engine.conditions)} alert conditions for {criteria.title}")
+    return True
+
+
+def compiled_filter(title) -> Optional[Dict[str, Any]]:
+    """The selected criteria's scapy_str compiled to BPF, from the cache unless the criteria changed."""
+    criteria = criteria_storage.get_by_title(title) if title else None
+    if criteria is None:
+        return None
+    return filter_cache.get(title, criteria_storage.get_version(title), criteria.scapy_str).to_dict()
+
+
+def check_alerts(packet: Dict[str, Any]) -> List[Dict[str, Any]]:
+    if alert_engine is None or not packet:
+        return []
+    alerts = alert_engine.evaluate(packet)
+    recent_alerts.extend(alerts)
+    return alerts
+
+
+async def run_blocking(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(blocking_executor, lambda: func(*args, **kwargs))
+
+
+async def ensure_loaded(*names: str):
+    """Load components that are still cold off the event loop, before a handler touches them."""
+    for name in names:
+        if not is_loaded(name):
+            await asyncio.get_running_loop().run_in_executor(None, resolve, name)
+
+
+# BM25 side of /search, kept in step with everything written to the collection
+lexical_index = LexicalIndex()
+SEARCH_DEFAULT_K = int(os.environ.get("SEARCH_K", 3))
+SEARCH_MAX_K = int(os.environ.get("SEARCH_MAX_K", 50))
+
+# /store acknowledges right away and writes to chroma in batches
+store_buffer = StoreBuffer(
+    collection,
+    embedder,
+    run_blocking=run_blocking,
+    max_batch=int(os.environ.get("STORE_BATCH_SIZE", 64)),
+    max_delay=float(os.environ.get("STORE_FLUSH_INTERVAL", 1.0)),
+    journal_path=os.environ.get("STORE_JOURNAL_PATH", "./store_journal.ndjson"),
+    on_flush=lambda batch: lexical_index.add((r["id"], r["document"], r["metadata"]) for r in batch),
 )
 
+def build_lexical_index():
+    lexical_index.rebuild(collection)
+    print(f"indexed {len(lexical_index)} stored analyses for lexical search")
+    return lexical_index
+
+
+lazy("lexical_index", build_lexical_index)
+
+
+@app.on_event("startup")
+async def start_store_buffer():
+    # replays the journal only; records reach chroma on the first flush, which loads it
+    await store_buffer.start()
+
+
+@app.on_event("startup")
+async def start_warm_up():
+    print(f"server imported in {time.perf_counter() - PROCESS_STARTED:.2f}s")
+    if WARMUP == "none":
+        names = []
+    elif WARMUP == "all":
+        names = REQUIRED_COMPONENTS
+    else:
+        names = [name.strip() for name in WARMUP.split(",") if name.strip()]
+    if names:
+        # the default executor, so the warm-up doesn't hold up requests queued on blocking_executor
+        asyncio.get_running_loop().run_in_executor(None, warm_up, names)
+
+
+async def run_retention():
+    # POST /retention/run and the scheduled loop take turns; other workers are kept out by the manager's lock file
+    async with retention_lock:
+        # flush first so the buffered records are part of the count
+        await store_buffer.flush()
+        report = await run_blocking(retention_manager.run)
+        if "skipped" not in report:
+            await run_blocking(lexical_index.rebuild, collection)
+    print("retention run: ", report)
+    return report
+
+
+@app.on_event("startup")
+async def start_retention():
+    async def loop():
+        while True:
+            await asyncio.sleep(RETENTION_INTERVAL)
+            try:
+                await run_retention()
+            except Exception as e:
+                print(f"Error in retention run: {str(e)}")
+
+    if RETENTION_INTERVAL > 0:
+        asyncio.create_task(loop())
+
+
+@app.on_event("shutdown")
+def save_verdict_cache():
+    # never loaded means nothing new to save, and saving would load it on the way out
+    if is_loaded("verdict_cache"):
+        verdict_cache.save()
+
+
+@app.on_event("shutdown")
+async def flush_store_buffer():
+    await store_buffer.stop()
+    print("store buffer stats: ", store_buffer.stats)
+
+
 @app.get("/")
 def root():
     return {"message": "Hello World"}
 
 
+@app.get("/ready")
+def handle_ready():
+    """Readiness probe: 503 until every required component is loaded, with per component load times."""
+    components = component_status()
+    ready = all(is_loaded(name) for name in REQUIRED_COMPONENTS)
+    body = {
+        "ready": ready,
+        "uptime_seconds": time.perf_counter() - PROCESS_STARTED,
+        "components": components,
+    }
+    return JSONResponse(body, status_code=200 if ready else 503)
+
+
+@app.get("/metrics")
+def handle_metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
 @app.post("/query")
 async def handle_query(request: Request):
     data = await request.json()
     user_input = data.get("query")
     print("user input: ", user_input)
 
-    current_criteria = criteria_storage.get_criteria()
+    # sqlite can wait up to its 30s busy timeout on another worker's write lock, so never on the loop
+    current_criteria = await run_blocking(criteria_storage.get_criteria)
     print("num critera before llm call", len(current_criteria))
 
+    # repeated or near-duplicate descriptions resolve to the criteria picked last time
+    revision = await run_blocking(criteria_storage.revision)
+    embedding = None
+    cached = query_cache.get_exact(user_input, revision) if user_input else None
+    if cached is None and user_input:
+        await ensure_loaded("embedder")
+        embedding = await run_blocking(embedder.encode, user_input, normalize_embeddings=True)
+        cached = query_cache.get(embedding, revision)
+    if cached is not None:
+        print(f"query cache hit ({cached['similarity']:.3f}): ", cached["selected_criteria"])
+        set_alert_criteria(cached["selected_criteria"], current_criteria)
+        return {
+            "response": {"description": user_input, "existing_criteria": current_criteria, **cached},
+            "filter": await run_blocking(compiled_filter, cached["selected_criteria"]),
+            "cached": True,
+        }
+
     initial_state = GraphState(
         description=user_input,
         existing_criteria=current_criteria,
@@ -57,44 +273,301 @@ async def handle_query(request: Request):
     )
 
     try:
-        res = workflow.invoke(initial_state, config={"recursion_limit": 10})  # returns a GraphState object
+        await ensure_loaded("workflow")
+        with start_trace(bool(data.get("trace"))) as trace:
+            res = await workflow.ainvoke(initial_state, config={"recursion_limit": 10})  # returns a GraphState object
         new_criteria_list = res["existing_criteria"]
 
-        if new_criteria_list != current_criteria:
-            criteria_storage.update_criteria(new_criteria_list)
-            print("num criterias after llm call: ", len(new_criteria_list))
+        # new_criteria_agent only ever appends, so just the tail needs storing
+        for criteria in new_criteria_list[len(current_criteria):]:
+            version = await run_blocking(criteria_storage.append_criteria, criteria)
+            print(f"stored criteria {criteria.title} (version {version})")
 
         print("FINAL LOG: ", res["selected_criteria"])
-        return {"response": res}
+        set_alert_criteria(res["selected_criteria"], new_criteria_list)
+        if embedding is not None and res.get("approved") and res.get("selected_criteria"):
+            result = {field: res.get(field) for field in ("selected_criteria", "sent_from", "feedback", "approved")}
+            query_cache.put(user_input, embedding, result, await run_blocking(criteria_storage.revision))
+        compiled = await run_blocking(compiled_filter, res["selected_criteria"])
+        if trace is not None:
+            return {"response": res, "filter": compiled, "trace": trace}
+        return {"response": res, "filter": compiled}
 
     except Exception as e:
         return {"error": str(e)}
 
 
+@app.post("/filters/compile")
+async def handle_filter_compile(request: Request):
+    """Check a BPF filter before handing it to the sniffer."""
+    data = await request.json()
+    return prepare_filter(data.get("filter") or "").to_dict()
+
+
+@app.get("/query/cache")
+def handle_query_cache_stats():
+    return {"cache": query_cache.stats()}
+
+
+async def analyze_packet(packet: Dict[str, Any]) -> Dict[str, Any]:
+    start_state = parallel_start_state(packet)
+
+    await ensure_loaded("verdict_cache")
+    key = verdict_key(packet)
+    cached = verdict_cache.get(key)
+    if cached is not None:
+        tier_stats.record("cache")
+        return {**start_state.model_dump(), **cached, "tier": "cache"}
+
+    await ensure_loaded("parallel_workflow", "llm", "reasoning_llm")
+    res = await parallel_workflow.ainvoke(start_state)
+    print("FINAL OUTPUT: ", res)
+    if res.get("tier") == "llm" and is_cacheable(res):
+        verdict_cache.put(key, res)
+    return res
+
+
 @app.post("/analysis")
 async def handle_analysis(request: Request):
     print("reached the /analysis endpoint")
     data = await request.json()
     packet = data.get("packet")
 
-    start_state = ParallelState(
-        packet=packet,
-        xss_agent_msg="",
-        SQLi_agent_msg="",
-        payload_agent_msg="",
-        threat_detected=False,
-        feedback="",
-    )
-
     try:
-        res = parallel_workflow.invoke(start_state)
-        print("FINAL OUTPUT: ", res)
-        return {"response": res}
+        alerts = check_alerts(packet)
+        with start_trace(bool(data.get("trace"))) as trace:
+            res = await analyze_packet(packet)
+        if trace is not None:
+            return {"response": res, "alerts": alerts, "tier_stats": tier_stats.snapshot(), "trace": trace}
+        return {"response": res, "alerts": alerts, "tier_stats": tier_stats.snapshot()}
     except Exception as e:
         print("ERROR invoking the chain in /analysis:", e)
         return {"error": str(e)}
 
 
+@app.websocket("/analysis/stream")
+async def handle_analysis_stream(websocket: WebSocket):
+    """Persistent ingest: clients send {"id", "packet"} objects (one per message or as NDJSON lines)
+    and verdicts are pushed back on the same connection as they complete, in completion order.
+
+    TCP segments are reassembled per flow first (disable with ?reassemble=0), so a verdict covers
+    one application message and lists the ids of every segment it was built from in packet_ids.
+    A confident positive from one agent is pushed as {"id", "packet_ids", "preliminary"} before the
+    final verdict. Alert conditions are checked on every packet before reassembly and pushed as {"id", "alerts"}.
+    Segments that carry nothing to analyse (pure ACKs, handshakes of flows without data) are answered
+    with {"id", "packet_ids", "skipped": "no payload"} so every id gets a reply."""
+    await websocket.accept()
+    print("client connected to /analysis/stream")
+    tracker = None
+    if websocket.query_params.get("reassemble", "1") != "0":
+        tracker = FlowTracker(
+            idle_timeout=FLOW_IDLE_TIMEOUT,
+            max_flow_bytes=FLOW_MAX_BYTES,
+            max_total_bytes=FLOW_MAX_TOTAL_BYTES,
+        )
+
+    # a full queue stops us reading from the socket, so TCP flow control pushes back on the sender
+    queue: asyncio.Queue = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+    send_lock = asyncio.Lock()
+
+    async def send(message: Dict[str, Any]):
+        async with send_lock:
+            await websocket.send_json(message)
+
+    async def worker():
+        while True:
+            packet_ids, packet = await queue.get()
+            # preliminary sends of this packet, awaited before its final verdict goes out
+            pending_sends: List[asyncio.Task] = []
+
+            def preliminary(verdict: Dict[str, Any], packet_ids=packet_ids):
+                # a confident positive from one agent goes out before the others and the decision finish
+                task = asyncio.create_task(send({"id": packet_ids[-1], "packet_ids": packet_ids, "preliminary": verdict}))
+                # a send that fails after a disconnect must not surface as a never retrieved task exception
+                task.add_done_callback(lambda t: t.cancelled() or t.exception())
+                pending_sends.append(task)
+
+            try:
+                with on_preliminary(preliminary):
+                    res = await analyze_packet(packet)
+                for result in await asyncio.gather(*pending_sends, return_exceptions=True):
+                    if isinstance(result, WebSocketDisconnect):
+                        raise result
+                await send({"id": packet_ids[-1], "packet_ids": packet_ids, "response": res})
+            except WebSocketDisconnect:
+                raise
+            except Exception as e:
+                print("ERROR invoking the chain in /analysis/stream:", e)
+                await send({"id": packet_ids[-1], "packet_ids": packet_ids, "error": str(e)})
+            finally:
+                # no-op for the ones already sent; the rest go with the worker when the connection closes
+                for task in pending_sends:
+                    task.cancel()
+                queue.task_done()
+
+    async def dispatch(ready):
+        packet_ids, packet = ready
+        if packet is None:
+            await send({"id": packet_ids[-1], "packet_ids": packet_ids, "skipped": "no payload"})
+        else:
+            await queue.put(ready)
+
+    async def expire_flows():
+        while True:
+            await asyncio.sleep(1)
+            for ready in tracker.expire():
+                await dispatch(ready)
+
+    workers = [asyncio.create_task(worker()) for _ in range(STREAM_WORKERS)]
+    if tracker is not None:
+        workers.append(asyncio.create_task(expire_flows()))
+    received = 0
+    try:
+        while True:
+            message = await websocket.receive_text()
+            for line in message.splitlines():
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError as e:
+                    await send({"error": f"invalid JSON: {e}"})
+                    continue
+                if not isinstance(entry, dict):
+                    await send({"error": "expected an object with 'id' and 'packet'"})
+                    continue
+                packet_id = entry.get("id", received)
+                received += 1
+                packet = entry.get("packet")
+                if not isinstance(packet, dict) or not packet:
+                    await send({"id": packet_id, "error": "missing packet"})
+                    continue
+                alerts = check_alerts(packet)
+                if alerts:
+                    await send({"id": packet_id, "alerts": alerts})
+                if tracker is None:
+                    await queue.put(([packet_id], packet))
+                    continue
+                for ready in tracker.add(packet, packet_id):
+                    await dispatch(ready)
+    except WebSocketDisconnect:
+        print(f"client disconnected from /analysis/stream after {received} packets")
+        if tracker is not None:
+            print("flow reassembly stats: ", tracker.stats)
+    finally:
+        for task in workers:
+            task.cancel()
+
+
+@app.post("/analysis/batch")
+async def handle_analysis_batch(request: Request):
+    data = await request.json()
+    packets = data.get("packets") or []
+    print("reached the /analysis/batch endpoint with", len(packets), "packets")
+
+    # entries are either {"id": ..., "packet": {...}} or bare packets keyed by their position
+    entries = []
+    for index, entry in enumerate(packets):
+        if isinstance(entry, dict) and "packet" in entry:
+            entries.append((str(entry.get("id", index)), entry["packet"]))
+        else:
+            entries.append((str(index), entry))
+    counts = Counter(packet_id for packet_id, _ in entries)
+    duplicates = sorted(packet_id for packet_id, count in counts.items() if count > 1)
+    if duplicates:
+        # a later entry would silently replace the earlier one's verdict
+        return {"error": f"duplicate packet ids: {', '.join(duplicates)}"}
+
+    res = {}
+    alerts = {}
+    start_states = {}
+    for packet_id, packet in entries:
+        try:
+            start_states[packet_id] = parallel_start_state(packet or {})
+        except Exception as e:
+            # one malformed entry fails on its own instead of failing the batch
+            res[packet_id] = {"error": str(e)}
+            continue
+        alerts[packet_id] = check_alerts(packet)
+
+    await ensure_loaded("verdict_cache")
+    # packets with the same verdict key are analysed once and the verdict fanned out to the rest
+    groups: Dict[str, List[str]] = {}
+    for packet_id, state in start_states.items():
+        groups.setdefault(verdict_key(state.packet), []).append(packet_id)
+    keys = {}
+    for key, packet_ids in groups.items():
+        cached = verdict_cache.get(key)
+        if cached is not None:
+            for packet_id in packet_ids:
+                tier_stats.record("cache")
+                res[packet_id] = {**start_states[packet_id].model_dump(), **cached, "tier": "cache"}
+            continue
+        keys[packet_ids[0]] = key
+    pending = {packet_id: start_states[packet_id] for packet_id in keys}
+
+    try:
+        with start_trace(bool(data.get("trace"))) as trace:
+            await ensure_loaded("llm", "reasoning_llm")
+            res.update(await run_parallel_batch(pending))
+        for packet_id, key in keys.items():
+            verdict = res[packet_id]
+            if verdict.get("tier") == "llm" and is_cacheable(verdict):
+                verdict_cache.put(key, verdict)
+            for duplicate in groups[key][1:]:
+                if "error" in verdict:
+                    res[duplicate] = {"error": verdict["error"]}
+                else:
+                    shared = {field: verdict[field] for field in VERDICT_FIELDS if field in verdict}
+                    res[duplicate] = {**start_states[duplicate].model_dump(), **shared}
+        alerts = {packet_id: found for packet_id, found in alerts.items() if found}
+        if trace is not None:
+            return {"response": res, "alerts": alerts, "tier_stats": tier_stats.snapshot(), "trace": trace}
+        return {"response": res, "alerts": alerts, "tier_stats": tier_stats.snapshot()}
+    except Exception as e:
+        print("ERROR invoking the batch in /analysis/batch:", e)
+        return {"error": str(e)}
+
+
+@app.get("/analysis/cache")
+async def handle_cache_stats():
+    await ensure_loaded("verdict_cache")
+    return {"cache": verdict_cache.stats()}
+
+
+@app.get("/analysis/prompts")
+async def analysis_prompt_stats():
+    return {"prompts": prompt_stats.snapshot()}
+
+
+@app.get("/alerts")
+def handle_alerts():
+    if alert_engine is None:
+        return {"criteria": None, "alerts": list(recent_alerts)}
+    return {
+        "criteria": alert_engine.criteria.title,
+        "conditions": [condition.name for condition in alert_engine.conditions],
+        "errors": alert_engine.errors,
+        "stats": alert_engine.stats,
+        "alerts": list(recent_alerts),
+    }
+
+
+@app.get("/criteria/{title}/history")
+def handle_criteria_history(title: str):
+    return {"title": title, "versions": criteria_storage.history(title)}
+
+
+@app.post("/alerts/criteria")
+async def handle_alert_criteria(request: Request):
+    """Select the criteria whose alert_conditions are evaluated, without going through /query."""
+    data = await request.json()
+    title = data.get("title")
+    if not set_alert_criteria(title, await run_blocking(criteria_storage.get_criteria)):
+        return {"error": f"no criteria titled {title!r}"}
+    return {"criteria": title, "errors": alert_engine.errors}
+
+
 @app.post("/store")
 async def handle_store(request: Request):
     try:
@@ -104,31 +577,28 @@ async def handle_store(request: Request):
         if not state:
             return {"error": "No state provided"}
 
-        uid = str(uuid.uuid4())
         combined_text = f"""
         XSS Analysis: {state["xss_agent_msg"]}
         SQLi Analysis: {state["SQLi_agent_msg"]}
         Payload Analysis: {state["payload_agent_msg"]}
         """
 
-        embedding = embedder.encode(combined_text).tolist()
+        flow = get_flow_fields(state.get("packet") or {})
         metadata = {
             "xss_agent_msg": state["xss_agent_msg"],
             "SQLi_agent_msg": state["SQLi_agent_msg"],
             "payload_agent_msg": state["payload_agent_msg"],
             "threat_detected": state["threat_detected"],
             "feedback": state["feedback"],
+            "stored_at": time.time(),
+            # chroma metadata can't hold None
+            "source_ip": flow["source_ip"] or "",
         }
 
-        collection.add(
-            embeddings=[embedding],
-            documents=[combined_text],
-            metadatas=[metadata],
-            ids=[uid],
-        )
+        uid = store_buffer.add(combined_text, metadata)
         return {
             "status": "success",
-            "message": f"Stored analysis with ID: {uid}",
+            "message": f"Queued analysis with ID: {uid}",
             "id": uid,
         }
 
@@ -137,13 +607,56 @@ async def handle_store(request: Request):
         return {"error": str(e)}
 
 
-@app.post("/generate-diagram")
-async def generate_diagram(request: Request):
+@app.get("/store/stats")
+def handle_store_stats():
+    return {**store_buffer.stats, "pending": store_buffer.pending()}
+
+
+@app.post("/retention/run")
+async def handle_retention_run():
     try:
-        data = await request.json()
-        solution = data.get("solution")
-        
-        prompt = f"""Generate a simple, high-level Mermaid flowchart diagram for the following security solution:
+        return await run_retention()
+    except Exception as e:
+        print(f"Error in /retention/run endpoint: {str(e)}")
+        return {"error": str(e)}
+
+
+@app.get("/retention")
+def handle_retention_status():
+    return {"last_run": retention_manager.last_report, "archives": retention_manager.list_archives()}
+
+
+@app.post("/retention/reindex")
+async def handle_retention_reindex(request: Request):
+    data = await request.json()
+    try:
+        restored = await run_blocking(retention_manager.reindex, data.get("file") or "")
+        await run_blocking(lexical_index.rebuild, collection)
+        return {"status": "success", "restored": restored}
+    except Exception as e:
+        print(f"Error in /retention/reindex endpoint: {str(e)}")
+        return {"error": str(e)}
+
+
+DIAGRAM_MODEL = "mixtral-8x7b-32768"
+RAG_MODEL = "mixtral-8x7b-32768"
+
+
+def sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def event_stream(events):
+    # no-transform/X-Accel-Buffering keep proxies from holding tokens back
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache, no-transform", "X-Accel-Buffering": "no"},
+    )
+
+
+def diagram_messages(solution: str) -> List[Dict[str, str]]:
+    prompt = f"""Generate a simple, high-level Mermaid flowchart diagram for the following security solution:
                     {solution}
                     Requirements for the diagram:
                     1. Use 'flowchart TD' for vertical layout (top-down)
@@ -156,110 +669,267 @@ async def generate_diagram(request: Request):
                     8. DO NOT include any markdown formatting or code blocks
                     9. Start directly with 'flowchart TD'
                     Return ONLY the raw Mermaid diagram code with no additional formatting or explanation."""
+    return [
+        {
+            "role": "system",
+            "content": "You are a technical diagram generator that creates simple, high-level Mermaid flowcharts for security concepts. Return only the raw Mermaid diagram code without any markdown formatting or code blocks."
+        },
+        {
+            "role": "user",
+            "content": prompt
+        }
+    ]
 
-        chat_completion = groq_client.chat.completions.create(
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a technical diagram generator that creates simple, high-level Mermaid flowcharts for security concepts. Return only the raw Mermaid diagram code without any markdown formatting or code blocks."
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            model="mixtral-8x7b-32768",
-            temperature=0.1,
-        )
-        
-        mermaid_code = chat_completion.choices[0].message.content.strip()
-        
-        # More robust cleaning of the response
-        # Remove any markdown code block indicators
-        mermaid_code = mermaid_code.replace("```mermaid", "")
-        mermaid_code = mermaid_code.replace("```", "")
-        
-        # Remove any leading/trailing whitespace and newlines
-        mermaid_code = mermaid_code.strip()
-        
-        # Ensure it starts with flowchart TD and only once
-        if "flowchart TD" in mermaid_code:
-            # Remove any duplicate flowchart TD declarations
-            mermaid_code = mermaid_code.replace("flowchart TD", "", mermaid_code.count("flowchart TD") - 1)
-        else:
-            mermaid_code = "flowchart TD\n" + mermaid_code.replace("flowchart LR", "").replace("graph LR", "")
-        
-        # Validate basic Mermaid syntax
-        if not any(["-->" in mermaid_code or "-.->" in mermaid_code or "==>" in mermaid_code]):
-            raise ValueError("Invalid Mermaid diagram: No valid connections found")
-            
-        return {"diagram": mermaid_code}
+
+def clean_mermaid(mermaid_code: str) -> str:
+    mermaid_code = mermaid_code.strip()
+
+    # More robust cleaning of the response
+    # Remove any markdown code block indicators
+    mermaid_code = mermaid_code.replace("```mermaid", "")
+    mermaid_code = mermaid_code.replace("```", "")
+
+    # Remove any leading/trailing whitespace and newlines
+    mermaid_code = mermaid_code.strip()
+
+    # Ensure it starts with flowchart TD and only once
+    if "flowchart TD" in mermaid_code:
+        # Remove any duplicate flowchart TD declarations
+        mermaid_code = mermaid_code.replace("flowchart TD", "", mermaid_code.count("flowchart TD") - 1)
+    else:
+        mermaid_code = "flowchart TD\n" + mermaid_code.replace("flowchart LR", "").replace("graph LR", "")
+
+    # Validate basic Mermaid syntax
+    if not any(["-->" in mermaid_code or "-.->" in mermaid_code or "==>" in mermaid_code]):
+        raise ValueError("Invalid Mermaid diagram: No valid connections found")
+    return mermaid_code
+
+
+# validated diagrams per solution text, invalidated by any change to the prompt or model
+diagram_cache = create_diagram_cache(prompt_version(DIAGRAM_MODEL, json.dumps(diagram_messages("{solution}"))))
+
+
+async def generate_mermaid(solution: str) -> str:
+    chat_completion = await groq_client.chat.completions.create(
+        messages=diagram_messages(solution),
+        model=DIAGRAM_MODEL,
+        temperature=0.1,
+    )
+    return clean_mermaid(chat_completion.choices[0].message.content)
+
+
+async def stream_completion(messages: List[Dict[str, str]], model: str):
+    """Yield content deltas of a Groq chat completion as they arrive."""
+    stream = await groq_client.chat.completions.create(
+        messages=messages,
+        model=model,
+        temperature=0.1,
+        stream=True,
+    )
+    async for chunk in stream:
+        delta = chunk.choices[0].delta.content if chunk.choices else None
+        if delta:
+            yield delta
+
+
+@app.post("/generate-diagram")
+async def generate_diagram(request: Request):
+    try:
+        data = await request.json()
+        solution = data.get("solution")
+        mermaid_code, source = await diagram_cache.get_or_create(solution, lambda: generate_mermaid(solution))
+        return {"diagram": mermaid_code, "cached": source != "generated"}
         
     except Exception as e:
         print(f"Error in generate-diagram endpoint: {str(e)}")
         return {"error": str(e)}
 
 
+@app.get("/generate-diagram/cache")
+async def diagram_cache_stats():
+    return {"cache": diagram_cache.stats()}
+
+
+@app.post("/generate-diagram/stream")
+async def generate_diagram_stream(request: Request):
+    """Server-sent events: a "line" per completed diagram line as the model writes it, then the
+    cleaned and validated "diagram" (or an "error")."""
+    data = await request.json()
+    solution = data.get("solution")
+
+    async def generate(lines: asyncio.Queue) -> str:
+        # runs in its own task, so the LLM call finishes for coalesced requests even if this client leaves
+        text = ""
+        sent = 0
+        try:
+            async for delta in stream_completion(diagram_messages(solution), DIAGRAM_MODEL):
+                text += delta
+                while "\n" in text[sent:]:
+                    end = text.index("\n", sent)
+                    line = text[sent:end]
+                    sent = end + 1
+                    if line.strip() and not line.strip().startswith("```"):
+                        lines.put_nowait(line)
+            if text[sent:].strip():
+                lines.put_nowait(text[sent:])
+            return clean_mermaid(text)
+        except Exception as e:
+            print(f"Error in generate-diagram/stream endpoint: {str(e)}")
+            raise
+        finally:
+            lines.put_nowait(None)
+
+    async def events():
+        key = diagram_cache.key(solution)
+        cached = diagram_cache.get(key)
+        if cached is not None:
+            yield sse("diagram", {"diagram": cached, "cached": True})
+            return
+        leader, future = diagram_cache.begin(key)
+        if leader:
+            lines: asyncio.Queue = asyncio.Queue()
+            diagram_cache.spawn(key, generate(lines))
+            while (line := await lines.get()) is not None:
+                yield sse("line", {"line": line})
+        # the same solution may already be drawn for another request; the future is shared, so shield it
+        try:
+            yield sse("diagram", {"diagram": await asyncio.shield(future), "cached": not leader})
+        except Exception as e:
+            yield sse("error", {"error": str(e)})
+
+    return event_stream(events())
+
+
+async def hybrid_search(query: str, k: int, page: int, filters: SearchFilters) -> Dict[str, List]:
+    """BM25 and vector results fused by reciprocal rank, filters applied inside both lookups."""
+    await ensure_loaded("chroma", "lexical_index", "embedder")
+    depth = k * (page + 1)
+    lexical = [record_id for record_id, _ in lexical_index.search(query, depth, filters)]
+
+    vector = []
+    count = await run_blocking(collection.count)
+    if count:
+        query_embedding = (await run_blocking(embedder.encode, query)).tolist()
+        results = await run_blocking(
+            collection.query,
+            query_embeddings=[query_embedding],
+            n_results=min(depth, count),
+            where=filters.to_where(),
+            include=["distances"],
+        )
+        vector = results["ids"][0]
+
+    fused = reciprocal_rank_fusion([lexical, vector])
+    page_ids = [record_id for record_id, _ in fused[page * k:depth]]
+    records = await run_blocking(collection.get, ids=page_ids, include=["documents", "metadatas"]) if page_ids else {"ids": []}
+    by_id = {record_id: i for i, record_id in enumerate(records["ids"])}
+    found = [record_id for record_id in page_ids if record_id in by_id]
+    return {
+        "ids": [found],
+        "documents": [[records["documents"][by_id[record_id]] for record_id in found]],
+        "metadatas": [[records["metadatas"][by_id[record_id]] for record_id in found]],
+        # either list coming back full means there may be more beyond this page
+        "has_more": len(fused) > depth or len(lexical) == depth or len(vector) == depth,
+    }
+
+
+def search_params(data: Dict[str, Any]):
+    k = max(1, min(int(data.get("k", SEARCH_DEFAULT_K)), SEARCH_MAX_K))
+    page = max(0, int(data.get("page", 0)))
+    return data.get("query"), k, page, SearchFilters.from_request(data.get("filters"))
+
+
 @app.post("/search")
 async def handle_search(request: Request):
     try:
         data = await request.json()
-        query = data.get("query")
-        query_embedding = embedder.encode(query).tolist()
-        results = collection.query(
-            query_embeddings=[query_embedding],
-            n_results=3,
-            include=["documents", "metadatas"],
-        )
+        query, k, page, filters = search_params(data)
+        results = await hybrid_search(query, k, page, filters)
 
         if not results["documents"][0]:
             return {"response": "No relevant security analyses found."}
 
         rag_response = await getRAG(query, results)
 
-        return {"response": rag_response, "matches_found": len(results["documents"][0])}
+        return {
+            "response": rag_response,
+            "matches_found": len(results["documents"][0]),
+            "ids": results["ids"][0],
+            "page": page,
+            "k": k,
+            "has_more": results["has_more"],
+        }
 
     except Exception as e:
         print(f"Error in /search endpoint: {str(e)}")
         return {"error": str(e)}
 
 
+@app.post("/search/stream")
+async def handle_search_stream(request: Request):
+    """Server-sent events: "matches" as soon as retrieval is done, a "token" per piece of the
+    answer as the model writes it, then "done" (or an "error")."""
+    data = await request.json()
+    query, k, page, filters = search_params(data)
+
+    async def events():
+        try:
+            results = await hybrid_search(query, k, page, filters)
+            matches = results["ids"][0]
+            yield sse("matches", {"ids": matches, "matches_found": len(matches), "page": page, "k": k, "has_more": results["has_more"]})
+            if not matches:
+                yield sse("token", {"text": "No relevant security analyses found."})
+            else:
+                async for delta in stream_completion(rag_messages(query, results), RAG_MODEL):
+                    yield sse("token", {"text": delta})
+            yield sse("done", {})
+        except Exception as e:
+            print(f"Error in /search/stream endpoint: {str(e)}")
+            yield sse("error", {"error": str(e)})
+
+    return event_stream(events())
+
+
+def rag_messages(query: str, search_results: Dict[str, List]) -> List[Dict[str, str]]:
+    # Build context with clearer structure and sections
+    context = ""
+    for i in range(len(search_results['documents'][0])):
+        metadata = search_results['metadatas'][0][i]
+        context += f"\nAnalysis Record {i+1}:\n"
+        context += "------\n"
+        context += f"XSS Finding: {metadata['xss_agent_msg']}\n"
+        context += f"SQL Injection Finding: {metadata['SQLi_agent_msg']}\n"
+        context += f"Payload Finding: {metadata['payload_agent_msg']}\n"
+        context += f"Threat Status: {'⚠️ Threat Detected' if metadata['threat_detected'] else 'No Threat Detected'}\n"
+        context += f"Security Note: {metadata['feedback']}\n"
+        context += "------\n"
+
+    prompt = f"""You are a specialized rag search engine. Your task is to answer the following query using only the provided security analysis records.
+
+    User Query: "{query}"
+
+    Security Analysis Records:
+    {context}
+
+    Using this information, generate a response that is concise, specific, and supports findings with direct quotes. Additionally, based on the response and information about malicious activity, include three actionable steps the user can take to handle this based on what the security analysis records say."""
+
+    return [
+        {
+            "role": "system",
+            "content": "You are a security search engine assistant that provides evidence-based answers using only information from security analysis records. Always support findings with direct quotes."
+        },
+        {
+            "role": "user",
+            "content": prompt
+        }
+    ]
+
+
 async def getRAG(query: str, search_results: Dict[str, List]) -> str:
     try:
-        # Build context with clearer structure and sections
-        context = ""
-        for i in range(len(search_results['documents'][0])):
-            metadata = search_results['metadatas'][0][i]
-            context += f"\nAnalysis Record {i+1}:\n"
-            context += "------\n"
-            context += f"XSS Finding: {metadata['xss_agent_msg']}\n"
-            context += f"SQL Injection Finding: {metadata['SQLi_agent_msg']}\n"
-            context += f"Payload Finding: {metadata['payload_agent_msg']}\n"
-            context += f"Threat Status: {'⚠️ Threat Detected' if metadata['threat_detected'] else 'No Threat Detected'}\n"
-            context += f"Security Note: {metadata['feedback']}\n"
-            context += "------\n"
-
-        prompt = f"""You are a specialized rag search engine. Your task is to answer the following query using only the provided security analysis records.
-
-        User Query: "{query}"
-
-        Security Analysis Records:
-        {context}
-
-        Using this information, generate a response that is concise, specific, and supports findings with direct quotes. Additionally, based on the response and information about malicious activity, include three actionable steps the user can take to handle this based on what the security analysis records say."""
-
-        chat_completion = groq_client.chat.completions.create(
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a security search engine assistant that provides evidence-based answers using only information from security analysis records. Always support findings with direct quotes."
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            model="mixtral-8x7b-32768",
+        chat_completion = await groq_client.chat.completions.create(
+            messages=rag_messages(query, search_results),
+            model=RAG_MODEL,
             temperature=0.1,
         )
         
@@ -267,4 +937,4 @@ async def getRAG(query: str, search_results: Dict[str, List]) -> str:
         
     except Exception as e:
         print(f"Error in getRAG: {str(e)}")
-        raise e
\ No newline at end of file
+        raise e
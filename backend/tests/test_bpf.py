@@ -0,0 +1,53 @@
+import pytest
+
+from utils import bpf
+from utils.bpf import merge_port_clauses, normalize_filter, prepare_filter
+
+
+@pytest.mark.parametrize(
+    "source, expected",
+    [
+        ("ip src != '0.0.0.0'", "not ip src host 0.0.0.0"),
+        ("ether src != aa:bb:cc:dd:ee:ff", "not ether src host aa:bb:cc:dd:ee:ff"),
+        ("ip src != 10.0.0.0/8", "not ip src net 10.0.0.0/8"),
+        ("tcp and ip dst == '192.168.1.5'", "tcp and ip dst host 192.168.1.5"),
+        ("src = 10.1.2.3 and ip6 dst == fe80::1", "src host 10.1.2.3 and ip6 dst host fe80::1"),
+        ("dst == 172.16.0.0/12", "dst net 172.16.0.0/12"),
+        ("tcp  and \\\n port 80", "tcp and port 80"),
+    ],
+)
+def test_normalize_filter(source, expected):
+    assert normalize_filter(source) == expected
+
+
+@pytest.mark.parametrize(
+    "source, expected",
+    [
+        ("tcp port 80 or tcp port 443 or tcp port 80", "tcp port 80 or 443"),
+        ("port 8000 or port 8001 or port 8002 or port 22", "port 22 or portrange 8000-8002"),
+        ("tcp and (dst port 80 or dst port 81 or dst port 82)", "tcp and (dst portrange 80-82)"),
+        ("tcp port 80 or 443", "tcp port 80 or 443"),
+        ("tcp port 80 or host 10.0.0.1", "tcp port 80 or host 10.0.0.1"),
+    ],
+)
+def test_merge_port_clauses(source, expected):
+    assert merge_port_clauses(source) == expected
+
+
+def test_prepare_filter_rewrites_before_compiling():
+    compiled = prepare_filter("tcp and ip src != 10.0.0.0/8 and (port 80 or port 81 or port 82)")
+    assert compiled.expression == "tcp and not ip src net 10.0.0.0/8 and (portrange 80-82)"
+    if bpf._libpcap is None:
+        assert not compiled.validated and compiled.valid
+    else:
+        assert compiled.validated and compiled.valid and compiled.instructions
+
+
+def test_prepare_filter_rejects_empty():
+    assert prepare_filter("  ").error == "empty filter"
+
+
+@pytest.mark.skipif(bpf._libpcap is None, reason="libpcap is not installed")
+def test_invalid_filter_reports_the_libpcap_error():
+    compiled = prepare_filter("tcp port")
+    assert not compiled.valid and compiled.error
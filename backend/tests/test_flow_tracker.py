@@ -0,0 +1,101 @@
+from utils.flow_tracker import SEQ_MOD, FlowTracker
+
+
+def segment(seq, flags="A", data=b"", sport=40000):
+    return {
+        "timestamp": 1.0,
+        "source_ip": "10.0.0.1",
+        "destination_ip": "10.0.0.2",
+        "transport_layer": {"protocol": "TCP", "source_port": sport, "destination_port": 80, "seq": seq, "flags": flags},
+        "payload": {"length": len(data), "data": data.decode("latin-1")},
+    }
+
+
+def messages(ready):
+    return [(ids, packet["payload"]["data"].encode("latin-1")) for ids, packet in ready if packet is not None]
+
+
+REQUEST = b"GET /?q=<script>alert(1)</script> HTTP/1.1\r\nHost: example.com\r\n\r\n"
+
+
+def test_in_order_request_is_emitted_once_complete():
+    tracker = FlowTracker()
+    assert tracker.add(segment(100, "S"), 0) == []
+    assert tracker.add(segment(101, "A", REQUEST[:20]), 1) == []
+    assert messages(tracker.add(segment(121, "PA", REQUEST[20:]), 2)) == [([0, 1, 2], REQUEST)]
+
+
+def test_out_of_order_halves_wait_for_the_gap():
+    tracker = FlowTracker()
+    tracker.add(segment(100, "S"), 0)
+    # the later half first, with PSH: it must not be emitted on its own
+    assert tracker.add(segment(101 + 12, "PA", REQUEST[12:]), 1) == []
+    assert messages(tracker.add(segment(101, "A", REQUEST[:12]), 2)) == [([0, 1, 2], REQUEST)]
+
+
+def test_retransmission_overlap_keeps_only_new_bytes():
+    tracker = FlowTracker()
+    tracker.add(segment(100, "S"), 0)
+    tracker.add(segment(101, "A", REQUEST[:30]), 1)
+    # resent 10 bytes already seen plus the rest
+    ready = tracker.add(segment(121, "PA", REQUEST[20:]), 2)
+    assert messages(ready) == [([0, 1, 2], REQUEST)]
+
+
+def test_sequence_numbers_wrap_around():
+    tracker = FlowTracker()
+    isn = SEQ_MOD - 11
+    tracker.add(segment(isn, "S"), 0)
+    tracker.add(segment(SEQ_MOD - 10, "A", REQUEST[:25]), 1)
+    ready = tracker.add(segment(15, "PA", REQUEST[25:]), 2)
+    assert messages(ready) == [([0, 1, 2], REQUEST)]
+
+
+def test_content_length_body_split_across_segments():
+    body = b"username=admin'--&password=x"
+    request = b"POST /login HTTP/1.1\r\nHost: example.com\r\nContent-Length: %d\r\n\r\n" % len(body) + body
+    tracker = FlowTracker()
+    tracker.add(segment(100, "S"), 0)
+    split = request.index(b"\r\n\r\n") + 4 + 5
+    # headers complete but the body isn't, so nothing yet even with PSH
+    assert tracker.add(segment(101, "PA", request[:split]), 1) == []
+    assert messages(tracker.add(segment(101 + split, "PA", request[split:]), 2)) == [([0, 1, 2], request)]
+
+
+def test_chunked_request_ends_at_the_last_chunk():
+    request = b"POST /api HTTP/1.1\r\nHost: example.com\r\nTransfer-Encoding: chunked\r\n\r\n5\r\nhello\r\n0\r\n\r\n"
+    tracker = FlowTracker()
+    tracker.add(segment(100, "S"), 0)
+    assert tracker.add(segment(101, "PA", request[:-6]), 1) == []
+    assert messages(tracker.add(segment(101 + len(request) - 6, "PA", request[-6:]), 2)) == [([0, 1, 2], request)]
+
+
+def test_non_http_payload_is_emitted_on_psh():
+    tracker = FlowTracker()
+    tracker.add(segment(100, "S"), 0)
+    assert tracker.add(segment(101, "A", b"\x16\x03\x01"), 1) == []
+    assert messages(tracker.add(segment(104, "PA", b"\x00\x10"), 2)) == [([0, 1, 2], b"\x16\x03\x01\x00\x10")]
+
+
+def test_ids_without_payload_are_answered():
+    tracker = FlowTracker()
+    # a pure ACK of a flow we never saw
+    assert tracker.add(segment(500, "A"), 0) == [([0], None)]
+    tracker.add(segment(100, "S", sport=40001), 1)
+    assert tracker.add(segment(101, "FA", sport=40001), 2) == [([1, 2], None)]
+
+
+def test_flow_is_flushed_past_the_per_flow_cap():
+    tracker = FlowTracker(max_flow_bytes=16)
+    tracker.add(segment(100, "S"), 0)
+    ready = tracker.add(segment(101, "A", b"x" * 20), 1)
+    assert [(ids, len(data)) for ids, data in messages(ready)] == [([0, 1], 16)]
+    assert ready[0][1]["flow"]["truncated"] is True
+
+
+def test_idle_flows_expire():
+    tracker = FlowTracker(idle_timeout=30)
+    tracker.add(segment(100, "S"), 0, now=0)
+    tracker.add(segment(101, "A", b"partial"), 1, now=1)
+    assert tracker.expire(now=10) == []
+    assert messages(tracker.expire(now=40)) == [([0, 1], b"partial")]
@@ -0,0 +1,59 @@
+"""Re-embed every stored analysis with the configured embedding backend.
+
+Needed after switching EMBEDDING_BACKEND/EMBEDDING_ONNX_FILE to a model whose vectors are not
+interchangeable with the ones in the collection (e.g. an int8 quantized export). Documents and
+metadata are kept, only the embeddings are rewritten, and the new backend is recorded on the
+collection so the server stops warning about the mismatch. Stop the server first.
+
+Run from the backend directory:
+
+    EMBEDDING_BACKEND=onnx EMBEDDING_ONNX_FILE=onnx/model_qint8_avx512.onnx python -m tools.reembed
+"""
+import argparse
+import sys
+import time
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chroma-path", default="./chroma")
+    parser.add_argument("--collection", default="collection")
+    parser.add_argument("--batch-size", type=int, default=256, help="records read, embedded and written at a time")
+    parser.add_argument("--force", action="store_true", help="re-embed even if the collection is already in this vector space")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    import chromadb
+    from utils.embedding import create_embedder, embedding_fingerprint, get_or_create_collection, same_vector_space
+
+    collection = get_or_create_collection(chromadb.PersistentClient(path=args.chroma_path), args.collection)
+    metadata = collection.metadata or {}
+    stored = metadata.get("embedding", embedding_fingerprint("torch"))
+    target = embedding_fingerprint()
+    if same_vector_space(stored, target) and not args.force:
+        print(f"collection already holds {stored} vectors, compatible with {target}; use --force to re-embed anyway")
+        return
+
+    embedder = create_embedder()
+    total = collection.count()
+    print(f"re-embedding {total} records: {stored} -> {target}", file=sys.stderr)
+    started = time.perf_counter()
+    done = 0
+    while done < total:
+        page = collection.get(include=["documents"], limit=args.batch_size, offset=done)
+        if not page["ids"]:
+            break
+        embeddings = embedder.encode(page["documents"], batch_size=min(args.batch_size, 64))
+        collection.update(ids=page["ids"], embeddings=embeddings.tolist())
+        done += len(page["ids"])
+        print(f"{done}/{total} ({done / (time.perf_counter() - started):.1f} records/s)", file=sys.stderr)
+
+    # hnsw settings can't be changed after creation, so they're left out of the update
+    collection.modify(metadata={**{k: v for k, v in metadata.items() if not k.startswith("hnsw:")}, "embedding": target})
+    print(f"re-embedded {done} records in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""Train the payload classifier used by payload_agent.
+
+Reads labelled payloads from pcaps (--benign/--malicious, repeatable) and/or an NDJSON file of
+{"label": 0|1, "packet": <packet record>} lines and fits a logistic regression on featurize().
+The threshold with the best F1 is picked on a validation split; precision/recall/F1/ROC AUC are
+reported on a separate test split that played no part in training or the threshold, along with
+the per-packet inference latency. The model is written to PAYLOAD_MODEL_PATH. Restart the server
+to pick it up; the verdict cache is keyed on the model, so cached verdicts of the old one are dropped.
+
+Run from the backend directory:
+
+    python -m tools.train_payload_model --benign normal.pcap --malicious attacks.pcap
+    python -m tools.train_payload_model --records labelled.ndjson --output ./models/payload_model.npz
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from typing import List, Tuple
+
+
+def parse_args():
+    from utils.payload_model import PAYLOAD_MODEL_PATH
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--benign", action="append", default=[], help="pcap of benign traffic")
+    parser.add_argument("--malicious", action="append", default=[], help="pcap of attack traffic")
+    parser.add_argument("--records", action="append", default=[], help="NDJSON of {label, packet} lines")
+    parser.add_argument("--validation-fraction", type=float, default=0.2, help="held out to pick the threshold")
+    parser.add_argument("--test-fraction", type=float, default=0.2, help="held out for the reported metrics")
+    parser.add_argument("--C", type=float, default=1.0, help="inverse regularization strength")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", default=PAYLOAD_MODEL_PATH)
+    return parser.parse_args()
+
+
+def load_examples(args) -> List[Tuple[bytes, int]]:
+    from benchmarks.analysis_bench import pcap_packets
+    from utils.packets import extract_payload
+
+    examples = []
+    for label, paths in ((0, args.benign), (1, args.malicious)):
+        for path in paths:
+            examples.extend((extract_payload(packet), label) for packet in pcap_packets(path))
+    for path in args.records:
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    examples.append((extract_payload(record["packet"]), int(record["label"])))
+
+    # empty payloads are never sent to the classifier, and repeated ones would leak across the split
+    unique = {}
+    for payload, label in examples:
+        if payload:
+            unique[payload] = max(label, unique.get(payload, 0))
+    return list(unique.items())
+
+
+def best_threshold(labels, scores) -> float:
+    from sklearn.metrics import precision_recall_curve
+
+    precision, recall, thresholds = precision_recall_curve(labels, scores)
+    f1 = 2 * precision[:-1] * recall[:-1] / (precision[:-1] + recall[:-1] + 1e-12)
+    return float(thresholds[f1.argmax()])
+
+
+def main():
+    args = parse_args()
+    import numpy as np
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.metrics import precision_recall_fscore_support, roc_auc_score
+    from benchmarks.analysis_bench import summarize
+    from utils.payload_model import N_HASHED, PayloadClassifier, featurize, standardize
+
+    examples = load_examples(args)
+    labels = [label for _, label in examples]
+    if len(set(labels)) < 2:
+        sys.exit("need both benign and malicious payloads to train on")
+    random.Random(args.seed).shuffle(examples)
+    test_size = max(1, int(len(examples) * args.test_fraction))
+    validation_size = max(1, int(len(examples) * args.validation_fraction))
+    test = examples[:test_size]
+    validation = examples[test_size:test_size + validation_size]
+    train = examples[test_size + validation_size:]
+    if not train:
+        sys.exit("not enough payloads left to train on, lower --validation-fraction/--test-fraction")
+    print(f"{len(examples)} unique payloads ({sum(labels)} malicious), training on {len(train)}", file=sys.stderr)
+
+    X_train = featurize([payload for payload, _ in train])
+    y_train = np.array([label for _, label in train])
+    mean = X_train[:, N_HASHED:].mean(axis=0)
+    std = X_train[:, N_HASHED:].std(axis=0)
+    model = PayloadClassifier(np.zeros(X_train.shape[1]), 0.0, mean, std)
+    fit = LogisticRegression(C=args.C, class_weight="balanced", max_iter=1000)
+    fit.fit(standardize(X_train, model.mean, model.std), y_train)
+    model.weights = fit.coef_[0].astype(np.float32)
+    model.bias = float(fit.intercept_[0])
+
+    y_validation = np.array([label for _, label in validation])
+    validation_scores = model.predict_proba([payload for payload, _ in validation])
+    model.threshold = best_threshold(y_validation, validation_scores) if len(set(y_validation)) > 1 else 0.5
+
+    # the test split is only looked at here, after the weights and the threshold are fixed
+    test_payloads = [payload for payload, _ in test]
+    y_test = np.array([label for _, label in test])
+    scores = model.predict_proba(test_payloads)
+    precision, recall, f1, _ = precision_recall_fscore_support(y_test, scores >= model.threshold, average="binary", zero_division=0)
+
+    latencies = []
+    for payload in test_payloads[:1000]:
+        started = time.perf_counter()
+        model.predict_proba([payload])
+        latencies.append(time.perf_counter() - started)
+    started = time.perf_counter()
+    model.predict_proba(test_payloads)
+    batch_seconds = time.perf_counter() - started
+
+    model.save(args.output, trained_at=time.time(), train_size=len(train))
+    print(json.dumps({
+        "output": args.output,
+        "train": len(train),
+        "validation": len(validation),
+        "test": len(test),
+        "threshold": model.threshold,
+        "precision": float(precision),
+        "recall": float(recall),
+        "f1": float(f1),
+        "roc_auc": float(roc_auc_score(y_test, scores)) if len(set(y_test)) > 1 else None,
+        "single_packet": summarize(latencies),
+        "batch_ms_per_packet": batch_seconds / len(test_payloads) * 1000,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
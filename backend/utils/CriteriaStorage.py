@@ -1,26 +1,189 @@
-from typing import List
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import List, Optional
 from utils.models import Criteria
 
+CRITERIA_DB_PATH = os.environ.get("CRITERIA_DB_PATH", "./criteria.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS criteria (
+    title TEXT NOT NULL UNIQUE,
+    description TEXT NOT NULL,
+    criteria TEXT NOT NULL,
+    scapy_str TEXT NOT NULL,
+    version INTEGER NOT NULL DEFAULT 1,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS criteria_history (
+    title TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    description TEXT NOT NULL,
+    criteria TEXT NOT NULL,
+    scapy_str TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (title, version)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def _row_to_criteria(row) -> Criteria:
+    title, description, criteria, scapy_str = row
+    return Criteria(title=title, description=description, criteria=json.loads(criteria), scapy_str=scapy_str)
+
+
 class CriteriaStorage:
+    """Criteria library kept in SQLite so it survives restarts and is shared by every server worker.
+
+    Rows are keyed by title, every change bumps that row's version and is kept in criteria_history.
+    get_criteria() serves a cached list until this or another process commits a change."""
+
     _instance = None
-    
+
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super().__new__(cls)
             cls._instance._initialized = False
         return cls._instance
-    
+
     def __init__(self):
         if not self._initialized:
-            from utils.existing_criteria import NETWORK_CRITERIA
-            self._criteria_list = NETWORK_CRITERIA
+            self._lock = threading.Lock()
+            # WAL lets readers in other workers carry on while one of them writes
+            self._conn = sqlite3.connect(CRITERIA_DB_PATH, timeout=30, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+            self._cache: Optional[List[Criteria]] = None
+            self._cache_version = None
+            self._seed()
             self._initialized = True
-    
+
+    @contextmanager
+    def _transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front, so concurrent workers queue instead of failing on upgrade
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield self._conn
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+    def _seed(self):
+        from utils.existing_criteria import NETWORK_CRITERIA
+
+        # seeds are written again (as new versions) only when their definitions in code change
+        seed_hash = hashlib.sha256(
+            json.dumps([c.model_dump() for c in NETWORK_CRITERIA], sort_keys=True).encode()
+        ).hexdigest()
+        with self._lock, self._transaction() as conn:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'seeded'").fetchone()
+            if row and row[0] == seed_hash:
+                return
+            for criteria in NETWORK_CRITERIA:
+                self._write(conn, criteria)
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('seeded', ?)", (seed_hash,))
+        self._cache = None
+
+    def _write(self, conn, criteria: Criteria) -> int:
+        """Insert or update one row and its history entry, returns the resulting version."""
+        body = json.dumps(criteria.criteria, sort_keys=True)
+        row = conn.execute(
+            "SELECT version, description, criteria, scapy_str FROM criteria WHERE title = ?", (criteria.title,)
+        ).fetchone()
+        if row is not None and row[1:] == (criteria.description, body, criteria.scapy_str):
+            return row[0]
+
+        now = time.time()
+        version = 1 if row is None else row[0] + 1
+        conn.execute(
+            """INSERT INTO criteria (title, description, criteria, scapy_str, version, updated_at)
+               VALUES (?, ?, ?, ?, 1, ?)
+               ON CONFLICT(title) DO UPDATE SET
+                 description = excluded.description, criteria = excluded.criteria,
+                 scapy_str = excluded.scapy_str, version = criteria.version + 1, updated_at = excluded.updated_at""",
+            (criteria.title, criteria.description, body, criteria.scapy_str, now),
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO criteria_history VALUES (?, ?, ?, ?, ?, ?)",
+            (criteria.title, version, criteria.description, body, criteria.scapy_str, now),
+        )
+        self._bump_revision(conn)
+        return version
+
+    def _bump_revision(self, conn):
+        conn.execute(
+            """INSERT INTO meta (key, value) VALUES ('revision', '1')
+               ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1"""
+        )
+
+    def _data_version(self) -> int:
+        # changes whenever another connection commits, our own writes drop the cache directly
+        return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def revision(self) -> int:
+        """Counter bumped by every change to the library, in any process."""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'revision'").fetchone()
+        return int(row[0]) if row else 0
+
     def get_criteria(self) -> List[Criteria]:
-        return self._criteria_list
-    
+        with self._lock:
+            version = self._data_version()
+            if self._cache is None or version != self._cache_version:
+                rows = self._conn.execute("SELECT title, description, criteria, scapy_str FROM criteria ORDER BY rowid")
+                self._cache = [_row_to_criteria(row) for row in rows]
+                self._cache_version = version
+            return list(self._cache)
+
+    def get_version(self, title: str) -> Optional[int]:
+        with self._lock:
+            row = self._conn.execute("SELECT version FROM criteria WHERE title = ?", (title,)).fetchone()
+        return row[0] if row else None
+
+    def get_by_title(self, title: str) -> Optional[Criteria]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT title, description, criteria, scapy_str FROM criteria WHERE title = ?", (title,)
+            ).fetchone()
+        return _row_to_criteria(row) if row else None
+
+    def history(self, title: str) -> List[dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT version, description, criteria, scapy_str, updated_at FROM criteria_history WHERE title = ? ORDER BY version",
+                (title,),
+            ).fetchall()
+        return [
+            {"version": v, "description": d, "criteria": json.loads(c), "scapy_str": s, "updated_at": t}
+            for v, d, c, s, t in rows
+        ]
+
+    def append_criteria(self, criteria: Criteria) -> int:
+        """Add a criteria, or a new version of it if the title exists. Returns its version."""
+        with self._lock, self._transaction() as conn:
+            version = self._write(conn, criteria)
+            self._cache = None
+        return version
+
     def update_criteria(self, new_criteria: List[Criteria]):
-        self._criteria_list = new_criteria
-        
-    def append_criteria(self, criteria: Criteria):
-        self._criteria_list.append(criteria)
\ No newline at end of file
+        """Replace the whole library. Prefer append_criteria, which only touches one row."""
+        with self._lock, self._transaction() as conn:
+            titles = [criteria.title for criteria in new_criteria]
+            for criteria in new_criteria:
+                self._write(conn, criteria)
+            deleted = conn.execute(
+                f"DELETE FROM criteria WHERE title NOT IN ({','.join('?' * len(titles))})", titles
+            ).rowcount
+            if deleted:
+                self._bump_revision(conn)
+            self._cache = None
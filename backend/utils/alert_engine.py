@@ -0,0 +1,291 @@
+import bisect
+import ipaddress
+import operator
+import re
+import socket
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from utils.models import Criteria
+from utils.packets import extract_payload, get_flow_fields
+
+WINDOW_UNITS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+COMPARATORS = {
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+    "=": operator.eq,
+    "==": operator.eq,
+    "!=": operator.ne,
+}
+# list names used in generated conditions that map onto a differently named criteria key
+LIST_ALIASES = {"common_ports": "ports"}
+TCP_FLAGS = {"fin": "F", "syn": "S", "rst": "R", "psh": "P", "ack": "A", "urg": "U", "ece": "E", "cwr": "C"}
+
+# a plain (non COUNT) condition alerts at most once per source per this many seconds
+SUPPRESS_WINDOW = 60.0
+
+_COUNT = re.compile(r"^COUNT\((?P<inner>.+)\)\s*(?P<op>>=|<=|==|!=|=|>|<)\s*(?P<limit>\d+)\s+per\s+(?P<unit>second|minute|hour|day)s?(?:\s+by\s+(?P<key>[\w.]+))?$", re.IGNORECASE)
+_MEMBERSHIP = re.compile(r"^(?P<field>[\w.]+)\s+(?P<negate>not\s+)?in\s+(?P<target>.+)$", re.IGNORECASE)
+_COMPARISON = re.compile(r"^(?P<field>[\w.]+)\s*(?P<op>>=|<=|==|!=|=|>|<)\s*(?P<value>.+)$")
+_STATUS_LINE = re.compile(rb"^HTTP/\d\.\d (\d{3})")
+
+
+class CidrIndex:
+    """Sorted, merged address intervals so a lookup is one bisect instead of a scan over every network."""
+
+    def __init__(self, networks: List[str]):
+        intervals = {4: [], 6: []}
+        for network in networks:
+            net = ipaddress.ip_network(str(network), strict=False)
+            intervals[net.version].append((int(net.network_address), int(net.broadcast_address)))
+        self._starts, self._ends = {}, {}
+        for version, ranges in intervals.items():
+            merged = []
+            for start, end in sorted(ranges):
+                if merged and start <= merged[-1][1] + 1:
+                    merged[-1][1] = max(merged[-1][1], end)
+                else:
+                    merged.append([start, end])
+            self._starts[version] = [start for start, _ in merged]
+            self._ends[version] = [end for _, end in merged]
+
+    def __contains__(self, address: Any) -> bool:
+        try:
+            ip = ipaddress.ip_address(str(address))
+        except ValueError:
+            return False
+        value = int(ip)
+        starts = self._starts[ip.version]
+        i = bisect.bisect_right(starts, value) - 1
+        return i >= 0 and value <= self._ends[ip.version][i]
+
+
+class SlidingWindowCounter:
+    """Per-key event counts over a sliding window, kept in a fixed ring of time buckets.
+
+    Memory is bounded by max_keys * buckets; the least recently seen key is dropped first."""
+
+    def __init__(self, window: float, buckets: int = 12, max_keys: int = 10000):
+        self.window = window
+        self.buckets = buckets
+        self.width = window / buckets
+        self.max_keys = max_keys
+        self._keys: "OrderedDict[Any, Tuple[List[int], List[int]]]" = OrderedDict()
+
+    def add(self, key: Any, now: float) -> int:
+        """Count one event for key and return the number of events in the window ending now."""
+        epoch = int(now / self.width)
+        slots = self._keys.get(key)
+        if slots is None:
+            slots = self._keys[key] = ([0] * self.buckets, [epoch] * self.buckets)
+            if len(self._keys) > self.max_keys:
+                self._keys.popitem(last=False)
+        else:
+            self._keys.move_to_end(key)
+        counts, epochs = slots
+        i = epoch % self.buckets
+        if epochs[i] != epoch:
+            counts[i], epochs[i] = 0, epoch
+        counts[i] += 1
+        oldest = epoch - self.buckets
+        return sum(count for count, bucket_epoch in zip(counts, epochs) if bucket_epoch > oldest)
+
+
+def _to_port(value: Any) -> Any:
+    if value is None or isinstance(value, int):
+        return value
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        pass
+    return _named_port(str(value))
+
+
+@lru_cache(maxsize=1024)
+def _named_port(name: str) -> Any:
+    try:
+        # scapy's text dump shows well known ports by name, e.g. dport = http; the lookup reads /etc/services
+        return socket.getservbyname(name)
+    except OSError:
+        return name
+
+
+def packet_view(packet: Dict[str, Any]) -> Dict[str, Any]:
+    """Flatten a packet (either shape) into the field names used by criteria track_fields and alert_conditions."""
+    fields = get_flow_fields(packet)
+    payload = extract_payload(packet)
+    flags = str(fields["flags"] or "")
+    declared = packet.get("payload") if isinstance(packet.get("payload"), dict) else {}
+    view = {
+        "timestamp": fields["timestamp"],
+        "source_ip": fields["source_ip"],
+        "destination_ip": fields["destination_ip"],
+        "transport_layer.protocol": fields["protocol"],
+        "transport_layer.source_port": _to_port(fields["source_port"]),
+        "transport_layer.destination_port": _to_port(fields["destination_port"]),
+        "transport_layer.flags": flags,
+        # records carry the full size even when the data itself was sliced
+        "payload.length": declared.get("length", len(payload)),
+        "packets": True,
+    }
+    for name, letter in TCP_FLAGS.items():
+        view[f"transport_layer.flags.{name}"] = fields["protocol"] == "TCP" and letter in flags
+    status = _STATUS_LINE.match(payload)
+    view["application_layer.status_code"] = int(status.group(1)) if status else None
+    if payload.startswith(b"HTTP/") or status or re.match(rb"^[A-Z]{3,7} \S+ HTTP/", payload):
+        view["application_layer.protocol"] = "HTTP"
+    else:
+        view["application_layer.protocol"] = None
+    # conditions often drop the transport_layer prefix
+    view["source_port"] = view["transport_layer.source_port"]
+    view["destination_port"] = view["transport_layer.destination_port"]
+    view["protocol"] = view["transport_layer.protocol"]
+    return view
+
+
+def _parse_value(text: str) -> Any:
+    text = text.strip()
+    if len(text) >= 2 and text[0] == text[-1] and text[0] in "'\"":
+        return text[1:-1]
+    try:
+        return int(text)
+    except ValueError:
+        pass
+    try:
+        return float(text)
+    except ValueError:
+        return text
+
+
+def _resolve_list(target: str, criteria: Dict[str, Any]) -> Any:
+    target = target.strip()
+    if target.startswith("[") and target.endswith("]"):
+        values = [_parse_value(item) for item in target[1:-1].split(",") if item.strip()]
+    else:
+        values = criteria.get(target, criteria.get(LIST_ALIASES.get(target, ""), None))
+        if values is None:
+            raise ValueError(f"unknown list '{target}'")
+    if values and all(isinstance(v, str) and "/" in v for v in values):
+        return CidrIndex(values)
+    return {_to_port(v) for v in values}
+
+
+def _compile_predicate(expr: str, criteria: Dict[str, Any]) -> Callable[[Dict[str, Any]], bool]:
+    expr = expr.strip()
+    match = _MEMBERSHIP.match(expr)
+    if match:
+        field, members = match.group("field"), _resolve_list(match.group("target"), criteria)
+        negate = bool(match.group("negate"))
+
+        def membership(view):
+            value = view.get(field)
+            if value is None:
+                return False
+            return (value not in members) if negate else (value in members)
+
+        return membership
+
+    match = _COMPARISON.match(expr)
+    if match:
+        field, compare, expected = match.group("field"), COMPARATORS[match.group("op")], _parse_value(match.group("value"))
+
+        def comparison(view):
+            value = view.get(field)
+            if value is None:
+                return False
+            try:
+                return compare(value, expected)
+            except TypeError:
+                return compare(str(value), str(expected))
+
+        return comparison
+
+    if re.fullmatch(r"[\w.]+", expr):
+        return lambda view: bool(view.get(expr))
+    raise ValueError(f"unsupported condition '{expr}'")
+
+
+class CompiledCondition:
+    def __init__(self, name: str, source: str, criteria: Dict[str, Any], max_keys: int = 10000, suppress_window: float = SUPPRESS_WINDOW):
+        self.name = name
+        self.source = source
+        self.suppress_window = suppress_window
+        self.counter: Optional[SlidingWindowCounter] = None
+        self._last_alert: "OrderedDict[Any, float]" = OrderedDict()
+        self._max_keys = max_keys
+
+        match = _COUNT.match(source.strip())
+        if match:
+            self.predicate = _compile_predicate(match.group("inner"), criteria)
+            self.compare = COMPARATORS[match.group("op")]
+            self.limit = int(match.group("limit"))
+            self.key_field = match.group("key")
+            self.counter = SlidingWindowCounter(WINDOW_UNITS[match.group("unit").lower()], max_keys=max_keys)
+        else:
+            self.predicate = _compile_predicate(source, criteria)
+
+    def evaluate(self, view: Dict[str, Any], now: float) -> Optional[Dict[str, Any]]:
+        if not self.predicate(view):
+            return None
+        if self.counter is None:
+            # every matching packet would otherwise be its own alert
+            if self._suppressed(view.get("source_ip"), now, self.suppress_window):
+                return None
+            return {"condition": self.name, "expression": self.source}
+
+        key = view.get(self.key_field) if self.key_field else "*"
+        count = self.counter.add(key, now)
+        if not self.compare(count, self.limit):
+            return None
+        # one alert per key per window instead of one per packet past the threshold
+        if self._suppressed(key, now, self.counter.window):
+            return None
+        alert = {"condition": self.name, "expression": self.source, "count": count}
+        if self.key_field:
+            alert[self.key_field] = key
+        return alert
+
+    def _suppressed(self, key: Any, now: float, window: float) -> bool:
+        """True if key already alerted within window, otherwise records this alert for it."""
+        last = self._last_alert.get(key)
+        if last is not None and now - last < window:
+            return True
+        self._last_alert[key] = now
+        self._last_alert.move_to_end(key)
+        if len(self._last_alert) > self._max_keys:
+            self._last_alert.popitem(last=False)
+        return False
+
+
+class AlertEngine:
+    """Evaluates a criteria's alert_conditions against every packet locally, without an LLM call."""
+
+    def __init__(self, criteria: Criteria, max_keys: int = 10000, suppress_window: float = SUPPRESS_WINDOW):
+        self.criteria = criteria
+        self.conditions: List[CompiledCondition] = []
+        self.errors: Dict[str, str] = {}
+        self.stats = {"packets": 0, "alerts": 0}
+        for name, source in (criteria.criteria.get("alert_conditions") or {}).items():
+            try:
+                self.conditions.append(CompiledCondition(name, str(source), criteria.criteria, max_keys, suppress_window))
+            except (ValueError, KeyError) as e:
+                print(f"could not compile alert condition {name!r}: {e}")
+                self.errors[name] = str(e)
+
+    def evaluate(self, packet: Dict[str, Any], now: Optional[float] = None) -> List[Dict[str, Any]]:
+        if not packet:
+            return []
+        view = packet_view(packet)
+        now = time.time() if now is None else now
+        self.stats["packets"] += 1
+        alerts = []
+        for condition in self.conditions:
+            alert = condition.evaluate(view, now)
+            if alert is not None:
+                alert.update(criteria=self.criteria.title, source_ip=view["source_ip"], timestamp=now)
+                alerts.append(alert)
+        self.stats["alerts"] += len(alerts)
+        return alerts
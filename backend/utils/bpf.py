@@ -0,0 +1,206 @@
+import ctypes
+import ctypes.util
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+# pcap_open_dead arguments: ethernet link type, same as the interfaces logger.py sniffs on
+DLT_EN10MB = 1
+SNAPLEN = 65535
+PCAP_NETMASK_UNKNOWN = 0xFFFFFFFF
+
+# consecutive ports from which a portrange is shorter than listing them
+PORTRANGE_MIN = 3
+
+# the protocol qualifier is part of the match so "not" can go in front of it, not between it and src/dst
+_NOT_EQUAL_HOST = re.compile(r"\b(?:(ether|ip6?|arp|rarp)\s+)?(src|dst)\s*!=\s*['\"]?([0-9a-fA-F.:]+(?:/\d+)?)['\"]?")
+_EQUAL_HOST = re.compile(r"\b(?:(ether|ip6?|arp|rarp)\s+)?(src|dst)\s*==?\s*['\"]?([0-9a-fA-F.:]+(?:/\d+)?)['\"]?")
+_PORT_TERM = re.compile(r"^(?:(tcp|udp|sctp)\s+)?(?:(src|dst)\s+)?port\s+(\d+)$")
+_INNER_GROUP = re.compile(r"\(([^()]*)\)")
+
+
+class _BpfInsn(ctypes.Structure):
+    _fields_ = [("code", ctypes.c_ushort), ("jt", ctypes.c_ubyte), ("jf", ctypes.c_ubyte), ("k", ctypes.c_uint32)]
+
+
+class _BpfProgram(ctypes.Structure):
+    _fields_ = [("bf_len", ctypes.c_uint), ("bf_insns", ctypes.POINTER(_BpfInsn))]
+
+
+def _load_libpcap():
+    path = ctypes.util.find_library("pcap") or ctypes.util.find_library("wpcap")
+    if path is None:
+        return None
+    try:
+        lib = ctypes.CDLL(path)
+    except OSError:
+        return None
+    lib.pcap_open_dead.restype = ctypes.c_void_p
+    lib.pcap_open_dead.argtypes = [ctypes.c_int, ctypes.c_int]
+    lib.pcap_compile.restype = ctypes.c_int
+    lib.pcap_compile.argtypes = [ctypes.c_void_p, ctypes.POINTER(_BpfProgram), ctypes.c_char_p, ctypes.c_int, ctypes.c_uint32]
+    lib.pcap_geterr.restype = ctypes.c_char_p
+    lib.pcap_geterr.argtypes = [ctypes.c_void_p]
+    lib.pcap_freecode.argtypes = [ctypes.POINTER(_BpfProgram)]
+    lib.pcap_close.argtypes = [ctypes.c_void_p]
+    return lib
+
+
+_libpcap = _load_libpcap()
+# pcap_compile is not thread safe before libpcap 1.8
+_compile_lock = threading.Lock()
+
+
+class CompiledFilter:
+    def __init__(self, expression: str, source: str, instructions: Optional[List[Tuple[int, int, int, int]]], error: Optional[str]):
+        self.expression = expression
+        self.source = source
+        self.instructions = instructions
+        self.error = error
+
+    @property
+    def valid(self) -> bool:
+        return self.error is None
+
+    @property
+    def validated(self) -> bool:
+        """False when libpcap isn't available and the expression could only be rewritten, not compiled."""
+        return self.instructions is not None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "expression": self.expression,
+            "source": self.source,
+            "valid": self.valid,
+            "validated": self.validated,
+            "error": self.error,
+            "instruction_count": len(self.instructions) if self.instructions is not None else None,
+            "instructions": self.instructions,
+        }
+
+
+def _address_primitive(match) -> str:
+    qualifier, direction, value = match.groups()
+    # a CIDR value is a net, "host" doesn't take a mask
+    kind = "net" if "/" in value else "host"
+    return " ".join(part for part in (qualifier, direction, kind, value) if part)
+
+
+def normalize_filter(expression: str) -> str:
+    """Rewrite comparison idioms the LLM likes (ip src != '0.0.0.0') into BPF primitives and collapse whitespace."""
+    expression = expression.replace("\\\n", " ")
+    expression = _NOT_EQUAL_HOST.sub(lambda m: f"not {_address_primitive(m)}", expression)
+    expression = _EQUAL_HOST.sub(_address_primitive, expression)
+    return " ".join(expression.split())
+
+
+def _merge_ports(terms: List[str]) -> Optional[str]:
+    """Merge a disjunction of port primitives, or None if any term is something else."""
+    groups: "OrderedDict[Tuple[str, str], set]" = OrderedDict()
+    qualifiers = None
+    for term in terms:
+        match = _PORT_TERM.match(term)
+        if match:
+            qualifiers = (match.group(1) or "", match.group(2) or "")
+            port = int(match.group(3))
+        elif term.isdigit() and qualifiers is not None:
+            # bare value inheriting the previous qualifiers, e.g. "tcp port 80 or 443"
+            port = int(term)
+        else:
+            return None
+        groups.setdefault(qualifiers, set()).add(port)
+
+    clauses = []
+    for (proto, direction), ports in groups.items():
+        prefix = " ".join(part for part in (proto, direction) if part)
+        prefix = f"{prefix} " if prefix else ""
+        ports = sorted(ports)
+        singles, ranges = [], []
+        start = 0
+        for i in range(1, len(ports) + 1):
+            if i == len(ports) or ports[i] != ports[i - 1] + 1:
+                run = ports[start:i]
+                if len(run) >= PORTRANGE_MIN:
+                    ranges.append(f"{prefix}portrange {run[0]}-{run[-1]}")
+                else:
+                    singles.extend(run)
+                start = i
+        if singles:
+            # identical qualifiers may be omitted after the first value, see pcap-filter(7)
+            clauses.append(f"{prefix}port " + " or ".join(str(port) for port in singles))
+        clauses.extend(ranges)
+    return " or ".join(clauses)
+
+
+def merge_port_clauses(expression: str) -> str:
+    """Deduplicate and merge port clauses inside every parenthesized disjunction and at the top level."""
+
+    def merge_group(match):
+        merged = _merge_ports([term.strip() for term in re.split(r"\s+or\s+", match.group(1).strip())])
+        return f"({merged})" if merged is not None else match.group(0)
+
+    expression = _INNER_GROUP.sub(merge_group, expression)
+    if "(" not in expression:
+        merged = _merge_ports([term.strip() for term in re.split(r"\s+or\s+", expression.strip())])
+        if merged is not None:
+            return merged
+    return expression
+
+
+def compile_bpf(expression: str, linktype: int = DLT_EN10MB) -> Tuple[Optional[List[Tuple[int, int, int, int]]], Optional[str]]:
+    """Compile with libpcap's optimizer. Returns (instructions, error); instructions is None without libpcap."""
+    if _libpcap is None:
+        return None, None
+    with _compile_lock:
+        handle = _libpcap.pcap_open_dead(linktype, SNAPLEN)
+        if not handle:
+            return None, "pcap_open_dead failed"
+        program = _BpfProgram()
+        try:
+            if _libpcap.pcap_compile(handle, ctypes.byref(program), expression.encode(), 1, PCAP_NETMASK_UNKNOWN) != 0:
+                return None, (_libpcap.pcap_geterr(handle) or b"invalid filter").decode(errors="replace")
+            instructions = [
+                (insn.code, insn.jt, insn.jf, insn.k) for insn in program.bf_insns[: program.bf_len]
+            ]
+            _libpcap.pcap_freecode(ctypes.byref(program))
+            return instructions, None
+        finally:
+            _libpcap.pcap_close(handle)
+
+
+def prepare_filter(source: str) -> CompiledFilter:
+    """Normalize, merge port clauses and compile a scapy_str."""
+    expression = merge_port_clauses(normalize_filter(source))
+    if not expression:
+        return CompiledFilter(expression, source, None, "empty filter")
+    instructions, error = compile_bpf(expression)
+    return CompiledFilter(expression, source, instructions, error)
+
+
+class FilterCache:
+    """Compiled filters per criteria title and version, so a criteria's scapy_str is compiled once."""
+
+    def __init__(self, max_size: int = 256):
+        self.max_size = max_size
+        self._entries: "OrderedDict[Tuple[str, int, str], CompiledFilter]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, title: str, version: int, source: str) -> CompiledFilter:
+        # the source hash guards against a criteria edited without a version bump
+        key = (title, version, hashlib.sha256(source.encode()).hexdigest())
+        with self._lock:
+            compiled = self._entries.get(key)
+            if compiled is not None:
+                self._entries.move_to_end(key)
+                return compiled
+        compiled = prepare_filter(source)
+        with self._lock:
+            self._entries[key] = compiled
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return compiled
+
+
+filter_cache = FilterCache()
@@ -6,8 +6,31 @@ from langchain_groq import ChatGroq
 load_dotenv()
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 
+# set NETSENTRY_STUB_LLM=1 to replace Groq with the local deterministic stub (benchmarks, offline runs)
+USE_STUB_LLM = os.getenv("NETSENTRY_STUB_LLM", "") not in ("", "0")
+
+def create_stub_llm(model: str):
+    from utils.stub_llm import StubChatModel
+
+    return StubChatModel(
+        model_name=f"stub-{model}",
+        latency=float(os.getenv("NETSENTRY_STUB_LLM_LATENCY_MS", "0")) / 1000,
+        positive_rate=float(os.getenv("NETSENTRY_STUB_LLM_POSITIVE_RATE", "0")),
+    )
+
+LLM_MODEL = "llama3-8b-8192"
+REASONING_LLM_MODEL = "deepseek-3b-8k"
+
+def model_name(model: str) -> str:
+    """The model_name create_llm()/create_deepseek_llm() end up with, without building the client."""
+    return f"stub-{model}" if USE_STUB_LLM else model
+
 def create_llm():
-    return ChatGroq(model="llama3-8b-8192")
+    if USE_STUB_LLM:
+        return create_stub_llm(LLM_MODEL)
+    return ChatGroq(model=LLM_MODEL)
 
 def create_deepseek_llm():
-    return ChatGroq(model="deepseek-3b-8k")
\ No newline at end of file
+    if USE_STUB_LLM:
+        return create_stub_llm(REASONING_LLM_MODEL)
+    return ChatGroq(model=REASONING_LLM_MODEL)
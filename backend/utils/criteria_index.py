@@ -0,0 +1,70 @@
+import hashlib
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from utils.embedding import get_embedder
+from utils.models import Criteria
+
+# how many criteria the LLM gets to choose from
+CRITERIA_SHORTLIST_K = int(os.environ.get("CRITERIA_SHORTLIST_K", 5))
+# cosine similarity above which the best match is taken without asking the LLM
+CRITERIA_MATCH_THRESHOLD = float(os.environ.get("CRITERIA_MATCH_THRESHOLD", 0.6))
+# ... as long as it is this far ahead of the runner-up
+CRITERIA_MATCH_MARGIN = float(os.environ.get("CRITERIA_MATCH_MARGIN", 0.05))
+
+
+def criteria_text(criteria: Criteria) -> str:
+    return f"{criteria.title.replace('_', ' ')}\n{criteria.description}"
+
+
+class CriteriaIndex:
+    """Normalized embeddings of criteria titles and descriptions.
+
+    Only criteria that are new or whose text changed get embedded, so keeping the index
+    in sync with CriteriaStorage costs one encode per appended criteria."""
+
+    def __init__(self):
+        self._vectors: Dict[str, np.ndarray] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, criteria: Criteria) -> str:
+        return hashlib.sha256(criteria_text(criteria).encode()).hexdigest()
+
+    def sync(self, criteria_list: List[Criteria]) -> np.ndarray:
+        keys = [self._key(criteria) for criteria in criteria_list]
+        with self._lock:
+            missing = [(key, criteria) for key, criteria in zip(keys, criteria_list) if key not in self._vectors]
+            if missing:
+                vectors = get_embedder().encode([criteria_text(c) for _, c in missing], normalize_embeddings=True)
+                for (key, _), vector in zip(missing, vectors):
+                    self._vectors[key] = vector
+            # forget criteria that were replaced or removed
+            live = set(keys)
+            for key in [key for key in self._vectors if key not in live]:
+                del self._vectors[key]
+            return np.stack([self._vectors[key] for key in keys])
+
+    def shortlist(self, criteria_list: List[Criteria], description: str, k: int = CRITERIA_SHORTLIST_K) -> List[Tuple[float, Criteria]]:
+        """The k criteria closest to the description, best first, with their cosine similarity."""
+        if not criteria_list:
+            return []
+        matrix = self.sync(criteria_list)
+        query = get_embedder().encode(description, normalize_embeddings=True)
+        scores = matrix @ query
+        top = np.argsort(-scores)[:k]
+        return [(float(scores[i]), criteria_list[i]) for i in top]
+
+
+def confident_match(shortlist: List[Tuple[float, Criteria]]) -> Optional[Criteria]:
+    """The top criteria if it clears the threshold and its margin over the runner-up, otherwise None."""
+    if not shortlist:
+        return None
+    best_score, best = shortlist[0]
+    runner_up = shortlist[1][0] if len(shortlist) > 1 else -1.0
+    if best_score >= CRITERIA_MATCH_THRESHOLD and best_score - runner_up >= CRITERIA_MATCH_MARGIN:
+        return best
+    return None
+
+
+criteria_index = CriteriaIndex()
@@ -0,0 +1,183 @@
+import asyncio
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+
+SUFFIX = ".mmd"
+
+
+def prompt_version(*parts: str) -> str:
+    """Hash of the diagram prompt and model; a prompt change gives every solution a new key."""
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+class DiagramCache:
+    """Content addressed store of validated Mermaid diagrams, keyed by the solution text and prompt version.
+
+    Diagrams are kept as one file per key in directory (the least recently used are deleted past
+    max_entries) with an in-memory LRU in front. Identical requests that arrive while a diagram is
+    being generated wait for that one LLM call instead of starting their own. The call runs in its
+    own task and is awaited through asyncio.shield, so a client that disconnects doesn't abort it
+    for the others."""
+
+    def __init__(self, directory: Optional[str] = None, max_entries: int = 512, version: str = ""):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        # key -> diagram, or None when it is only on disk
+        self._entries: "OrderedDict[str, Optional[str]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        # generation tasks, referenced here so they aren't garbage collected while running
+        self._tasks: Set[asyncio.Task] = set()
+        self._lock = threading.Lock()
+        if directory:
+            self.load()
+
+    def key(self, solution: str) -> str:
+        return hashlib.sha256(f"{self.version}\0{solution}".encode("utf-8", errors="replace")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + SUFFIX)
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            diagram = self._entries[key]
+            self._entries.move_to_end(key)
+        if diagram is None:
+            try:
+                with open(self._path(key)) as f:
+                    diagram = f.read()
+                os.utime(self._path(key))
+            except OSError:
+                with self._lock:
+                    self._entries.pop(key, None)
+                    self.misses += 1
+                return None
+            with self._lock:
+                if key in self._entries:
+                    self._entries[key] = diagram
+        with self._lock:
+            self.hits += 1
+        return diagram
+
+    def put(self, key: str, diagram: str):
+        if self.directory:
+            tmp_path = self._path(key) + ".tmp"
+            with open(tmp_path, "w") as f:
+                f.write(diagram)
+            os.replace(tmp_path, self._path(key))
+        with self._lock:
+            self._entries[key] = diagram
+            self._entries.move_to_end(key)
+            evicted = []
+            while len(self._entries) > self.max_entries:
+                evicted.append(self._entries.popitem(last=False)[0])
+        for old_key in evicted:
+            if self.directory:
+                try:
+                    os.remove(self._path(old_key))
+                except OSError:
+                    pass
+
+    def begin(self, key: str) -> Tuple[bool, asyncio.Future]:
+        """Join the in-flight generation of key. The first caller is the leader and has to spawn() the work.
+
+        Await the future through asyncio.shield: it is shared, and a cancelled waiter must not cancel it."""
+        future = self._inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return False, future
+        future = asyncio.get_running_loop().create_future()
+        # followers retrieve the exception; without one waiting nobody would
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[key] = future
+        return True, future
+
+    def spawn(self, key: str, work: Awaitable[str]) -> asyncio.Task:
+        """Run the leader's work in a task of its own and finish key with the result."""
+
+        async def run():
+            try:
+                diagram = await work
+            except asyncio.CancelledError:
+                self.finish(key, error=RuntimeError("diagram generation was cancelled"))
+                raise
+            except Exception as e:
+                self.finish(key, error=e)
+                return
+            self.finish(key, diagram)
+
+        task = asyncio.get_running_loop().create_task(run())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def finish(self, key: str, diagram: Optional[str] = None, error: Optional[BaseException] = None):
+        future = self._inflight.pop(key, None)
+        if future is not None and not future.done():
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(diagram)
+        if error is None and diagram is not None:
+            try:
+                self.put(key, diagram)
+            except OSError as e:
+                print(f"could not cache diagram {key[:12]}: {e}")
+
+    async def get_or_create(self, solution: str, produce: Callable[[], Awaitable[str]]) -> Tuple[str, str]:
+        """The diagram for solution and where it came from: "cache", "coalesced" or "generated"."""
+        key = self.key(solution)
+        diagram = self.get(key)
+        if diagram is not None:
+            return diagram, "cache"
+        leader, future = self.begin(key)
+        if leader:
+            self.spawn(key, produce())
+        return await asyncio.shield(future), "generated" if leader else "coalesced"
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._inflight),
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def load(self):
+        """Index the diagrams already on disk, most recently used last."""
+        os.makedirs(self.directory, exist_ok=True)
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith(SUFFIX):
+                path = os.path.join(self.directory, name)
+                files.append((os.path.getmtime(path), name[: -len(SUFFIX)]))
+        files.sort()
+        stale = files[: max(0, len(files) - self.max_entries)]
+        for _, key in stale:
+            os.remove(self._path(key))
+        with self._lock:
+            for _, key in files[len(stale):]:
+                self._entries[key] = None
+        print(f"indexed {len(self._entries)} cached diagrams in {self.directory}")
+
+
+def create_diagram_cache(version: str) -> DiagramCache:
+    return DiagramCache(
+        directory=os.environ.get("DIAGRAM_CACHE_DIR", "./diagram_cache"),
+        max_entries=int(os.environ.get("DIAGRAM_CACHE_SIZE", 512)),
+        version=version,
+    )
@@ -0,0 +1,202 @@
+import os
+import threading
+import time
+from typing import Any, List, Optional, Union
+import numpy as np
+
+EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+# "torch" runs the SentenceTransformer, "onnx" the exported model on onnxruntime
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "torch")
+# a local directory or a hub repo holding tokenizer.json and the exported model
+EMBEDDING_ONNX_PATH = os.environ.get("EMBEDDING_ONNX_PATH", f"sentence-transformers/{EMBEDDING_MODEL}")
+# onnx/model_qint8_avx512.onnx etc. for the int8 quantized exports
+EMBEDDING_ONNX_FILE = os.environ.get("EMBEDDING_ONNX_FILE", "onnx/model.onnx")
+# same as the SentenceTransformer's max_seq_length for MiniLM
+EMBEDDING_MAX_LENGTH = int(os.environ.get("EMBEDDING_MAX_LENGTH", 256))
+EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", 32))
+# how long concurrent encode() calls wait to share one batch, 0 turns coalescing off
+EMBEDDING_BATCH_WAIT_MS = float(os.environ.get("EMBEDDING_BATCH_WAIT_MS", 0))
+
+_embedder = None
+_lock = threading.Lock()
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class OnnxEmbedder:
+    """all-MiniLM-L6-v2 (or any mean pooled, normalized sentence-transformers model) on onnxruntime.
+
+    Mirrors SentenceTransformer.encode: mean pooling over the attention mask followed by L2
+    normalization, so the fp32 export gives the same vectors as the torch model (to ~1e-6) and the
+    existing collection stays valid. The int8 exports drift slightly; re-embed with tools/reembed.py."""
+
+    def __init__(self, path: str, file: str, max_length: int = 256, batch_size: int = 32):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        if not os.path.isdir(path):
+            from huggingface_hub import snapshot_download
+
+            path = snapshot_download(path, allow_patterns=["tokenizer.json", file])
+        self.tokenizer = Tokenizer.from_file(os.path.join(path, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding()
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(os.path.join(path, file), options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.batch_size = batch_size
+
+    def _encode_batch(self, sentences: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(sentences)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+        token_embeddings = self.session.run(None, feeds)[0]
+        mask = attention_mask[:, :, None].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        return _normalize(pooled)
+
+    def encode(self, sentences: Union[str, List[str]], batch_size: Optional[int] = None, normalize_embeddings: bool = False, **kwargs) -> np.ndarray:
+        single = isinstance(sentences, str)
+        sentences = [sentences] if single else list(sentences)
+        if not sentences:
+            dimension = self.session.get_outputs()[0].shape[-1]
+            return np.zeros((0, dimension if isinstance(dimension, int) else 0), dtype=np.float32)
+        batch_size = batch_size or self.batch_size
+        # longest first so every batch pads to similar lengths, like SentenceTransformer does
+        order = sorted(range(len(sentences)), key=lambda i: -len(sentences[i]))
+        vectors = np.empty((len(sentences), 0), dtype=np.float32)
+        for start in range(0, len(order), batch_size):
+            chunk = order[start:start + batch_size]
+            batch = self._encode_batch([sentences[i] for i in chunk])
+            if vectors.shape[1] == 0:
+                vectors = np.empty((len(sentences), batch.shape[1]), dtype=np.float32)
+            vectors[chunk] = batch
+        return vectors[0] if single else vectors
+
+
+class _Pending:
+    def __init__(self, sentences: List[str], normalize: bool):
+        self.sentences = sentences
+        self.normalize = normalize
+        self.result: Optional[np.ndarray] = None
+        self.error: Optional[BaseException] = None
+        self.done = threading.Event()
+
+
+class BatchingEmbedder:
+    """Coalesces concurrent encode() calls (e.g. /search queries on different executor threads)
+    into one batch for the wrapped embedder, waiting at most max_wait for company."""
+
+    def __init__(self, embedder, max_batch: int = 64, max_wait: float = 0.002):
+        self.embedder = embedder
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue: List[_Pending] = []
+        self._cond = threading.Condition()
+        threading.Thread(target=self._run, name="embedding-batcher", daemon=True).start()
+
+    def __getattr__(self, attr: str) -> Any:
+        # get_sentence_embedding_dimension() and friends
+        return getattr(self.embedder, attr)
+
+    def encode(self, sentences: Union[str, List[str]], normalize_embeddings: bool = False, **kwargs) -> np.ndarray:
+        single = isinstance(sentences, str)
+        pending = _Pending([sentences] if single else list(sentences), normalize_embeddings)
+        if not pending.sentences:
+            return self.embedder.encode([], **kwargs)
+        with self._cond:
+            self._queue.append(pending)
+            self._cond.notify()
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.result[0] if single else pending.result
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                deadline = time.monotonic() + self.max_wait
+                while sum(len(p.sentences) for p in self._queue) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch, size = [], 0
+                while self._queue and (not batch or size + len(self._queue[0].sentences) <= self.max_batch):
+                    size += len(self._queue[0].sentences)
+                    batch.append(self._queue.pop(0))
+            try:
+                vectors = np.asarray(self.embedder.encode([s for p in batch for s in p.sentences]))
+                offset = 0
+                for p in batch:
+                    p.result = vectors[offset:offset + len(p.sentences)]
+                    if p.normalize:
+                        p.result = _normalize(p.result)
+                    offset += len(p.sentences)
+            except Exception as e:
+                for p in batch:
+                    p.error = e
+            for p in batch:
+                p.done.set()
+
+
+def create_embedder(backend: str = EMBEDDING_BACKEND):
+    if backend == "onnx":
+        embedder = OnnxEmbedder(EMBEDDING_ONNX_PATH, EMBEDDING_ONNX_FILE, EMBEDDING_MAX_LENGTH, EMBEDDING_BATCH_SIZE)
+    elif backend == "torch":
+        from sentence_transformers import SentenceTransformer
+
+        embedder = SentenceTransformer(EMBEDDING_MODEL)
+    else:
+        raise ValueError(f"unknown EMBEDDING_BACKEND {backend!r}, expected torch or onnx")
+    if EMBEDDING_BATCH_WAIT_MS > 0:
+        embedder = BatchingEmbedder(embedder, max_batch=EMBEDDING_BATCH_SIZE, max_wait=EMBEDDING_BATCH_WAIT_MS / 1000)
+    return embedder
+
+
+def embedding_fingerprint(backend: str = EMBEDDING_BACKEND) -> str:
+    """Identifies the vectors the configured embedder produces; tools/reembed.py stores it on the collection."""
+    if backend == "onnx":
+        return f"onnx:{EMBEDDING_MODEL}:{EMBEDDING_ONNX_FILE}"
+    return f"torch:{EMBEDDING_MODEL}"
+
+
+def get_or_create_collection(client, name: str, backend: str = EMBEDDING_BACKEND):
+    """The named collection; a new one is labelled with the embedder's fingerprint before anything is
+    written, so readers don't take its vectors for the torch ones an unlabelled collection holds."""
+    collection = client.get_or_create_collection(name=name)
+    metadata = collection.metadata or {}
+    # labelled only while empty: a filled, unlabelled collection predates the label and holds torch vectors
+    if "embedding" not in metadata and not collection.count():
+        # hnsw settings can't be changed after creation, so they're left out of the update
+        collection.modify(metadata={**{k: v for k, v in metadata.items() if not k.startswith("hnsw:")}, "embedding": embedding_fingerprint(backend)})
+    return collection
+
+
+def same_vector_space(stored: str, configured: str) -> bool:
+    # the fp32 onnx export reproduces the torch vectors, the quantized ones don't
+    def space(fingerprint: str) -> str:
+        backend, _, rest = fingerprint.partition(":")
+        model, _, file = rest.partition(":")
+        return f"torch:{model}" if backend == "onnx" and file == "onnx/model.onnx" else fingerprint
+
+    return space(stored) == space(configured)
+
+
+def get_embedder():
+    """The embedder shared by /store, /search and the criteria index, loaded on first use."""
+    global _embedder
+    if _embedder is None:
+        with _lock:
+            if _embedder is None:
+                _embedder = create_embedder()
+    return _embedder
@@ -38,7 +38,7 @@ NETWORK_CRITERIA = [
             },
         },
         scapy_str="(ip src net 10.0.0.0/8 or ip src net 172.16.0.0/12 or ip src net 192.168.0.0/16) and \
-                  (tcp port 3306 or tcp port 5432 or tcp port 6379 or tcp port 27017 or tcp port 8080 or tcp port 443)",
+(tcp port 443 or 3306 or 5432 or 6379 or 8080 or 27017)",
     ),
     Criteria(
         title="web_application",
@@ -67,7 +67,7 @@ NETWORK_CRITERIA = [
                 "error_rate": "COUNT(application_layer.status_code >= 400) > 100 per minute",
             },
         },
-        scapy_str="(ip src != '0.0.0.0') and (tcp port 80 or tcp port 443 or tcp port 8080 or tcp port 8443)",
+        scapy_str="(not ip src host 0.0.0.0) and (tcp port 80 or 443 or 8080 or 8443)",
     ),
     Criteria(
         title="general_usage",
@@ -101,7 +101,6 @@ NETWORK_CRITERIA = [
                 "suspicious_dns": "COUNT(destination_port = 53) > 100 per minute",
             },
         },
-        scapy_str="(ip src != '0.0.0.0') and (tcp port 80 or tcp port 443 or tcp port 53 or tcp port 25 or tcp port 110 or \
-                  tcp port 143 or tcp port 587 or tcp port 993 or tcp port 995 or udp port 53)",
+        scapy_str="(not ip src host 0.0.0.0) and (tcp port 25 or 53 or 80 or 110 or 143 or 443 or 587 or 993 or 995 or udp port 53)",
     ),
 ]
@@ -0,0 +1,203 @@
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from utils.packets import extract_payload, get_flow_fields
+
+SEQ_MOD = 1 << 32
+
+_HTTP_REQUEST = re.compile(rb"^(?:GET|POST|PUT|PATCH|DELETE|HEAD|OPTIONS|CONNECT|TRACE) ")
+_CONTENT_LENGTH = re.compile(rb"\r?\ncontent-length:\s*(\d+)", re.IGNORECASE)
+_CHUNKED = re.compile(rb"\r?\ntransfer-encoding:[^\r\n]*chunked", re.IGNORECASE)
+
+
+def _seq_delta(seq: int, expected: int) -> int:
+    """Signed distance from expected to seq, allowing for 32-bit wraparound."""
+    delta = (seq - expected) % SEQ_MOD
+    return delta - SEQ_MOD if delta >= SEQ_MOD // 2 else delta
+
+
+def _http_message_length(buffer: bytes) -> Optional[int]:
+    """Length of the first complete HTTP request in buffer, or None if it isn't complete yet."""
+    header_end = buffer.find(b"\r\n\r\n")
+    if header_end < 0:
+        return None
+    body_start = header_end + 4
+    headers = buffer[:header_end]
+    if _CHUNKED.search(headers):
+        end = buffer.find(b"\r\n0\r\n\r\n", header_end)
+        return end + 7 if end >= 0 else None
+    match = _CONTENT_LENGTH.search(headers)
+    length = body_start + (int(match.group(1)) if match else 0)
+    return length if len(buffer) >= length else None
+
+
+class Flow:
+    def __init__(self, fields: Dict[str, Any], now: float):
+        self.fields = fields
+        self.next_seq: Optional[int] = None
+        self.buffer = bytearray()
+        self.out_of_order: Dict[int, bytes] = {}
+        self.packet_ids: List[Any] = []
+        self.segments = 0
+        self.truncated = False
+        self.last_seen = now
+
+    @property
+    def size(self) -> int:
+        return len(self.buffer) + sum(len(data) for data in self.out_of_order.values())
+
+
+class FlowTracker:
+    """Reassembles TCP payloads per 5-tuple so one application message is analysed instead of every segment.
+
+    HTTP requests are emitted once headers and body are complete. Other protocols are
+    emitted on PSH/FIN/RST. Flows are flushed when idle, and flows or buffers past the
+    memory caps are flushed early (oldest first)."""
+
+    def __init__(
+        self,
+        idle_timeout: float = 30.0,
+        max_flow_bytes: int = 64 * 1024,
+        max_total_bytes: int = 32 * 1024 * 1024,
+        max_flows: int = 10000,
+    ):
+        self.idle_timeout = idle_timeout
+        self.max_flow_bytes = max_flow_bytes
+        self.max_total_bytes = max_total_bytes
+        self.max_flows = max_flows
+        self.flows: "OrderedDict[Tuple, Flow]" = OrderedDict()
+        self.total_bytes = 0
+        self.stats = {"segments": 0, "messages": 0, "evicted": 0, "expired": 0}
+
+    def add(self, packet: Dict[str, Any], packet_id: Any = None, now: Optional[float] = None) -> List[Tuple[List[Any], Optional[Dict[str, Any]]]]:
+        """Feed one captured packet. Returns (packet ids, packet) pairs that are ready for analysis;
+        packet is None for ids that carried nothing to analyse (pure ACKs, handshakes of empty flows)."""
+        now = time.time() if now is None else now
+        fields = get_flow_fields(packet)
+        if fields["protocol"] != "TCP" or fields["seq"] is None:
+            # nothing to reassemble, analyse as is
+            return [([packet_id], packet)]
+
+        self.stats["segments"] += 1
+        key = (fields["source_ip"], fields["source_port"], fields["destination_ip"], fields["destination_port"], "TCP")
+        payload = extract_payload(packet)
+        flags = str(fields["flags"])
+
+        flow = self.flows.get(key)
+        if flow is None:
+            if not payload and not any(flag in flags for flag in "SFR"):
+                return [([packet_id], None)]
+            flow = self.flows[key] = Flow(fields, now)
+        self.flows.move_to_end(key)
+        flow.last_seen = now
+        flow.packet_ids.append(packet_id)
+
+        seq = fields["seq"]
+        if "S" in flags:
+            flow.next_seq = (seq + 1) % SEQ_MOD
+        elif payload:
+            self._insert(flow, seq, payload)
+
+        ready = self._drain(key, flow, flags)
+        ready.extend(self._enforce_caps())
+        return ready
+
+    def expire(self, now: Optional[float] = None) -> List[Tuple[List[Any], Optional[Dict[str, Any]]]]:
+        """Flush flows that have been idle for longer than idle_timeout."""
+        now = time.time() if now is None else now
+        ready = []
+        for key, flow in list(self.flows.items()):
+            if now - flow.last_seen < self.idle_timeout:
+                break  # flows are ordered by last activity
+            self.stats["expired"] += 1
+            ready.extend(self._flush(key, flow))
+        return ready
+
+    def _insert(self, flow: Flow, seq: int, payload: bytes):
+        before = flow.size
+        if flow.next_seq is None:
+            flow.next_seq = seq
+        delta = _seq_delta(seq, flow.next_seq)
+        if delta < 0:
+            # retransmission or overlap, keep only the new bytes
+            payload = payload[-delta:]
+            delta = 0
+        if not payload:
+            return
+        if delta > 0:
+            flow.out_of_order.setdefault(seq, payload)
+        else:
+            flow.buffer += payload
+            flow.next_seq = (flow.next_seq + len(payload)) % SEQ_MOD
+            # pull in any out of order segments that are now contiguous
+            while flow.out_of_order:
+                queued = next((s for s in flow.out_of_order if _seq_delta(s, flow.next_seq) <= 0), None)
+                if queued is None:
+                    break
+                data = flow.out_of_order.pop(queued)
+                data = data[-_seq_delta(queued, flow.next_seq):] if _seq_delta(queued, flow.next_seq) < 0 else data
+                flow.buffer += data
+                flow.next_seq = (flow.next_seq + len(data)) % SEQ_MOD
+        flow.segments += 1
+        self.total_bytes += flow.size - before
+
+    def _drain(self, key: Tuple, flow: Flow, flags: str) -> List[Tuple[List[Any], Dict[str, Any]]]:
+        ready = []
+        while flow.buffer and _HTTP_REQUEST.match(flow.buffer):
+            length = _http_message_length(bytes(flow.buffer))
+            if length is None:
+                break
+            ready.append(self._emit(flow, length))
+        if any(flag in flags for flag in "FR"):
+            ready.extend(self._flush(key, flow))
+        elif len(flow.buffer) >= self.max_flow_bytes:
+            flow.truncated = True
+            ready.append(self._emit(flow, self.max_flow_bytes))
+        elif flow.buffer and "P" in flags and not flow.out_of_order and not _HTTP_REQUEST.match(flow.buffer):
+            # PSH marks the end of an application write for protocols we can't frame ourselves
+            ready.append(self._emit(flow, len(flow.buffer)))
+        return ready
+
+    def _emit(self, flow: Flow, length: int) -> Tuple[List[Any], Dict[str, Any]]:
+        message = bytes(flow.buffer[:length])
+        del flow.buffer[:length]
+        self.total_bytes -= length
+        fields = flow.fields
+        packet = {
+            "timestamp": fields["timestamp"] or flow.last_seen,
+            "source_ip": fields["source_ip"],
+            "destination_ip": fields["destination_ip"],
+            "transport_layer": {
+                "protocol": "TCP",
+                "source_port": fields["source_port"],
+                "destination_port": fields["destination_port"],
+            },
+            "payload": {"length": len(message), "data": message.decode("latin-1")},
+            "flow": {"segments": flow.segments, "truncated": flow.truncated},
+        }
+        ids, flow.packet_ids = flow.packet_ids, []
+        flow.segments, flow.truncated = 0, False
+        self.stats["messages"] += 1
+        return ids, packet
+
+    def _flush(self, key: Tuple, flow: Flow) -> List[Tuple[List[Any], Optional[Dict[str, Any]]]]:
+        # out of order data that never got its gap filled is appended as is
+        for seq in sorted(flow.out_of_order, key=lambda s: _seq_delta(s, flow.next_seq or s)):
+            flow.buffer += flow.out_of_order[seq]
+        flow.out_of_order.clear()
+        ready = [self._emit(flow, len(flow.buffer))] if flow.buffer else []
+        if flow.packet_ids:
+            # segments that never carried data still get an answer
+            ready.append((flow.packet_ids, None))
+            flow.packet_ids = []
+        del self.flows[key]
+        return ready
+
+    def _enforce_caps(self) -> List[Tuple[List[Any], Optional[Dict[str, Any]]]]:
+        ready = []
+        while self.flows and (len(self.flows) > self.max_flows or self.total_bytes > self.max_total_bytes):
+            key, flow = next(iter(self.flows.items()))
+            self.stats["evicted"] += 1
+            ready.extend(self._flush(key, flow))
+        return ready
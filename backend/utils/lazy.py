@@ -0,0 +1,92 @@
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+# process start, close enough: server.py imports this module first
+PROCESS_STARTED = time.perf_counter()
+
+
+class _Component:
+    def __init__(self, name: str, factory: Callable[[], Any]):
+        self.name = name
+        self.factory = factory
+        self.value = None
+        self.loaded = False
+        self.seconds: Optional[float] = None
+        self.error: Optional[str] = None
+        self.lock = threading.Lock()
+
+    def load(self) -> Any:
+        if self.loaded:
+            return self.value
+        with self.lock:
+            if not self.loaded:
+                started = time.perf_counter()
+                try:
+                    self.value = self.factory()
+                except Exception as e:
+                    self.error = str(e)
+                    raise
+                self.seconds = time.perf_counter() - started
+                self.error = None
+                self.loaded = True
+                print(f"loaded {self.name} in {self.seconds:.2f}s")
+        return self.value
+
+
+_components: Dict[str, _Component] = {}
+
+
+class LazyProxy:
+    """Stands in for an object that is only built on first attribute access.
+
+    Has no public attributes of its own, so collection.get(...), embedder.encode(...) and the
+    like reach the real object untouched."""
+
+    def __init__(self, component: _Component):
+        object.__setattr__(self, "_component", component)
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self._component.load(), attr)
+
+    def __setattr__(self, attr: str, value: Any):
+        setattr(self._component.load(), attr, value)
+
+    def __repr__(self) -> str:
+        component = self._component
+        return repr(component.value) if component.loaded else f"<lazy {component.name}>"
+
+
+def lazy(name: str, factory: Callable[[], Any]) -> Any:
+    """Register a component that is built by factory() on first use (or by warm_up)."""
+    component = _Component(name, factory)
+    _components[name] = component
+    return LazyProxy(component)
+
+
+def resolve(name: str) -> Any:
+    return _components[name].load()
+
+
+def is_loaded(name: str) -> bool:
+    return _components[name].loaded
+
+
+def warm_up(names: Optional[List[str]] = None) -> Dict[str, Optional[str]]:
+    """Load the named components (all of them by default) in order; returns the errors by name."""
+    errors = {}
+    for name in names if names is not None else list(_components):
+        try:
+            _components[name].load()
+            errors[name] = None
+        except Exception as e:
+            print(f"Error loading {name}: {str(e)}")
+            errors[name] = str(e)
+    return errors
+
+
+def component_status() -> Dict[str, Dict[str, Any]]:
+    return {
+        name: {"loaded": component.loaded, "seconds": component.seconds, "error": component.error}
+        for name, component in _components.items()
+    }
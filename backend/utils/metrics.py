@@ -0,0 +1,199 @@
+import functools
+import inspect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Tuple
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.exceptions import OutputParserException
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _label_key(labels: Dict[str, str]) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: Tuple[Tuple[str, str], ...], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in self._values.items():
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        # label key -> (bucket counts, sum, count)
+        self._values: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            entry = self._values.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in self._values.items():
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f"{self.name}_bucket{_format_labels(key, ('le', str(bound)))} {bucket_count}")
+                lines.append(f"{self.name}_bucket{_format_labels(key, ('le', '+Inf'))} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+node_seconds = Histogram("netsentry_node_seconds", "Wall time spent in a graph node")
+node_errors = Counter("netsentry_node_errors_total", "Exceptions raised or caught inside a graph node")
+llm_seconds = Histogram("netsentry_llm_request_seconds", "Latency of a single LLM request")
+llm_tokens = Counter("netsentry_llm_tokens_total", "Prompt and completion tokens reported by the LLM")
+llm_errors = Counter("netsentry_llm_errors_total", "LLM requests that failed")
+parser_failures = Counter("netsentry_parser_failures_total", "LLM responses the structured output parser rejected")
+retries = Counter("netsentry_retries_total", "Nodes re-run by the graph after a failed or rejected attempt")
+
+REGISTRY = [node_seconds, node_errors, llm_seconds, llm_tokens, llm_errors, parser_failures, retries]
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# spans of the request being traced, None when tracing is off
+_current_trace: ContextVar[Optional[List[Dict[str, Any]]]] = ContextVar("netsentry_trace", default=None)
+
+
+@contextmanager
+def start_trace(enabled: bool = True):
+    """Collect node and LLM spans for everything awaited inside the block. Yields None when disabled."""
+    if not enabled:
+        yield None
+        return
+    spans: List[Dict[str, Any]] = []
+    token = _current_trace.set(spans)
+    try:
+        yield spans
+    finally:
+        _current_trace.reset(token)
+
+
+def _add_span(kind: str, name: str, started: float, elapsed: float, **extra):
+    spans = _current_trace.get()
+    if spans is not None:
+        spans.append({"kind": kind, "name": name, "start": started, "duration_ms": elapsed * 1000, **extra})
+
+
+def record_failure(node: str, error: Exception):
+    if isinstance(error, OutputParserException):
+        parser_failures.inc(agent=node)
+    node_errors.inc(node=node)
+
+
+def traced_node(graph: str, func):
+    """Wrap a graph node (sync or async) so its wall time is recorded under its own name."""
+    name = func.__name__
+
+    def _done(started: float, wall_started: float):
+        elapsed = time.perf_counter() - started
+        node_seconds.observe(elapsed, graph=graph, node=name)
+        _add_span("node", name, wall_started, elapsed, graph=graph)
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            started, wall_started = time.perf_counter(), time.time()
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                node_errors.inc(node=name)
+                raise
+            finally:
+                _done(started, wall_started)
+
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        started, wall_started = time.perf_counter(), time.time()
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            node_errors.inc(node=name)
+            raise
+        finally:
+            _done(started, wall_started)
+
+    return wrapper
+
+
+class LLMMetricsHandler(BaseCallbackHandler):
+    """Records latency and token usage of every chat model call it is attached to."""
+
+    # cheap enough to run on the event loop instead of an executor
+    run_inline = True
+
+    def __init__(self):
+        self._started: Dict[Any, Tuple[float, float, str]] = {}
+
+    def _start(self, serialized, run_id, kwargs):
+        params = kwargs.get("invocation_params") or {}
+        model = params.get("model_name") or params.get("model") or (serialized or {}).get("name", "unknown")
+        self._started[run_id] = (time.perf_counter(), time.time(), model)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._start(serialized, run_id, kwargs)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._start(serialized, run_id, kwargs)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        started, wall_started, model = self._started.pop(run_id, (time.perf_counter(), time.time(), "unknown"))
+        elapsed = time.perf_counter() - started
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        prompt_tokens = usage.get("prompt_tokens", 0)
+        completion_tokens = usage.get("completion_tokens", 0)
+
+        llm_seconds.observe(elapsed, model=model)
+        llm_tokens.inc(prompt_tokens, model=model, kind="prompt")
+        llm_tokens.inc(completion_tokens, model=model, kind="completion")
+        _add_span("llm", model, wall_started, elapsed, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        started, wall_started, model = self._started.pop(run_id, (time.perf_counter(), time.time(), "unknown"))
+        llm_errors.inc(model=model)
+        _add_span("llm", model, wall_started, time.perf_counter() - started, error=str(error))
+
+
+llm_metrics_handler = LLMMetricsHandler()
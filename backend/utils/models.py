@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Any, List, Optional, Dict
+from typing import Any, List, Optional, Dict, Union
 
 
 class Criteria(BaseModel):
@@ -18,10 +18,49 @@ class GraphState(BaseModel):
     approved: bool = False
 
 
+class TransportLayer(BaseModel):
+    protocol: str
+    source_port: Optional[int] = None
+    destination_port: Optional[int] = None
+    flags: Optional[str] = None
+    seq: Optional[int] = None
+    ack: Optional[int] = None
+    type: Optional[int] = None
+    code: Optional[int] = None
+
+
+class Payload(BaseModel):
+    length: int
+    data: Union[bytes, str] = b""  # first bytes of the payload, latin-1 text when sent as JSON
+
+
+class PacketRecord(BaseModel):
+    """Structured packet written by `logger.py --format json|msgpack`."""
+
+    timestamp: float
+    source_ip: Optional[str] = None
+    destination_ip: Optional[str] = None
+    ttl: Optional[int] = None
+    transport_layer: Optional[TransportLayer] = None
+    payload: Optional[Payload] = None
+
+
 class ParallelState(BaseModel):
-    packet: Dict[str, Any]  # todo set to erik's schema
+    # either a PacketRecord dump (validated by parallel_start_state) or the layer dict parsed from
+    # scapy's text output in the electron app
+    packet: Dict[str, Any]
     xss_agent_msg: str
     SQLi_agent_msg: str
     payload_agent_msg: str
     threat_detected: bool
     feedback: str
+    tier: str = "llm"  # which stage produced the verdict: "prefilter", "cache" or "llm"
+    prefilter_hits: Dict[str, List[str]] = {}
+    # parsed agent answers, None until the agent ran (or when it failed)
+    xss_detected: Optional[bool] = None
+    xss_confidence: Optional[float] = None
+    SQLi_detected: Optional[bool] = None
+    SQLi_confidence: Optional[float] = None
+    payload_detected: Optional[bool] = None
+    payload_confidence: Optional[float] = None
+    early_exit: bool = False  # verdict taken from the agents without the reasoning model
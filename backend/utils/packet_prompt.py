@@ -0,0 +1,150 @@
+import os
+import re
+import threading
+from typing import Any, Dict, List, Tuple
+from utils.metrics import REGISTRY, Counter, Histogram
+from utils.packets import extract_payload, get_flow_fields
+from utils.prefilter import SIGNATURE_PATTERNS, decode_payload
+
+# payload tokens an agent prompt may spend on one packet
+PACKET_TOKEN_BUDGET = int(os.environ.get("PACKET_TOKEN_BUDGET", 512))
+# characters kept on either side of a signature match when the payload has to be windowed
+WINDOW_CONTEXT = int(os.environ.get("PACKET_WINDOW_CONTEXT", 120))
+# the request line and first headers are always kept
+HEAD_CHARS = 160
+# rough llama3 tokenizer ratio for the mostly ASCII text packets turn into
+CHARS_PER_TOKEN = 4
+
+# HTTP headers worth listing on their own for each agent, in case the payload gets windowed
+AGENT_HEADERS = {
+    "xss": ("host", "referer", "content-type", "cookie", "user-agent"),
+    "sqli": ("host", "content-type", "content-length"),
+}
+
+_HTTP_HEADER = re.compile(r"^([A-Za-z][A-Za-z0-9-]*):\s*(.*)$")
+_NON_PRINTABLE = re.compile(r"[^\x20-\x7e\n\t]")
+
+prompt_tokens = Histogram(
+    "netsentry_prompt_packet_tokens",
+    "Estimated tokens a rendered packet adds to an agent prompt",
+    buckets=(32, 64, 128, 256, 512, 1024, 2048, 4096),
+)
+prompt_packets = Counter("netsentry_prompt_packets_total", "Packets rendered into an agent prompt, by whether the payload was windowed")
+REGISTRY.extend([prompt_tokens, prompt_packets])
+
+
+def estimate_tokens(text: str) -> int:
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def _printable(text: str) -> str:
+    text = text.replace("\r\n", "\n")
+    return _NON_PRINTABLE.sub(lambda m: f"\\x{ord(m.group(0)):02x}", text)
+
+
+def _headers(text: str, wanted: Tuple[str, ...]) -> List[str]:
+    lines = []
+    for line in text.split("\n\n", 1)[0].splitlines()[1:]:
+        match = _HTTP_HEADER.match(line.strip())
+        if match and match.group(1).lower() in wanted:
+            lines.append(f"{match.group(1)}: {match.group(2)}")
+    return lines
+
+
+def _window(text: str, spans: List[Tuple[int, int]], budget_chars: int) -> str:
+    """The head of text plus the regions around spans, merged, in order, within budget_chars."""
+    regions = [(0, min(len(text), HEAD_CHARS))]
+    for start, end in spans:
+        regions.append((max(0, start - WINDOW_CONTEXT), min(len(text), end + WINDOW_CONTEXT)))
+    regions.sort()
+    merged: List[List[int]] = []
+    for start, end in regions:
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+
+    parts, used, position = [], 0, 0
+    for start, end in merged:
+        if used >= budget_chars:
+            break
+        end = min(end, start + budget_chars - used)
+        if start > position:
+            parts.append(f" [...{start - position} chars skipped...] ")
+        parts.append(text[start:end])
+        used += end - start
+        position = end
+    if position < len(text):
+        parts.append(f" [...{len(text) - position} chars skipped...]")
+    return "".join(parts)
+
+
+def render_packet(packet: Dict[str, Any], category: str, budget: int = PACKET_TOKEN_BUDGET) -> Tuple[str, int, bool]:
+    """Compact text for one agent's prompt: the flow, the headers that agent cares about and the
+    payload, windowed around that agent's signature matches when it doesn't fit the budget.
+
+    Returns (text, estimated tokens, whether the payload was windowed)."""
+    flow = get_flow_fields(packet or {})
+    lines = [
+        f"flow: {flow['protocol'] or '?'} {flow['source_ip']}:{flow['source_port']} -> {flow['destination_ip']}:{flow['destination_port']}"
+        + (f" flags={flow['flags']}" if flow["flags"] else "")
+    ]
+
+    raw = extract_payload(packet or {})
+    text = _printable(raw.decode("latin-1"))
+    truncated = False
+    if not text:
+        lines.append("payload: (empty)")
+    elif estimate_tokens(text) <= budget:
+        lines.append(f"payload ({len(raw)} bytes):\n{text}")
+    else:
+        truncated = True
+        headers = _headers(text, AGENT_HEADERS.get(category, ()))
+        if headers:
+            lines.append("headers:\n" + "\n".join(headers))
+        pattern = SIGNATURE_PATTERNS[category]
+        spans = [m.span() for m in pattern.finditer(text.lower())]
+        if spans:
+            lines.append(f"payload ({len(raw)} bytes, windowed around suspicious regions):\n{_window(text, spans, budget * CHARS_PER_TOKEN)}")
+        else:
+            # the match is only visible once the encodings are undone
+            decoded = _printable(decode_payload(raw))
+            spans = [m.span() for m in pattern.finditer(decoded)]
+            lines.append(f"payload ({len(raw)} bytes, decoded and lowercased, windowed around suspicious regions):\n{_window(decoded, spans, budget * CHARS_PER_TOKEN)}")
+
+    rendered = "\n".join(lines)
+    tokens = estimate_tokens(rendered)
+    prompt_tokens.observe(tokens, agent=category)
+    prompt_packets.inc(agent=category, truncated="yes" if truncated else "no")
+    prompt_stats.record(category, tokens, truncated)
+    return rendered, tokens, truncated
+
+
+class PromptStats:
+    """Tokens per rendered packet and how often the payload had to be windowed, per agent."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts: Dict[str, List[int]] = {}
+
+    def record(self, category: str, tokens: int, truncated: bool):
+        with self._lock:
+            entry = self._counts.setdefault(category, [0, 0, 0])
+            entry[0] += 1
+            entry[1] += tokens
+            entry[2] += int(truncated)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = {category: list(entry) for category, entry in self._counts.items()}
+        return {
+            category: {
+                "packets": packets,
+                "mean_tokens": tokens / packets,
+                "truncation_rate": truncated / packets,
+            }
+            for category, (packets, tokens, truncated) in counts.items()
+        }
+
+
+prompt_stats = PromptStats()
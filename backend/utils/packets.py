@@ -0,0 +1,117 @@
+import ast
+from typing import Any, Dict, Optional
+
+# layers produced by parseScapyPacket in the electron main process that carry application data
+PAYLOAD_LAYERS = ("Raw", "Padding")
+
+
+def get_layer(packet: Dict[str, Any], name: str) -> Optional[Dict[str, Any]]:
+    layer = packet.get(name) if packet else None
+    return layer if isinstance(layer, dict) else None
+
+
+def to_bytes(value: Any) -> bytes:
+    """Turn a payload value (bytes, a python bytes repr like "b'GET /'" or plain text) into bytes."""
+    if value is None:
+        return b""
+    if isinstance(value, (bytes, bytearray)):
+        return bytes(value)
+    text = str(value).strip()
+    if text[:2] in ("b'", 'b"'):
+        try:
+            literal = ast.literal_eval(text)
+            if isinstance(literal, bytes):
+                return literal
+        except (ValueError, SyntaxError):
+            pass
+    return text.encode("utf-8", errors="replace")
+
+
+def is_record(packet: Dict[str, Any]) -> bool:
+    """True for PacketRecord style packets, False for scapy layer dicts."""
+    return bool(packet) and "transport_layer" in packet
+
+
+def extract_payload(packet: Dict[str, Any]) -> bytes:
+    if not packet:
+        return b""
+    for name in PAYLOAD_LAYERS:
+        layer = get_layer(packet, name)
+        if layer and layer.get("load"):
+            return to_bytes(layer["load"])
+    payload = packet.get("payload")
+    if isinstance(payload, dict):
+        data = payload.get("data")
+        if isinstance(data, str):
+            return data.encode("latin-1", errors="replace")
+        return to_bytes(data)
+    if isinstance(payload, (str, bytes, bytearray)):
+        return to_bytes(payload)
+    return b""
+
+
+TRANSPORT_LAYERS = ("TCP", "UDP", "ICMP")
+
+
+def get_header_fields(packet: Dict[str, Any]) -> Dict[str, Any]:
+    """Header fields that change how a payload should be judged (where it was sent and over what)."""
+    fields = {"protocol": None, "destination_port": None}
+    if is_record(packet):
+        transport = packet.get("transport_layer") or {}
+        fields["protocol"] = transport.get("protocol")
+        fields["destination_port"] = transport.get("destination_port")
+        return fields
+    for name in TRANSPORT_LAYERS:
+        layer = get_layer(packet, name)
+        if layer is not None:
+            fields["protocol"] = name
+            fields["destination_port"] = layer.get("dport")
+            break
+    return fields
+
+
+def _to_int(value: Any) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def get_flow_fields(packet: Dict[str, Any]) -> Dict[str, Any]:
+    """Addresses, ports, TCP sequence number and flags of a packet in either packet shape."""
+    if is_record(packet):
+        transport = packet.get("transport_layer") or {}
+        return {
+            "source_ip": packet.get("source_ip"),
+            "destination_ip": packet.get("destination_ip"),
+            "protocol": transport.get("protocol"),
+            "source_port": transport.get("source_port"),
+            "destination_port": transport.get("destination_port"),
+            "seq": _to_int(transport.get("seq")),
+            "flags": transport.get("flags") or "",
+            "timestamp": packet.get("timestamp"),
+        }
+
+    ip = get_layer(packet, "IP") or get_layer(packet, "IPv6") or {}
+    fields = {
+        "source_ip": ip.get("src"),
+        "destination_ip": ip.get("dst"),
+        "protocol": None,
+        "source_port": None,
+        "destination_port": None,
+        "seq": None,
+        "flags": "",
+        "timestamp": None,
+    }
+    for name in TRANSPORT_LAYERS:
+        layer = get_layer(packet, name)
+        if layer is not None:
+            fields.update(
+                protocol=name,
+                source_port=layer.get("sport"),
+                destination_port=layer.get("dport"),
+                seq=_to_int(layer.get("seq")),
+                flags=layer.get("flags") or "",
+            )
+            break
+    return fields
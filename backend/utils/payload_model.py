@@ -0,0 +1,180 @@
+import hashlib
+import os
+import threading
+from typing import List, Optional
+import numpy as np
+from utils.prefilter import decode_payload, match_signatures
+
+PAYLOAD_MODEL_PATH = os.environ.get("PAYLOAD_MODEL_PATH", "./models/payload_model.npz")
+# bumped whenever featurize() changes, so an old model file is refused instead of silently misread
+FEATURE_VERSION = 1
+# hashed character 1-3 gram buckets of the decoded payload
+N_HASHED = 4096
+NGRAM_SIZES = (1, 2, 3)
+# long bodies are cut; the first bytes carry the request line, parameters and most injections
+MAX_BYTES = 2048
+
+DENSE_FEATURES = (
+    "log_length",
+    "entropy",
+    "printable_ratio",
+    "non_ascii_ratio",
+    "percent_ratio",
+    "special_ratio",
+    "digit_ratio",
+    "upper_ratio",
+    "decoded_changed",
+    "xss_signatures",
+    "sqli_signatures",
+)
+
+_PRINTABLE = np.zeros(256, dtype=bool)
+_PRINTABLE[0x20:0x7F] = True
+_PRINTABLE[[0x09, 0x0A, 0x0D]] = True
+_SPECIAL = np.zeros(256, dtype=bool)
+_SPECIAL[list(b"<>'\"();=-/*#`")] = True
+_DIGIT = np.zeros(256, dtype=bool)
+_DIGIT[list(b"0123456789")] = True
+_UPPER = np.zeros(256, dtype=bool)
+_UPPER[list(range(ord("A"), ord("Z") + 1))] = True
+
+
+def _ngram_buckets(data: np.ndarray) -> np.ndarray:
+    buckets = []
+    for n in NGRAM_SIZES:
+        if len(data) < n:
+            continue
+        code = np.zeros(len(data) - n + 1, dtype=np.int64)
+        for offset in range(n):
+            code = (code << 8) | data[offset:len(data) - n + 1 + offset]
+        # multiplicative hash, n keeps same-valued grams of different sizes apart
+        buckets.append((code * 2654435761 + n * 40503) % N_HASHED)
+    return np.concatenate(buckets) if buckets else np.zeros(0, dtype=np.int64)
+
+
+def _dense(raw: np.ndarray, decoded: str, lowered: bytes) -> List[float]:
+    length = len(raw)
+    if not length:
+        return [0.0] * len(DENSE_FEATURES)
+    counts = np.bincount(raw, minlength=256)
+    probabilities = counts[counts > 0] / length
+    hits = match_signatures(decoded)
+    return [
+        float(np.log1p(length)),
+        float(-(probabilities * np.log2(probabilities)).sum() / 8),
+        float(counts[_PRINTABLE].sum() / length),
+        float(counts[128:].sum() / length),
+        float(counts[ord("%")] / length),
+        float(counts[_SPECIAL].sum() / length),
+        float(counts[_DIGIT].sum() / length),
+        float(counts[_UPPER].sum() / length),
+        float(decoded.encode("latin-1", errors="replace") != lowered),
+        float(len(hits["xss"])),
+        float(len(hits["sqli"])),
+    ]
+
+
+def featurize(payloads: List[bytes]) -> np.ndarray:
+    """One row per payload: L2 normalized log counts of the hashed n-grams, then the raw dense features."""
+    X = np.zeros((len(payloads), N_HASHED + len(DENSE_FEATURES)), dtype=np.float32)
+    rows, cols = [], []
+    for i, payload in enumerate(payloads):
+        payload = payload[:MAX_BYTES]
+        raw = np.frombuffer(payload, dtype=np.uint8)
+        decoded = decode_payload(payload)
+        buckets = _ngram_buckets(np.frombuffer(decoded.encode("latin-1", errors="replace"), dtype=np.uint8).astype(np.int64))
+        rows.append(np.full(len(buckets), i, dtype=np.int64))
+        cols.append(buckets)
+        X[i, N_HASHED:] = _dense(raw, decoded, payload.lower())
+    if rows:
+        # one scatter for the whole batch
+        np.add.at(X, (np.concatenate(rows), np.concatenate(cols)), 1)
+    hashed = np.log1p(X[:, :N_HASHED])
+    norms = np.linalg.norm(hashed, axis=1, keepdims=True)
+    X[:, :N_HASHED] = hashed / np.maximum(norms, 1e-12)
+    return X
+
+
+def standardize(X: np.ndarray, mean: np.ndarray, std: np.ndarray) -> np.ndarray:
+    X = X.copy()
+    X[:, N_HASHED:] = (X[:, N_HASHED:] - mean) / std
+    return X
+
+
+class PayloadClassifier:
+    """Logistic regression over featurize(), trained by tools/train_payload_model.py.
+
+    Inference is a single matrix product over the batch, no LLM and no ML framework at runtime."""
+
+    def __init__(self, weights: np.ndarray, bias: float, mean: np.ndarray, std: np.ndarray, threshold: float = 0.5, fingerprint: str = ""):
+        self.weights = weights.astype(np.float32)
+        self.bias = float(bias)
+        self.mean = mean.astype(np.float32)
+        self.std = np.where(std > 0, std, 1).astype(np.float32)
+        self.threshold = threshold
+        self.fingerprint = fingerprint
+
+    @classmethod
+    def load(cls, path: str) -> "PayloadClassifier":
+        with open(path, "rb") as f:
+            fingerprint = hashlib.sha256(f.read()).hexdigest()
+        data = np.load(path)
+        if int(data["feature_version"]) != FEATURE_VERSION or int(data["n_hashed"]) != N_HASHED:
+            raise ValueError(f"{path} was trained on different features, retrain it with tools/train_payload_model.py")
+        return cls(data["weights"], float(data["bias"]), data["mean"], data["std"], float(data["threshold"]), fingerprint)
+
+    def save(self, path: str, **extra):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        np.savez(
+            path,
+            weights=self.weights,
+            bias=self.bias,
+            mean=self.mean,
+            std=self.std,
+            threshold=self.threshold,
+            feature_version=FEATURE_VERSION,
+            n_hashed=N_HASHED,
+            **extra,
+        )
+
+    def predict_proba(self, payloads: List[bytes]) -> np.ndarray:
+        if not payloads:
+            return np.zeros(0, dtype=np.float32)
+        X = standardize(featurize(payloads), self.mean, self.std)
+        return 1 / (1 + np.exp(-(X @ self.weights + self.bias)))
+
+    def explain(self, payload: bytes, top: int = 3) -> List[str]:
+        """Dense features that pushed this payload's score up the most."""
+        X = standardize(featurize([payload]), self.mean, self.std)[0, N_HASHED:]
+        contributions = X * self.weights[N_HASHED:]
+        order = np.argsort(-contributions)[:top]
+        return [DENSE_FEATURES[i] for i in order if contributions[i] > 0]
+
+
+_classifier: Optional[PayloadClassifier] = None
+_loaded = False
+_lock = threading.Lock()
+
+
+def get_payload_classifier() -> Optional[PayloadClassifier]:
+    """The classifier at PAYLOAD_MODEL_PATH, loaded on first use; None when no model has been trained."""
+    global _classifier, _loaded
+    if not _loaded:
+        with _lock:
+            if not _loaded:
+                if os.path.exists(PAYLOAD_MODEL_PATH):
+                    try:
+                        _classifier = PayloadClassifier.load(PAYLOAD_MODEL_PATH)
+                        print(f"loaded payload classifier from {PAYLOAD_MODEL_PATH}")
+                    except (OSError, ValueError, KeyError) as e:
+                        print(f"could not load the payload classifier: {e}")
+                else:
+                    print(f"no payload classifier at {PAYLOAD_MODEL_PATH}, payload_agent is disabled")
+                _loaded = True
+    return _classifier
+
+
+def payload_model_fingerprint() -> str:
+    classifier = get_payload_classifier()
+    return classifier.fingerprint if classifier is not None else "none"
+
@@ -0,0 +1,112 @@
+import html
+import re
+import threading
+from typing import Any, Dict, List
+from urllib.parse import unquote_plus
+from utils.packets import extract_payload
+
+# attackers stack encodings (e.g. %253Cscript%253E), so decode until the text stops changing
+MAX_DECODE_ROUNDS = 3
+
+_HEX_ESCAPE = re.compile(r"\\x([0-9a-fA-F]{2})")
+_UNICODE_ESCAPE = re.compile(r"(?:\\u|%u)([0-9a-fA-F]{4})")
+_HEX_LITERAL = re.compile(r"0x((?:[0-9a-fA-F]{2}){3,})")
+
+# signatures for the indicators listed in the xss_agent / SQLi_agent prompts
+XSS_SIGNATURES = {
+    "script_tag": r"<\s*/?\s*script\b",
+    "event_handler": r"\bon[a-z]{3,20}\s*=",
+    "javascript_uri": r"(?:java|vb)script\s*:",
+    "dom_access": r"document\s*\.\s*(?:cookie|domain|write|location)|window\s*\.\s*location|localstorage|sessionstorage",
+    "dangerous_call": r"\b(?:eval|settimeout|setinterval|atob|string\.fromcharcode)\s*\(",
+    "html5_vector": r"<\s*(?:svg|iframe|object|embed|math|base)\b",
+    "data_uri": r"data\s*:\s*text/html",
+}
+
+SQLI_SIGNATURES = {
+    "tautology": r"['\"]\s*(?:or|and)\s+['\"]?\w+['\"]?\s*(?:=|like)\s*['\"]?\w+|\b(?:or|and)\s+\d+\s*=\s*\d+\b",
+    "union_select": r"\bunion\b(?:\s+all)?\s+select\b",
+    "stacked_query": r";\s*(?:select|insert|update|delete|drop|create|alter|exec|execute|declare|shutdown)\b",
+    "time_based": r"\b(?:sleep|benchmark|pg_sleep)\s*\(|waitfor\s+delay",
+    "comment_injection": r"['\"\)]\s*(?:--|#|/\*)|/\*!",
+    "sql_statement": r"\bselect\b.{1,200}?\bfrom\b|\binsert\s+into\b|\bupdate\b.{1,200}?\bset\b|\bdelete\s+from\b|\bdrop\s+(?:table|database)\b",
+    "db_function": r"\b(?:concat|char|ascii|substring|load_file|extractvalue|updatexml|xp_cmdshell)\s*\(|information_schema|@@version",
+}
+
+
+def _compile(signatures: Dict[str, str]) -> re.Pattern:
+    # one alternation per category so each payload is scanned in a single pass
+    return re.compile("|".join(f"(?P<{name}>{pattern})" for name, pattern in signatures.items()), re.DOTALL)
+
+
+SIGNATURE_PATTERNS = {
+    "xss": _compile(XSS_SIGNATURES),
+    "sqli": _compile(SQLI_SIGNATURES),
+}
+
+
+def decode_payload(raw: bytes) -> str:
+    """Undo URL, HTML entity and hex encodings and lowercase the result for signature matching."""
+    text = raw.decode("latin-1")
+    for _ in range(MAX_DECODE_ROUNDS):
+        decoded = _HEX_ESCAPE.sub(lambda m: chr(int(m.group(1), 16)), text)
+        decoded = _UNICODE_ESCAPE.sub(lambda m: chr(int(m.group(1), 16)), decoded)
+        decoded = html.unescape(unquote_plus(decoded, encoding="latin-1"))
+        if decoded == text:
+            break
+        text = decoded
+
+    # MySQL style hex strings (0x61646d696e) are appended in decoded form rather than replaced
+    hex_strings = []
+    for match in _HEX_LITERAL.finditer(text):
+        value = bytes.fromhex(match.group(1)).decode("latin-1")
+        if value.isprintable():
+            hex_strings.append(value)
+    if hex_strings:
+        text = text + "\n" + "\n".join(hex_strings)
+    return text.lower()
+
+
+def match_signatures(text: str) -> Dict[str, List[str]]:
+    hits = {}
+    for category, pattern in SIGNATURE_PATTERNS.items():
+        names = []
+        for match in pattern.finditer(text):
+            if match.lastgroup not in names:
+                names.append(match.lastgroup)
+        hits[category] = names
+    return hits
+
+
+def screen_packet(packet: Dict[str, Any]) -> Dict[str, List[str]]:
+    raw = extract_payload(packet)
+    if not raw:
+        return {category: [] for category in SIGNATURE_PATTERNS}
+    return match_signatures(decode_payload(raw))
+
+
+class TierStats:
+    """Counts which tier of the analysis pipeline produced each verdict."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts: Dict[str, int] = {}
+
+    def record(self, tier: str):
+        with self._lock:
+            self._counts[tier] = self._counts.get(tier, 0) + 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = dict(self._counts)
+        total = sum(counts.values())
+        return {
+            "total": total,
+            "tiers": {
+                tier: {"count": count, "hit_rate": count / total}
+                for tier, count in counts.items()
+            },
+        }
+
+
+tier_stats = TierStats()
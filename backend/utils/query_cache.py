@@ -0,0 +1,98 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+import numpy as np
+
+
+def normalize_description(description: str) -> str:
+    return " ".join(description.lower().split())
+
+
+class QueryCache:
+    """Bounded LRU cache with a TTL mapping network descriptions to the criteria /query resolved them to.
+
+    Lookups match the exact (whitespace and case normalized) text first, then the closest cached
+    description by cosine similarity. Every entry belongs to one criteria library revision and
+    the whole cache is dropped as soon as the library changes."""
+
+    def __init__(self, max_size: int = 256, ttl: float = 3600, threshold: float = 0.92):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+        self.revision = None
+        # normalized description -> (expires, embedding, result)
+        self._entries: "OrderedDict[str, Tuple[float, np.ndarray, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _sync(self, revision: Any):
+        if revision != self.revision:
+            self._entries.clear()
+            self.revision = revision
+
+    def get_exact(self, description: str, revision: Any) -> Optional[Dict[str, Any]]:
+        """Cheap check that needs no embedding; does not count as a miss."""
+        key = normalize_description(description)
+        with self._lock:
+            self._sync(revision)
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.time():
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return {**entry[2], "similarity": 1.0}
+
+    def get(self, embedding: np.ndarray, revision: Any) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self._sync(revision)
+            now = time.time()
+            for key in [key for key, entry in self._entries.items() if entry[0] < now]:
+                del self._entries[key]
+            if not self._entries:
+                self.misses += 1
+                return None
+            keys = list(self._entries)
+            scores = np.stack([self._entries[key][1] for key in keys]) @ embedding
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(keys[best])
+            self.hits += 1
+            return {**self._entries[keys[best]][2], "similarity": float(scores[best])}
+
+    def put(self, description: str, embedding: np.ndarray, result: Dict[str, Any], revision: Any):
+        key = normalize_description(description)
+        with self._lock:
+            self._sync(revision)
+            self._entries[key] = (time.time() + self.ttl, embedding, dict(result))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "revision": self.revision,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+def create_query_cache() -> QueryCache:
+    return QueryCache(
+        max_size=int(os.environ.get("QUERY_CACHE_SIZE", 256)),
+        ttl=float(os.environ.get("QUERY_CACHE_TTL", 3600)),
+        threshold=float(os.environ.get("QUERY_CACHE_THRESHOLD", 0.92)),
+    )
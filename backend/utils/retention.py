@@ -0,0 +1,278 @@
+import gzip
+import json
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:
+    # Windows, runs are only serialized within the process there
+    fcntl = None
+
+PAGE_SIZE = 1000
+
+
+class RetentionPolicy:
+    def __init__(
+        self,
+        max_age: float = 30 * 86400,
+        max_records: int = 100000,
+        rollup_after: float = 86400,
+        rollup_period: float = 3600,
+        archive_dir: str = "./chroma_archive",
+        lock_path: str = "./chroma.retention.lock",
+    ):
+        self.max_age = max_age
+        self.max_records = max_records
+        self.rollup_after = rollup_after
+        self.rollup_period = rollup_period
+        self.archive_dir = archive_dir
+        self.lock_path = lock_path
+
+
+def create_retention_policy() -> RetentionPolicy:
+    return RetentionPolicy(
+        max_age=float(os.environ.get("RETENTION_MAX_AGE_DAYS", 30)) * 86400,
+        max_records=int(os.environ.get("RETENTION_MAX_RECORDS", 100000)),
+        rollup_after=float(os.environ.get("RETENTION_ROLLUP_AFTER_HOURS", 24)) * 3600,
+        rollup_period=float(os.environ.get("RETENTION_ROLLUP_PERIOD_HOURS", 1)) * 3600,
+        archive_dir=os.environ.get("RETENTION_ARCHIVE_DIR", "./chroma_archive"),
+        lock_path=os.environ.get("RETENTION_LOCK_PATH", "./chroma.retention.lock"),
+    )
+
+
+def _chunks(items: List[Any], size: int) -> Iterable[List[Any]]:
+    for offset in range(0, len(items), size):
+        yield items[offset:offset + size]
+
+
+class RetentionManager:
+    """Keeps the analysis collection bounded.
+
+    Benign records older than rollup_after are folded into one summary record per rollup_period,
+    records older than max_age are dropped and past max_records the oldest go first (benign records,
+    then summaries, then threats). Every record removed from the collection is written to a gzipped
+    NDJSON archive first, with its embedding, so it can be put back with reindex(). Runs are
+    serialized across threads and, through a lock file, across worker processes: overlapping runs
+    would roll the same records into a summary twice."""
+
+    def __init__(self, collection, embedder, policy: RetentionPolicy):
+        self.collection = collection
+        self.embedder = embedder
+        self.policy = policy
+        self.last_report: Optional[Dict[str, Any]] = None
+        self._lock = threading.Lock()
+
+    def _list(self) -> List[Tuple[str, Dict[str, Any]]]:
+        records = []
+        offset = 0
+        while True:
+            page = self.collection.get(include=["metadatas"], limit=PAGE_SIZE, offset=offset)
+            records.extend((rid, metadata or {}) for rid, metadata in zip(page["ids"], page["metadatas"]))
+            if len(page["ids"]) < PAGE_SIZE:
+                return records
+            offset += PAGE_SIZE
+
+    def _fetch(self, ids: List[str]) -> List[Dict[str, Any]]:
+        records = []
+        for chunk in _chunks(ids, PAGE_SIZE):
+            page = self.collection.get(ids=chunk, include=["documents", "metadatas", "embeddings"])
+            for i, record_id in enumerate(page["ids"]):
+                records.append(
+                    {
+                        "id": record_id,
+                        "document": page["documents"][i],
+                        "metadata": page["metadatas"][i],
+                        "embedding": [float(x) for x in page["embeddings"][i]],
+                    }
+                )
+        return records
+
+    def _archive_and_delete(self, ids: List[str], reason: str) -> Optional[str]:
+        if not ids:
+            return None
+        os.makedirs(self.policy.archive_dir, exist_ok=True)
+        path = os.path.join(self.policy.archive_dir, f"{reason}-{time.strftime('%Y%m%dT%H%M%S')}-{len(ids)}.ndjson.gz")
+        tmp_path = path + ".tmp"
+        with gzip.open(tmp_path, "wt") as f:
+            for record in self._fetch(ids):
+                f.write(json.dumps(record) + "\n")
+        os.replace(tmp_path, path)
+        # only delete once the archive is safely on disk
+        for chunk in _chunks(ids, PAGE_SIZE):
+            self.collection.delete(ids=chunk)
+        return path
+
+    def _rollup(self, benign: List[Tuple[str, Dict[str, Any]]]) -> int:
+        """Write one summary per period for these benign records, returns the number of summaries written."""
+        periods: Dict[int, List[Tuple[str, Dict[str, Any]]]] = defaultdict(list)
+        for record_id, metadata in benign:
+            periods[int(metadata.get("stored_at", 0) // self.policy.rollup_period)].append((record_id, metadata))
+
+        ids, documents, metadatas = [], [], []
+        for period, records in sorted(periods.items()):
+            start = period * self.policy.rollup_period
+            end = start + self.policy.rollup_period
+            summary_id = f"summary-{int(start)}"
+            sources = Counter(m.get("source_ip") or "unknown" for _, m in records)
+            count = len(records)
+
+            # a later run can roll more records into a period that already has a summary
+            existing = self.collection.get(ids=[summary_id], include=["metadatas"])
+            if existing["ids"]:
+                previous = existing["metadatas"][0] or {}
+                count += int(previous.get("count", 0))
+                if "sources" in previous:
+                    sources.update(json.loads(previous["sources"]))
+                else:
+                    # summaries written before the full counts were kept
+                    for pair in json.loads(previous.get("top_sources", "[]")):
+                        sources[pair[0]] += pair[1]
+
+            top_sources = sources.most_common(5)
+            window = f"{time.strftime('%Y-%m-%d %H:%M', time.gmtime(start))} to {time.strftime('%Y-%m-%d %H:%M', time.gmtime(end))} UTC"
+            note = f"{count} benign analyses between {window}, top sources: " + ", ".join(f"{ip} ({n})" for ip, n in top_sources)
+            ids.append(summary_id)
+            documents.append(f"Benign traffic summary: {note}")
+            metadatas.append(
+                {
+                    "kind": "summary",
+                    # same keys as a single analysis so getRAG can render it
+                    "xss_agent_msg": "No XSS in rolled up records",
+                    "SQLi_agent_msg": "No SQL injection in rolled up records",
+                    "payload_agent_msg": "No malicious payloads in rolled up records",
+                    "threat_detected": False,
+                    "feedback": note,
+                    "count": count,
+                    "period_start": start,
+                    "period_end": end,
+                    "stored_at": end,
+                    "source_ip": "",
+                    "top_sources": json.dumps(top_sources),
+                    # every source, so the next merge into this period keeps the counts right
+                    "sources": json.dumps(sources),
+                }
+            )
+
+        if ids:
+            embeddings = self.embedder.encode(documents)
+            self.collection.upsert(ids=ids, embeddings=embeddings.tolist(), documents=documents, metadatas=metadatas)
+        return len(ids)
+
+    def _backfill(self, records: List[Tuple[str, Dict[str, Any]]], now: float) -> int:
+        """Date records stored before stored_at was recorded to this run, so they age from here
+        instead of counting as stored in 1970 and being expired all at once."""
+        missing = [(rid, m) for rid, m in records if "stored_at" not in m]
+        for rid, m in missing:
+            m["stored_at"] = now
+        for chunk in _chunks(missing, PAGE_SIZE):
+            self.collection.update(ids=[rid for rid, _ in chunk], metadatas=[m for _, m in chunk])
+        return len(missing)
+
+    def run(self, now: Optional[float] = None) -> Dict[str, Any]:
+        """One retention pass; skipped when another thread or worker process is already running one."""
+        if not self._lock.acquire(blocking=False):
+            return {"skipped": "a retention run is already in progress"}
+        try:
+            lock_file = self._lock_file()
+            if lock_file is None:
+                return {"skipped": "another process is running retention"}
+            try:
+                return self._run(now)
+            finally:
+                lock_file.close()
+        finally:
+            self._lock.release()
+
+    def _lock_file(self):
+        """The lock file, held exclusively until closed; None if another process holds it."""
+        os.makedirs(os.path.dirname(self.policy.lock_path) or ".", exist_ok=True)
+        lock_file = open(self.policy.lock_path, "a")
+        if fcntl is None:
+            return lock_file
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return None
+        return lock_file
+
+    def _run(self, now: Optional[float]) -> Dict[str, Any]:
+        now = time.time() if now is None else now
+        started = time.perf_counter()
+        records = self._list()
+        report = {"records_before": len(records), "rolled_up": 0, "summaries": 0, "expired": 0, "evicted": 0, "archives": []}
+
+        def archive(ids, reason):
+            path = self._archive_and_delete(ids, reason)
+            if path:
+                report["archives"].append(path)
+
+        report["backfilled"] = self._backfill(records, now)
+        expired = [rid for rid, m in records if m["stored_at"] < now - self.policy.max_age]
+        archive(expired, "expired")
+        report["expired"] = len(expired)
+        expired = set(expired)
+        records = [(rid, m) for rid, m in records if rid not in expired]
+
+        benign = [
+            (rid, m)
+            for rid, m in records
+            if not m.get("threat_detected") and m.get("kind") != "summary" and m["stored_at"] < now - self.policy.rollup_after
+        ]
+        if benign:
+            # archived before the summary is written, so a failure can't count them twice
+            archive([rid for rid, _ in benign], "rollup")
+            report["summaries"] = self._rollup(benign)
+            report["rolled_up"] = len(benign)
+            records = self._list()
+
+        overflow = len(records) - self.policy.max_records
+        if overflow > 0:
+            # recent benign records go first, then summaries, then threats, oldest first within each group
+            records.sort(key=lambda r: (bool(r[1].get("threat_detected")), r[1].get("kind") == "summary", r[1].get("stored_at", 0)))
+            evicted = [rid for rid, _ in records[:overflow]]
+            archive(evicted, "evicted")
+            report["evicted"] = len(evicted)
+
+        report["records_after"] = self.collection.count()
+        report["seconds"] = time.perf_counter() - started
+        self.last_report = report
+        return report
+
+    def list_archives(self) -> List[Dict[str, Any]]:
+        if not os.path.isdir(self.policy.archive_dir):
+            return []
+        return [
+            {"file": name, "bytes": os.path.getsize(os.path.join(self.policy.archive_dir, name))}
+            for name in sorted(os.listdir(self.policy.archive_dir))
+            if name.endswith(".ndjson.gz")
+        ]
+
+    def reindex(self, name: str) -> int:
+        """Put the records of an archive file back into the collection."""
+        path = os.path.join(self.policy.archive_dir, os.path.basename(name))
+        count = 0
+        with gzip.open(path, "rt") as f:
+            batch = []
+            for line in f:
+                batch.append(json.loads(line))
+                if len(batch) == PAGE_SIZE:
+                    count += self._restore(batch)
+                    batch = []
+            count += self._restore(batch)
+        return count
+
+    def _restore(self, batch: List[Dict[str, Any]]) -> int:
+        if not batch:
+            return 0
+        self.collection.upsert(
+            ids=[r["id"] for r in batch],
+            embeddings=[r["embedding"] for r in batch],
+            documents=[r["document"] for r in batch],
+            metadatas=[r["metadata"] for r in batch],
+        )
+        return len(batch)
@@ -0,0 +1,81 @@
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Optional
+from utils.metrics import REGISTRY, Counter
+
+# "early_exit" skips the reasoning model when every agent that ran is confidently negative and
+# reports confident positives as soon as they arrive; "full" always runs decision_node
+ANALYSIS_SCHEDULER = os.environ.get("ANALYSIS_SCHEDULER", "early_exit")
+NEGATIVE_CONFIDENCE = float(os.environ.get("EARLY_EXIT_NEGATIVE_CONFIDENCE", 0.8))
+POSITIVE_CONFIDENCE = float(os.environ.get("EARLY_EXIT_POSITIVE_CONFIDENCE", 0.9))
+# a payload classifier positive this confident sends a packet to decision_node even without signature hits
+PAYLOAD_ESCALATE_CONFIDENCE = float(os.environ.get("PAYLOAD_ESCALATE_CONFIDENCE", 0.8))
+
+early_exits = Counter("netsentry_early_exits_total", "Packets whose verdict skipped the reasoning model, by reason")
+preliminary_verdicts = Counter("netsentry_preliminary_verdicts_total", "Preliminary threat verdicts emitted before the decision node, by agent")
+REGISTRY.extend([early_exits, preliminary_verdicts])
+
+# called with every preliminary verdict of the packet being analyzed, None when nobody listens
+_preliminary_sink: ContextVar[Optional[Callable[[Dict[str, Any]], Any]]] = ContextVar("netsentry_preliminary", default=None)
+
+
+def early_exit_enabled() -> bool:
+    return ANALYSIS_SCHEDULER == "early_exit"
+
+
+def parse_confidence(value: Any) -> Optional[float]:
+    """The agent's confidence as a float in [0, 1], None when it didn't give a usable one."""
+    try:
+        confidence = float(str(value).strip().rstrip("%"))
+    except (TypeError, ValueError):
+        return None
+    if confidence > 1:
+        # some answers come back as a percentage
+        confidence /= 100
+    return min(max(confidence, 0.0), 1.0)
+
+
+def parse_detected(value: Any) -> bool:
+    return str(value).strip().upper().startswith("YES")
+
+
+@contextmanager
+def on_preliminary(callback: Callable[[Dict[str, Any]], Any]):
+    """Send preliminary verdicts of everything awaited inside the block to callback."""
+    token = _preliminary_sink.set(callback)
+    try:
+        yield
+    finally:
+        _preliminary_sink.reset(token)
+
+
+def report_agent_verdict(agent: str, detected: bool, confidence: Optional[float], details: str):
+    """Emit a preliminary threat verdict for a confident positive, without waiting for the other agents."""
+    if not early_exit_enabled() or not detected or confidence is None or confidence < POSITIVE_CONFIDENCE:
+        return
+    preliminary_verdicts.inc(agent=agent)
+    sink = _preliminary_sink.get()
+    if sink is not None:
+        sink({"threat_detected": True, "agent": agent, "confidence": confidence, "details": details})
+
+
+def payload_escalates(state) -> bool:
+    return bool(state.payload_detected) and (state.payload_confidence or 0) >= PAYLOAD_ESCALATE_CONFIDENCE
+
+
+def confident_negative(state) -> bool:
+    """True when every LLM agent that looked at the packet said NO with at least NEGATIVE_CONFIDENCE
+    and the payload classifier didn't flag it."""
+    verdicts = []
+    if state.prefilter_hits.get("xss"):
+        verdicts.append((state.xss_detected, state.xss_confidence))
+    if state.prefilter_hits.get("sqli"):
+        verdicts.append((state.SQLi_detected, state.SQLi_confidence))
+    if state.payload_detected:
+        # the LLM agents can't overrule a positive from the payload classifier on their own
+        return False
+    return bool(verdicts) and all(
+        detected is False and confidence is not None and confidence >= NEGATIVE_CONFIDENCE
+        for detected, confidence in verdicts
+    )
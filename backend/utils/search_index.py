@@ -0,0 +1,245 @@
+import bisect
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+# IPv4 addresses stay one token so an IOC search matches the address, not its octets
+_TOKEN = re.compile(r"\d{1,3}(?:\.\d{1,3}){3}|[a-z0-9_]+")
+# metadata that is searchable text on top of the document
+TEXT_FIELDS = ("source_ip", "feedback")
+
+# dead slots are compacted away once there are this many and they outnumber the live ones
+COMPACT_MIN_DEAD = 1024
+
+K1 = 1.5
+B = 0.75
+RRF_K = 60
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(text.lower())
+
+
+def _parse_bool(value: Any) -> Optional[bool]:
+    # form and query string values arrive as text, and bool("false") is True
+    if value is None or isinstance(value, bool):
+        return value
+    if isinstance(value, int) and value in (0, 1):
+        return bool(value)
+    if isinstance(value, str) and value.strip().lower() in ("true", "1", "yes"):
+        return True
+    if isinstance(value, str) and value.strip().lower() in ("false", "0", "no"):
+        return False
+    raise ValueError(f"threat_detected must be true or false, got {value!r}")
+
+
+class SearchFilters:
+    def __init__(self, threat_detected: Optional[bool] = None, since: Optional[float] = None, until: Optional[float] = None, source_ip: Optional[str] = None):
+        self.threat_detected = threat_detected
+        self.since = since
+        self.until = until
+        self.source_ip = source_ip
+
+    @classmethod
+    def from_request(cls, data: Optional[Dict[str, Any]]) -> "SearchFilters":
+        data = data or {}
+        return cls(
+            threat_detected=_parse_bool(data.get("threat_detected")),
+            since=data.get("since"),
+            until=data.get("until"),
+            source_ip=data.get("source_ip"),
+        )
+
+    def empty(self) -> bool:
+        return self.threat_detected is None and self.since is None and self.until is None and not self.source_ip
+
+    def to_where(self) -> Optional[Dict[str, Any]]:
+        """The same filters as a chroma where clause, for the vector side."""
+        clauses = []
+        if self.threat_detected is not None:
+            clauses.append({"threat_detected": {"$eq": self.threat_detected}})
+        if self.since is not None:
+            clauses.append({"stored_at": {"$gte": float(self.since)}})
+        if self.until is not None:
+            clauses.append({"stored_at": {"$lte": float(self.until)}})
+        if self.source_ip:
+            clauses.append({"source_ip": {"$eq": self.source_ip}})
+        if not clauses:
+            return None
+        return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+class LexicalIndex:
+    """In-memory BM25 index over the stored analyses, with attribute indexes for the search filters.
+
+    Filters are resolved against the attribute indexes first and scoring only visits postings
+    of documents that passed them."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._ids: List[Optional[str]] = []
+        self._slots: Dict[str, int] = {}
+        self._lengths: List[int] = []
+        self._postings: Dict[str, Dict[int, int]] = defaultdict(dict)
+        self._terms: Dict[int, List[str]] = {}
+        self._threats: Set[int] = set()
+        self._by_source: Dict[str, Set[int]] = defaultdict(set)
+        # sorted (stored_at, slot) pairs for time range filters
+        self._by_time: List[Tuple[float, int]] = []
+        # each live slot's entries in the attribute indexes, so removing it doesn't scan them
+        self._sources: Dict[int, str] = {}
+        self._times: Dict[int, float] = {}
+        self._total_length = 0
+        self._live = 0
+
+    def __len__(self) -> int:
+        return self._live
+
+    def _remove(self, record_id: str):
+        slot = self._slots.pop(record_id, None)
+        if slot is None:
+            return
+        for term in self._terms.pop(slot):
+            postings = self._postings[term]
+            postings.pop(slot, None)
+            if not postings:
+                del self._postings[term]
+        self._threats.discard(slot)
+        source = self._sources.pop(slot, None)
+        if source is not None:
+            slots = self._by_source[source]
+            slots.discard(slot)
+            if not slots:
+                del self._by_source[source]
+        entry = (self._times.pop(slot), slot)
+        i = bisect.bisect_left(self._by_time, entry)
+        if i < len(self._by_time) and self._by_time[i] == entry:
+            del self._by_time[i]
+        self._total_length -= self._lengths[slot]
+        self._ids[slot] = None
+        self._live -= 1
+
+    def _compact(self):
+        """Renumber the live slots so removed records stop taking space in _ids and _lengths."""
+        remap = {old: new for new, old in enumerate(slot for slot, record_id in enumerate(self._ids) if record_id is not None)}
+        self._ids = [self._ids[old] for old in remap]
+        self._lengths = [self._lengths[old] for old in remap]
+        self._slots = {record_id: remap[slot] for record_id, slot in self._slots.items()}
+        self._postings = defaultdict(dict, {term: {remap[slot]: tf for slot, tf in postings.items()} for term, postings in self._postings.items()})
+        self._terms = {remap[slot]: terms for slot, terms in self._terms.items()}
+        self._threats = {remap[slot] for slot in self._threats}
+        self._by_source = defaultdict(set, {source: {remap[slot] for slot in slots} for source, slots in self._by_source.items()})
+        self._sources = {remap[slot]: source for slot, source in self._sources.items()}
+        self._times = {remap[slot]: stored_at for slot, stored_at in self._times.items()}
+        self._by_time = sorted((stored_at, slot) for slot, stored_at in self._times.items())
+
+    def _maybe_compact(self):
+        dead = len(self._ids) - self._live
+        if dead >= COMPACT_MIN_DEAD and dead > self._live:
+            self._compact()
+
+    def _add(self, record_id: str, document: str, metadata: Dict[str, Any]):
+        self._remove(record_id)
+        text = " ".join([document or ""] + [str(metadata.get(field) or "") for field in TEXT_FIELDS])
+        counts = Counter(tokenize(text))
+        slot = len(self._ids)
+        self._ids.append(record_id)
+        self._slots[record_id] = slot
+        self._lengths.append(sum(counts.values()))
+        self._total_length += self._lengths[slot]
+        self._terms[slot] = list(counts)
+        for term, tf in counts.items():
+            self._postings[term][slot] = tf
+        if metadata.get("threat_detected"):
+            self._threats.add(slot)
+        if metadata.get("source_ip"):
+            self._by_source[metadata["source_ip"]].add(slot)
+            self._sources[slot] = metadata["source_ip"]
+        self._times[slot] = float(metadata.get("stored_at", 0))
+        bisect.insort(self._by_time, (self._times[slot], slot))
+        self._live += 1
+
+    def add(self, records: Iterable[Tuple[str, str, Dict[str, Any]]]):
+        with self._lock:
+            for record_id, document, metadata in records:
+                self._add(record_id, document, metadata)
+            self._maybe_compact()
+
+    def remove(self, ids: Iterable[str]):
+        with self._lock:
+            for record_id in ids:
+                self._remove(record_id)
+            self._maybe_compact()
+
+    def rebuild(self, collection, page_size: int = 1000):
+        """Reload everything from the collection, e.g. after retention rewrote it."""
+        records = []
+        offset = 0
+        while True:
+            page = collection.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+            records.extend(zip(page["ids"], page["documents"], page["metadatas"]))
+            if len(page["ids"]) < page_size:
+                break
+            offset += page_size
+        with self._lock:
+            self._reset()
+            for record_id, document, metadata in records:
+                self._add(record_id, document, metadata)
+
+    def _candidates(self, filters: SearchFilters) -> Optional[Set[int]]:
+        if filters.empty():
+            return None
+        candidates: Optional[Set[int]] = None
+
+        def narrow(slots: Set[int]):
+            nonlocal candidates
+            candidates = set(slots) if candidates is None else candidates & slots
+
+        if filters.threat_detected is True:
+            narrow(self._threats)
+        elif filters.threat_detected is False:
+            narrow({slot for slot in self._slots.values() if slot not in self._threats})
+        if filters.source_ip:
+            narrow(self._by_source.get(filters.source_ip, set()))
+        if filters.since is not None or filters.until is not None:
+            lo = bisect.bisect_left(self._by_time, (float(filters.since) if filters.since is not None else float("-inf"), -1))
+            hi = bisect.bisect_right(self._by_time, (float(filters.until) if filters.until is not None else float("inf"), len(self._ids)))
+            narrow({slot for _, slot in self._by_time[lo:hi]})
+        return candidates
+
+    def search(self, query: str, limit: int, filters: Optional[SearchFilters] = None) -> List[Tuple[str, float]]:
+        """Top documents for the query by BM25, as (id, score) best first."""
+        filters = filters or SearchFilters()
+        with self._lock:
+            if not self._live:
+                return []
+            candidates = self._candidates(filters)
+            if candidates is not None and not candidates:
+                return []
+            average_length = self._total_length / self._live
+            scores: Dict[int, float] = defaultdict(float)
+            for term in set(tokenize(query)):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (self._live - len(postings) + 0.5) / (len(postings) + 0.5))
+                for slot, tf in postings.items():
+                    if candidates is not None and slot not in candidates:
+                        continue
+                    norm = tf + K1 * (1 - B + B * self._lengths[slot] / average_length)
+                    scores[slot] += idf * tf * (K1 + 1) / norm
+            best = sorted(scores.items(), key=lambda item: -item[1])[:limit]
+            return [(self._ids[slot], score) for slot, score in best]
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = RRF_K) -> List[Tuple[str, float]]:
+    scores: Dict[str, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, record_id in enumerate(ranking):
+            scores[record_id] += 1 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: -item[1])
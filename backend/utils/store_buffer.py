@@ -0,0 +1,180 @@
+import asyncio
+import glob
+import json
+import os
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+
+class StoreBuffer:
+    """Write-behind buffer in front of the Chroma collection.
+
+    Records are journaled to disk and acknowledged right away, then embedded with one
+    encode() call and written with one upsert() per batch once max_batch records are
+    waiting or max_delay seconds have passed. Each process journals to its own
+    <journal_path>.<pid> file, so one worker truncating its journal can't drop another's records.
+    At startup the journals of processes that are gone (a crash before the flush) are claimed
+    and their records written again; upsert makes that replay idempotent."""
+
+    def __init__(
+        self,
+        collection,
+        embedder,
+        run_blocking: Callable[..., Awaitable[Any]],
+        max_batch: int = 64,
+        max_delay: float = 1.0,
+        journal_path: Optional[str] = None,
+        on_flush: Optional[Callable[[List[Dict[str, Any]]], None]] = None,
+    ):
+        self.collection = collection
+        self.embedder = embedder
+        self.run_blocking = run_blocking
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.journal_path = journal_path
+        # called with every batch once it is in the collection
+        self.on_flush = on_flush
+        self.stats = {"queued": 0, "flushed": 0, "batches": 0, "failed_flushes": 0, "replayed": 0}
+        self._pending: List[Dict[str, Any]] = []
+        self._journal = None
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self.journal_path:
+            own_path = f"{self.journal_path}.{os.getpid()}"
+            claimed = self._claim_journals(own_path)
+            for path in claimed:
+                self._pending.extend(self._read_journal(path))
+            self.stats["replayed"] = len(self._pending)
+            self._journal = open(own_path, "w")
+            for record in self._pending:
+                self._journal.write(json.dumps(record) + "\n")
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+            # the records are in our own journal now
+            for path in claimed:
+                os.remove(path)
+            if self._pending:
+                print(f"replaying {len(self._pending)} unflushed records from {len(claimed)} journals")
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Flush everything that is buffered; called on shutdown."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
+        if self._journal is not None:
+            self._journal.close()
+            if not self._pending:
+                # nothing left to replay, don't leave one empty journal per pid behind
+                os.remove(self._journal.name)
+            self._journal = None
+
+    def add(self, document: str, metadata: Dict[str, Any]) -> str:
+        record = {"id": str(uuid.uuid4()), "document": document, "metadata": metadata}
+        if self._journal is not None:
+            self._journal.write(json.dumps(record) + "\n")
+            self._journal.flush()
+        self._pending.append(record)
+        self.stats["queued"] += 1
+        if len(self._pending) >= self.max_batch:
+            self._wakeup.set()
+        return record["id"]
+
+    def pending(self) -> int:
+        return len(self._pending)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.max_delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        async with self._flush_lock:
+            while self._pending:
+                batch = self._pending[: self.max_batch]
+                documents = [record["document"] for record in batch]
+                try:
+                    await self.run_blocking(self._write, batch, documents)
+                except Exception as e:
+                    # records stay buffered and journaled, the next tick retries them
+                    print(f"Error flushing {len(batch)} stored analyses: {e}")
+                    self.stats["failed_flushes"] += 1
+                    return
+                del self._pending[: len(batch)]
+                if self.on_flush is not None:
+                    self.on_flush(batch)
+                self.stats["flushed"] += len(batch)
+                self.stats["batches"] += 1
+            self._truncate_journal()
+
+    def _write(self, batch: List[Dict[str, Any]], documents: List[str]):
+        # runs on the executor: the first touch of the collection or embedder may load it
+        embeddings = self.embedder.encode(documents)
+        self.collection.upsert(
+            ids=[record["id"] for record in batch],
+            embeddings=embeddings.tolist(),
+            documents=documents,
+            metadatas=[record["metadata"] for record in batch],
+        )
+
+    def _claim_journals(self, own_path: str) -> List[str]:
+        """Journals left behind by processes that are no longer running, renamed so only we replay them."""
+        claimed = []
+        candidates = glob.glob(f"{glob.escape(self.journal_path)}.*")
+        if os.path.exists(self.journal_path):
+            # single journal written before journals were per process
+            candidates.append(self.journal_path)
+        for path in candidates:
+            if path != own_path and _journal_owner_alive(path, self.journal_path):
+                continue
+            target = f"{own_path}.replaying-{len(claimed)}"
+            try:
+                # atomic, so workers starting together can't both claim the same journal
+                os.rename(path, target)
+            except FileNotFoundError:
+                continue
+            claimed.append(target)
+        return claimed
+
+    def _read_journal(self, path: str) -> List[Dict[str, Any]]:
+        records = []
+        with open(path) as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    # torn last line from a crash mid-write
+                    continue
+        return records
+
+    def _truncate_journal(self):
+        # only called with nothing pending, so every journaled record has been written
+        if self._journal is None:
+            return
+        self._journal.truncate(0)
+        self._journal.seek(0)
+
+
+def _journal_owner_alive(path: str, journal_path: str) -> bool:
+    # <journal_path>.<pid>, or <journal_path>.<pid>.replaying-<n> while <pid> is taking it over
+    owner = path[len(journal_path) + 1:].split(".", 1)[0]
+    if not owner.isdigit():
+        return False
+    try:
+        os.kill(int(owner), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
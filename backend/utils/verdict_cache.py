@@ -0,0 +1,150 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+from utils.packets import extract_payload, get_header_fields
+from utils.prefilter import decode_payload
+
+# the parts of ParallelState that make up a verdict, everything else comes from the request
+VERDICT_FIELDS = (
+    "xss_agent_msg",
+    "SQLi_agent_msg",
+    "payload_agent_msg",
+    "threat_detected",
+    "feedback",
+    "tier",
+    "prefilter_hits",
+    "xss_detected",
+    "xss_confidence",
+    "SQLi_detected",
+    "SQLi_confidence",
+    "payload_detected",
+    "payload_confidence",
+    "early_exit",
+)
+
+
+def prompt_fingerprint() -> str:
+    """Hash of the analysis prompts and models; cached verdicts are only valid for the same fingerprint."""
+    from utils.config import LLM_MODEL, REASONING_LLM_MODEL, model_name
+    from utils.payload_model import payload_model_fingerprint
+    from agents.analysis.xss_agent import TEMPLATE as XSS_TEMPLATE
+    from agents.analysis.SQLi_agent import TEMPLATE as SQLI_TEMPLATE
+    from agents.analysis.decision_node import TEMPLATE as DECISION_TEMPLATE
+
+    parts = [
+        model_name(LLM_MODEL),
+        model_name(REASONING_LLM_MODEL),
+        XSS_TEMPLATE,
+        SQLI_TEMPLATE,
+        DECISION_TEMPLATE,
+        payload_model_fingerprint(),
+    ]
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+
+def verdict_key(packet: Dict[str, Any]) -> str:
+    normalized = decode_payload(extract_payload(packet))
+    headers = json.dumps(get_header_fields(packet), sort_keys=True, default=str)
+    return hashlib.sha256(f"{headers}\0{normalized}".encode("utf-8", errors="replace")).hexdigest()
+
+
+def is_cacheable(verdict: Dict[str, Any]) -> bool:
+    # don't pin failed LLM calls in the cache
+    if not verdict.get("feedback"):
+        return False
+    return not any("Error invoking the chain" in str(verdict.get(field, "")) for field in VERDICT_FIELDS)
+
+
+class VerdictCache:
+    """Bounded LRU cache with a TTL for parallel workflow verdicts."""
+
+    def __init__(self, max_size: int = 10000, ttl: float = 3600, path: Optional[str] = None, fingerprint: str = ""):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.path = path
+        self.fingerprint = fingerprint
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        if path:
+            self.load()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.time():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(entry[1])
+
+    def put(self, key: str, verdict: Dict[str, Any]):
+        value = {field: verdict[field] for field in VERDICT_FIELDS if field in verdict}
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def save(self):
+        if not self.path:
+            return
+        now = time.time()
+        with self._lock:
+            entries = [[key, expires, value] for key, (expires, value) in self._entries.items() if expires > now]
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"fingerprint": self.fingerprint, "entries": entries}, f)
+        os.replace(tmp_path, self.path)
+        print(f"saved {len(entries)} cached verdicts to {self.path}")
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print("could not load the verdict cache:", e)
+            return
+        if data.get("fingerprint") != self.fingerprint:
+            print("prompts or models changed since the verdict cache was saved, discarding it")
+            return
+        now = time.time()
+        with self._lock:
+            for key, expires, value in data.get("entries", [])[-self.max_size:]:
+                if expires > now:
+                    self._entries[key] = (expires, value)
+        print(f"loaded {len(self._entries)} cached verdicts from {self.path}")
+
+
+def create_verdict_cache() -> VerdictCache:
+    return VerdictCache(
+        max_size=int(os.environ.get("VERDICT_CACHE_SIZE", 10000)),
+        ttl=float(os.environ.get("VERDICT_CACHE_TTL", 3600)),
+        path=os.environ.get("VERDICT_CACHE_PATH"),
+        fingerprint=prompt_fingerprint(),
+    )
@@ -2,35 +2,118 @@ from langgraph.graph import StateGraph, START, END
 from agents.criteria_agent import criteria_agent
 from agents.new_criteria_agent import new_criteria_agent
 from agents.qa_agent import qa_agent
-from agents.analysis.xss_agent import xss_agent
-from agents.analysis.SQLi_agent import SQLi_agent
+from agents.analysis.xss_agent import xss_agent, xss_agent_batch
+from agents.analysis.SQLi_agent import SQLi_agent, SQLi_agent_batch
 from agents.analysis.root_node import root_node
-from agents.analysis.decision_node import decision_node
-from utils.models import GraphState, ParallelState
+from agents.analysis.prefilter_node import prefilter_node, route_prefilter
+from agents.analysis.payload_agent import payload_agent, payload_agent_batch
+from agents.analysis.decision_node import decision_node, decision_node_batch
+from agents.analysis.early_exit_node import early_exit_node, route_early_exit
+from utils.models import GraphState, PacketRecord, ParallelState
+from utils.packets import is_record
+from utils.metrics import traced_node
+import asyncio
+from typing import Any, Dict, List
+
+# upper bound on concurrent LLM requests per agent while processing a batch
+BATCH_MAX_CONCURRENCY = 16
 
 def create_workflow():
   builder = StateGraph(GraphState)
-  builder.add_node("criteria_agent", criteria_agent)
-  builder.add_node("new_criteria_agent", new_criteria_agent)
-  builder.add_node("qa_agent", qa_agent)
+  builder.add_node("criteria_agent", traced_node("criteria", criteria_agent))
+  builder.add_node("new_criteria_agent", traced_node("criteria", new_criteria_agent))
+  builder.add_node("qa_agent", traced_node("criteria", qa_agent))
   builder.set_entry_point("criteria_agent")
   return builder.compile()
 
+def parallel_start_state(packet: Dict[str, Any]) -> ParallelState:
+  """Raises ValueError for a record shaped packet that doesn't match PacketRecord."""
+  if is_record(packet):
+    # only checked, the dict is kept as sent so fields the schema doesn't list (e.g. "flow") survive
+    PacketRecord.model_validate(packet)
+  return ParallelState(
+    packet=packet,
+    xss_agent_msg="",
+    SQLi_agent_msg="",
+    payload_agent_msg="",
+    threat_detected=False,
+    feedback="",
+  )
+
 def create_parallel_workflow():
   builder = StateGraph(ParallelState)
-  builder.add_node(root_node)
-  builder.add_node(xss_agent)
-  builder.add_node(SQLi_agent)
-  builder.add_node(decision_node)
+  builder.add_node(traced_node("analysis", root_node))
+  builder.add_node(traced_node("analysis", payload_agent))
+  builder.add_node(traced_node("analysis", prefilter_node))
+  builder.add_node(traced_node("analysis", xss_agent))
+  builder.add_node(traced_node("analysis", SQLi_agent))
+  builder.add_node(traced_node("analysis", early_exit_node))
+  builder.add_node(traced_node("analysis", decision_node))
   # the rest goes here
 
   builder.add_edge(START, "root_node")
-  builder.add_edge("root_node", "xss_agent")
-  builder.add_edge("root_node", "SQLi_agent")
+  # the payload classifier is local and sub-millisecond, so it runs on every packet ahead of the pre-filter
+  builder.add_edge("root_node", "payload_agent")
+  builder.add_edge("payload_agent", "prefilter_node")
+  # clean packets end here, suspicious ones fan out to the agents whose signatures matched
+  builder.add_conditional_edges("prefilter_node", route_prefilter, ["xss_agent", "SQLi_agent", "decision_node", END])
   # the rest goes here
 
-  builder.add_edge("xss_agent", "decision_node")
-  builder.add_edge("SQLi_agent", "decision_node")
+  builder.add_edge("xss_agent", "early_exit_node")
+  builder.add_edge("SQLi_agent", "early_exit_node")
+  # confident negatives end here, everything else goes on to the reasoning model
+  builder.add_conditional_edges("early_exit_node", route_early_exit, ["decision_node", END])
   # the rest goes here
   builder.add_edge("decision_node", END)
-  return builder.compile()
\ No newline at end of file
+  return builder.compile()
+
+traced_root = traced_node("analysis_batch", root_node)
+traced_prefilter = traced_node("analysis_batch", prefilter_node)
+traced_payload_batch = traced_node("analysis_batch", payload_agent_batch)
+traced_xss_batch = traced_node("analysis_batch", xss_agent_batch)
+traced_SQLi_batch = traced_node("analysis_batch", SQLi_agent_batch)
+traced_decision_batch = traced_node("analysis_batch", decision_node_batch)
+traced_early_exit = traced_node("analysis_batch", early_exit_node)
+
+def _apply(states: List[ParallelState], updates: List[dict]) -> List[ParallelState]:
+  return [state.model_copy(update=update) for state, update in zip(states, updates)]
+
+async def run_parallel_batch(states: Dict[str, ParallelState]) -> Dict[str, dict]:
+  """Batch counterpart of the parallel workflow: every node runs once over all packets in the batch."""
+  results = {}
+  rooted = {}
+  for packet_id, state in states.items():
+    try:
+      traced_root(state)
+      rooted[packet_id] = state
+    except Exception as e:
+      print("ERROR in root_node for packet", packet_id, e)
+      results[packet_id] = {"error": str(e)}
+
+  ids = list(rooted)
+  scored = _apply([rooted[i] for i in ids], traced_payload_batch([rooted[i] for i in ids]))
+  pending = {i: state.model_copy(update=traced_prefilter(state)) for i, state in zip(ids, scored)}
+  xss_ids = [i for i in ids if pending[i].tier == "llm" and pending[i].prefilter_hits.get("xss")]
+  sqli_ids = [i for i in ids if pending[i].tier == "llm" and pending[i].prefilter_hits.get("sqli")]
+
+  # one chain.abatch per agent; the two agents run side by side like in the graph
+  xss_updates, sqli_updates = await asyncio.gather(
+    traced_xss_batch([pending[i] for i in xss_ids], BATCH_MAX_CONCURRENCY),
+    traced_SQLi_batch([pending[i] for i in sqli_ids], BATCH_MAX_CONCURRENCY),
+  )
+  for i, state in zip(xss_ids, _apply([pending[i] for i in xss_ids], xss_updates)):
+    pending[i] = state
+  for i, state in zip(sqli_ids, _apply([pending[i] for i in sqli_ids], sqli_updates)):
+    pending[i] = state
+
+  for i in [i for i in ids if pending[i].tier == "llm"]:
+    pending[i] = pending[i].model_copy(update=traced_early_exit(pending[i]))
+
+  llm_ids = [i for i in ids if pending[i].tier == "llm" and not pending[i].early_exit]
+  decisions = await traced_decision_batch([pending[i] for i in llm_ids], BATCH_MAX_CONCURRENCY) if llm_ids else []
+  for i, state in zip(llm_ids, _apply([pending[i] for i in llm_ids], decisions)):
+    pending[i] = state
+
+  for packet_id, state in pending.items():
+    results[packet_id] = state.model_dump()
+  return results
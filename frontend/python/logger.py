@@ -1,8 +1,68 @@
 import sys
+import json
+import time
+import socket
+import struct
+import argparse
+import threading
+from collections import deque
+from multiprocessing import Pool
 from scapy.all import sniff, get_if_addr, conf
+from scapy.arch.common import compile_filter
+from scapy.data import DLT_EN10MB
+from scapy.error import Scapy_Exception
+from scapy.layers.inet import IP, TCP, UDP, ICMP
+from scapy.layers.inet6 import IPv6
 
+# bytes of application payload kept in structured records; payload.length is always the full size
+PAYLOAD_SLICE = 2048
 
-def show_packet(packet):
+# linux PACKET_STATISTICS getsockopt, see packet(7)
+SOL_PACKET = 263
+PACKET_STATISTICS = 6
+STATS_INTERVAL = 10
+
+TRANSPORT_LAYERS = ((TCP, "TCP"), (UDP, "UDP"), (ICMP, "ICMP"))
+
+
+def packet_record(packet, payload_slice=PAYLOAD_SLICE):
+    """Compact record of a packet using the criteria track_fields names (source_ip, transport_layer.*, payload.length, ...)."""
+    record = {
+        "timestamp": float(packet.time),
+        "source_ip": None,
+        "destination_ip": None,
+        "ttl": None,
+        "transport_layer": None,
+        "payload": None,
+    }
+
+    if IP in packet:
+        ip = packet[IP]
+        record["source_ip"], record["destination_ip"], record["ttl"] = ip.src, ip.dst, ip.ttl
+    elif IPv6 in packet:
+        ip = packet[IPv6]
+        record["source_ip"], record["destination_ip"], record["ttl"] = ip.src, ip.dst, ip.hlim
+
+    payload = b""
+    for layer, name in TRANSPORT_LAYERS:
+        if layer in packet:
+            segment = packet[layer]
+            transport = {"protocol": name}
+            if name == "ICMP":
+                transport.update(type=segment.type, code=segment.code)
+            else:
+                transport.update(source_port=segment.sport, destination_port=segment.dport)
+            if name == "TCP":
+                transport.update(flags=str(segment.flags), seq=segment.seq, ack=segment.ack)
+            record["transport_layer"] = transport
+            payload = bytes(segment.payload)
+            break
+
+    record["payload"] = {"length": len(payload), "data": payload[:payload_slice]}
+    return record
+
+
+def write_text(packet):
     packet_data = packet.show(dump=True)  # Convert packet to a string representation
 
     # Assuming you're using a method to send this to Electron via ipcRenderer
@@ -10,37 +70,221 @@ def show_packet(packet):
     sys.stdout.flush()
 
 
-# Get your local IP address (assumes single interface, adjust if needed)
-default_iface = conf.iface  # Auto-detect active interface
-my_ip = get_if_addr(default_iface)  # Get your machine's IP on that interface
-
-# Construct filter string to capture only incoming traffic
-print(my_ip)
-# filter_str = (
-#     "(tcp) and ("
-#     "dst port 3306 or dst port 5432 or dst port 6379 or dst port 27017 or dst port 8080 or dst port 443"
-#     ") and ("
-#     f"dst host {my_ip}"  # Only capture packets where your machine is the destination
-#     ")"
-# )
-filter_str = sys.argv[1]
-# filter_str += f" and (dst host {my_ip})"
-print(filter_str)
-# count = 0
-#
-#
-# # Callback function to increment and display count
-# def count_packets(pkt):
-#     global count
-#     count += 1
-#     print(
-#         f"Packets captured: {count}", end="\r", flush=True
-#     )  # Overwrites the same line
-#
-
-# Start sniffing
-try:
-    sniff(filter=filter_str, prn=show_packet, store=0)
-except Exception as e:
-    print(filter_str)
-    print(e)
+def write_record(data):
+    sys.stdout.buffer.write(data)
+    sys.stdout.buffer.flush()
+
+
+def make_writer(output_format):
+    if output_format == "text":
+        return write_text
+    return lambda packet: write_record(serialize(packet, output_format))
+
+
+def serialize(packet, output_format, capture_seq=None):
+    """Bytes to write for one packet. capture_seq is set by the pipelined capture mode."""
+    if output_format == "text":
+        return (packet.show(dump=True) + "\n").encode()
+    record = packet_record(packet)
+    if capture_seq is not None:
+        record["capture_seq"] = capture_seq
+    if output_format == "json":
+        # one compact JSON object per line, payload bytes are mapped 1:1 onto latin-1 characters
+        record["payload"]["data"] = record["payload"]["data"].decode("latin-1")
+        return (json.dumps(record, separators=(",", ":")) + "\n").encode()
+    if output_format == "msgpack":
+        import msgpack
+
+        # 4 byte big-endian length prefix followed by the msgpack encoded record
+        body = msgpack.packb(record, use_bin_type=True)
+        return struct.pack(">I", len(body)) + body
+    raise ValueError(f"unknown output format: {output_format}")
+
+
+def dissect_batch(batch, output_format):
+    # runs in the worker processes: raw frames in, serialized output out
+    out = []
+    for capture_seq, timestamp, cls, raw in batch:
+        try:
+            packet = cls(raw)
+            packet.time = timestamp
+            out.append(serialize(packet, output_format, capture_seq))
+        except Exception as e:
+            print(f"failed to dissect frame {capture_seq}: {e}", file=sys.stderr)
+    return b"".join(out)
+
+
+class RingBuffer:
+    """Bounded buffer of raw frames between the capture thread and the dissection pool.
+    When it is full new frames are dropped and counted instead of blocking the capture thread."""
+
+    def __init__(self, size):
+        self.size = size
+        self.frames = deque()
+        self.dropped = 0
+        self.closed = False
+        self.cond = threading.Condition()
+
+    def put(self, frame):
+        with self.cond:
+            if len(self.frames) >= self.size:
+                self.dropped += 1
+                return
+            self.frames.append(frame)
+            self.cond.notify()
+
+    def take(self, max_items, timeout):
+        with self.cond:
+            if not self.frames and not self.closed:
+                self.cond.wait(timeout)
+            batch = []
+            while self.frames and len(batch) < max_items:
+                batch.append(self.frames.popleft())
+            return batch
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+
+def kernel_drops(sock):
+    """Packets dropped by the kernel before reaching userland, or None if the platform can't tell us."""
+    ins = getattr(sock, "ins", None)
+    try:
+        if isinstance(ins, socket.socket):
+            # linux resets these counters on every read, so the caller accumulates them
+            _, drops = struct.unpack("II", ins.getsockopt(SOL_PACKET, PACKET_STATISTICS, 8))
+            return drops
+        if hasattr(ins, "stats"):
+            # libpcap reports a running total
+            return ins.stats()[1]
+    except (OSError, struct.error, TypeError, IndexError):
+        pass
+    return None
+
+
+def capture_loop(sock, ring, stats, stop):
+    capture_seq = 0
+    while not stop.is_set():
+        try:
+            cls, raw, timestamp = sock.recv_raw()
+        except Exception as e:
+            print(f"capture error: {e}", file=sys.stderr)
+            break
+        if raw is None:
+            continue
+        ring.put((capture_seq, timestamp or time.time(), cls, raw))
+        capture_seq += 1
+        stats["captured"] = capture_seq
+    ring.close()
+
+
+def report_stats(stats, ring, sock):
+    drops = kernel_drops(sock)
+    if drops is not None:
+        if isinstance(getattr(sock, "ins", None), socket.socket):
+            stats["kernel_dropped"] += drops
+        else:
+            stats["kernel_dropped"] = drops
+    print(
+        f"captured={stats['captured']} written={stats['written']} "
+        f"kernel_dropped={stats['kernel_dropped'] if drops is not None else 'n/a'} "
+        f"ring_dropped={ring.dropped} ring_depth={len(ring.frames)}",
+        file=sys.stderr,
+        flush=True,
+    )
+
+
+def run_pipeline(filter_str, output_format, workers, ring_size, batch_size):
+    """Raw capture thread -> ring buffer -> pool of dissection processes -> ordered stdout."""
+    sock = conf.L2listen(iface=conf.iface, filter=filter_str)
+    ring = RingBuffer(ring_size)
+    stats = {"captured": 0, "written": 0, "kernel_dropped": 0}
+    stop = threading.Event()
+    capture = threading.Thread(target=capture_loop, args=(sock, ring, stats, stop), daemon=True)
+    capture.start()
+
+    # results are written oldest batch first, so output stays in capture order
+    in_flight = deque()
+    last_report = time.monotonic()
+    with Pool(workers) as pool:
+        try:
+            while not (ring.closed and not ring.frames and not in_flight):
+                batch = ring.take(batch_size, timeout=0.05)
+                if batch:
+                    in_flight.append((len(batch), pool.apply_async(dissect_batch, (batch, output_format))))
+                while in_flight and (in_flight[0][1].ready() or len(in_flight) > workers * 2):
+                    count, result = in_flight.popleft()
+                    sys.stdout.buffer.write(result.get())
+                    sys.stdout.buffer.flush()
+                    stats["written"] += count
+                if time.monotonic() - last_report >= STATS_INTERVAL:
+                    report_stats(stats, ring, sock)
+                    last_report = time.monotonic()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            stop.set()
+            report_stats(stats, ring, sock)
+            sock.close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Sniff packets matching a BPF filter and write them to stdout")
+    parser.add_argument("filter", help="BPF filter string")
+    parser.add_argument(
+        "--format",
+        choices=["text", "json", "msgpack"],
+        default="text",
+        help="text is scapy's show() dump, json is one record per line, msgpack is length-prefixed records",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=0,
+        help="dissect packets in this many worker processes instead of the capture thread (0 disables the pipeline)",
+    )
+    parser.add_argument("--ring-size", type=int, default=65536, help="raw frames buffered between capture and dissection")
+    parser.add_argument("--batch-size", type=int, default=256, help="frames handed to a worker at a time")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    # Get your local IP address (assumes single interface, adjust if needed)
+    default_iface = conf.iface  # Auto-detect active interface
+    my_ip = get_if_addr(default_iface)  # Get your machine's IP on that interface
+
+    filter_str = args.filter
+    # filter_str += f" and (dst host {my_ip})"
+
+    # structured output must not be interleaved with diagnostics, so those go to stderr
+    diagnostics = sys.stdout if args.format == "text" else sys.stderr
+    print(my_ip, file=diagnostics)
+    print(filter_str, file=diagnostics)
+
+    # reject a bad filter up front instead of failing once capture has started
+    try:
+        compile_filter(filter_str, linktype=DLT_EN10MB)
+    except Scapy_Exception as e:
+        print(f"invalid filter: {e}", file=sys.stderr)
+        sys.exit(2)
+    except ImportError as e:
+        # scapy raises this when libpcap is missing; capture reports its own error if it can't filter either
+        print(f"could not validate the filter, libpcap is not available: {e}", file=sys.stderr)
+
+    # Start sniffing
+    try:
+        if args.workers > 0:
+            run_pipeline(filter_str, args.format, args.workers, args.ring_size, args.batch_size)
+        else:
+            sniff(filter=filter_str, prn=make_writer(args.format), store=0)
+    except Exception as e:
+        print(filter_str, file=diagnostics)
+        print(e, file=diagnostics)
+
+
+if __name__ == "__main__":
+    main()
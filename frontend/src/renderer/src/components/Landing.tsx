@@ -38,7 +38,11 @@ export default function Landing() {
       console.log(data);
       const selected = data["response"]["selected_criteria"];
       const crit = data["response"]["existing_criteria"].filter(x => x.title == selected)[0];
-      const scapy_filter = crit["scapy_str"];
+      // the backend compiles the filter, so a bad one is caught here instead of when the sniffer starts
+      if (data["filter"] && !data["filter"]["valid"]) {
+        throw new Error(`invalid capture filter: ${data["filter"]["error"]}`)
+      }
+      const scapy_filter = data["filter"] ? data["filter"]["expression"] : crit["scapy_str"];
       window.electron.ipcRenderer.send('run-with-privileges', scapy_filter);
 
       setUseCase(inputValue)
@@ -33,12 +33,38 @@ function formatResponse(text: string): string {
     .join("\n\n")
 }
 
+// Reads a text/event-stream response body and calls onEvent for every event
+async function readEvents(response: Response, onEvent: (event: string, data: any) => void) {
+  const reader = response.body!.getReader()
+  const decoder = new TextDecoder()
+  let buffer = ""
+  while (true) {
+    const { done, value } = await reader.read()
+    if (done) break
+    buffer += decoder.decode(value, { stream: true })
+    let boundary = buffer.indexOf("\n\n")
+    while (boundary !== -1) {
+      const block = buffer.slice(0, boundary)
+      buffer = buffer.slice(boundary + 2)
+      let event = "message"
+      let data = ""
+      for (const line of block.split("\n")) {
+        if (line.startsWith("event: ")) event = line.slice(7)
+        else if (line.startsWith("data: ")) data += line.slice(6)
+      }
+      if (data) onEvent(event, JSON.parse(data))
+      boundary = buffer.indexOf("\n\n")
+    }
+  }
+}
+
 export default function SearchPanel() {
   const [query, setQuery] = useState("")
   const [result, setResult] = useState<string | null>(null)
   const [isLoading, setIsLoading] = useState(false)
   const [error, setError] = useState<string | null>(null)
   const [diagram, setDiagram] = useState<string | null>(null)
+  const [diagramSvg, setDiagramSvg] = useState<string | null>(null)
   const [isGeneratingDiagram, setIsGeneratingDiagram] = useState(false)
   
   // New voice-related states
@@ -123,8 +149,21 @@ export default function SearchPanel() {
   // Existing generateDiagram function
   async function generateDiagram(text: string) {
     setIsGeneratingDiagram(true)
+    setDiagram(null)
+    setDiagramSvg(null)
+    // renders run one after another so a slow partial render can't replace a later one
+    let rendering = Promise.resolve()
+    let renderCount = 0
+    const renderDiagram = (source: string) => {
+      rendering = rendering.then(async () => {
+        // partial diagrams are drawn as soon as what has arrived so far parses
+        if (!(await mermaid.parse(source, { suppressErrors: true }))) return
+        const { svg } = await mermaid.render(`solution-diagram-${renderCount++}`, source)
+        setDiagramSvg(svg)
+      }).catch((err) => console.error("Error rendering diagram:", err))
+    }
     try {
-      const response = await fetch("http://127.0.0.1:8000/generate-diagram", {
+      const response = await fetch("http://127.0.0.1:8000/generate-diagram/stream", {
         method: "POST",
         headers: {
           "Content-Type": "application/json",
@@ -132,15 +171,24 @@ export default function SearchPanel() {
         credentials: "include",
         body: JSON.stringify({ solution: text }),
       })
-      if (!response.ok) {
+      if (!response.ok || !response.body) {
         throw new Error("Failed to generate diagram")
       }
-      const data = await response.json()
-      setDiagram(data.diagram)
-      
-      setTimeout(() => {
-        mermaid.contentLoaded()
-      }, 100)
+      // show the diagram line by line as the model writes it instead of waiting for the whole completion
+      const lines: string[] = []
+      await readEvents(response, (event, data) => {
+        if (event === "line") {
+          lines.push(data.line)
+          setDiagram(lines.join("\n"))
+          renderDiagram(lines.join("\n"))
+        } else if (event === "diagram") {
+          setDiagram(data.diagram)
+          renderDiagram(data.diagram)
+        } else if (event === "error") {
+          throw new Error(data.error)
+        }
+      })
+      await rendering
     } catch (err) {
       console.error("Error generating diagram:", err)
     } finally {
@@ -154,8 +202,9 @@ export default function SearchPanel() {
     setIsLoading(true)
     setError(null)
     setDiagram(null)
+    setDiagramSvg(null)
     try {
-      const response = await fetch("http://127.0.0.1:8000/search", {
+      const response = await fetch("http://127.0.0.1:8000/search/stream", {
         method: "POST",
         headers: {
           "Content-Type": "application/json",
@@ -163,12 +212,21 @@ export default function SearchPanel() {
         credentials: "include",
         body: JSON.stringify({ query: query }),
       })
-      if (!response.ok) {
+      if (!response.ok || !response.body) {
         throw new Error("Failed to fetch results")
       }
-      const data = await response.json()
-      const formattedText = formatResponse(data.response)
-      setResult(formattedText)
+      // show the answer as it is written instead of waiting for the whole completion
+      let text = ""
+      setResult(null)
+      await readEvents(response, (event, data) => {
+        if (event === "token") {
+          text += data.text
+          setResult(formatResponse(text))
+          setIsLoading(false)
+        } else if (event === "error") {
+          throw new Error(data.error)
+        }
+      })
     } catch (err) {
       setError(err instanceof Error ? err.message : "An error occurred")
       setResult(null)
@@ -258,9 +316,14 @@ export default function SearchPanel() {
               {diagram && (
                 <div className="w-full bg-gradient-to-b from-zinc-800/50 to-zinc-900 rounded-lg p-6 mt-4 border border-indigo-900/20 shadow-lg">
                   <div className="min-h-[600px] flex items-center justify-center">
-                    <pre className="mermaid w-full">
-                      {diagram}
-                    </pre>
+                    {diagramSvg ? (
+                      <div className="w-full" dangerouslySetInnerHTML={{ __html: diagramSvg }} />
+                    ) : (
+                      // the source so far, until enough of it has arrived to draw
+                      <pre className="w-full text-indigo-200/70 text-sm whitespace-pre-wrap">
+                        {diagram}
+                      </pre>
+                    )}
                   </div>
                 </div>
               )}